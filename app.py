@@ -1,15 +1,59 @@
+if __name__ == '__main__':
+    # `python app.py` (dev): run this file once, as the `app` module that
+    # migrations.py, gunicorn and the CLI import. Going on as __main__ would
+    # build a second app and db and register every event listener twice.
+    import app
+    app.run_migrations()
+    app.app.run(debug=True)
+    raise SystemExit
+
 
 import os
 import sqlite3
-from flask import Flask, render_template, redirect, url_for, request, flash, jsonify
+from flask import Flask, render_template, redirect, url_for, request, flash, jsonify, Response, g, has_request_context, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import text
+from sqlalchemy import text, func, and_, or_, case, event, tuple_, literal
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session, selectinload
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm.exc import StaleDataError
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
 from flask_login import LoginManager, UserMixin, login_user, logout_user, current_user, login_required
 from flask_admin import Admin, AdminIndexView, expose
 from flask_admin.contrib.sqla import ModelView
-from werkzeug.security import generate_password_hash, check_password_hash
+from flask_admin.contrib.sqla.filters import FilterEqual, FilterGreater, FilterSmaller
+from werkzeug.security import generate_password_hash, check_password_hash, DEFAULT_PBKDF2_ITERATIONS
 from wtforms.fields import PasswordField
 import json
+import math
+import time
+import threading
+import heapq
+import itertools
+import tempfile
+import gzip
+import zlib
+import hashlib
+import hmac
+import mimetypes
+from werkzeug.security import safe_join
+import csv
+import click
+import io
+try:
+    import brotli
+except ImportError:  # Optional: without it we only serve gzip
+    brotli = None
+try:
+    import xlsxwriter
+except ImportError:  # Optional: without it /api/export only offers CSV
+    xlsxwriter = None
+from broker import EventBroker
+import autoassign
+import notifier
+from metrics import Metrics, LATENCY_BUCKETS
+from search_index import SearchIndex
 
 # --- 1. CONFIGURACIÓN INICIAL DE LA APLICACIÓN ---
 basedir = os.path.abspath(os.path.dirname(__file__))
@@ -27,7 +71,63 @@ if database_url and database_url.startswith("postgres://"):
 app.config['SQLALCHEMY_DATABASE_URI'] = database_url or 'sqlite:///' + os.path.join(basedir, 'database.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
+# Engine profile per backend. Every value can be overridden from the environment.
+def env_int(name, default):
+    return int(os.environ.get(name) or default)
+
+if app.config['SQLALCHEMY_DATABASE_URI'].startswith('postgresql'):
+    # Per worker process. gthread runs 16 threads per worker, so size the pool to
+    # cover them: workers x (DB_POOL_SIZE + DB_MAX_OVERFLOW) must fit max_connections.
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+        'pool_size': env_int('DB_POOL_SIZE', 10),
+        'max_overflow': env_int('DB_MAX_OVERFLOW', 10),
+        'pool_timeout': env_int('DB_POOL_TIMEOUT', 30),
+        'pool_recycle': env_int('DB_POOL_RECYCLE', 1800),  # below typical proxy/LB idle cut-offs
+        'pool_pre_ping': True,
+        'connect_args': {'options': f"-c statement_timeout={env_int('DB_STATEMENT_TIMEOUT_MS', 30000)}"},
+    }
+elif app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite'):
+    SQLITE_PRAGMAS = {
+        # WAL: readers no longer block the writer (nor the writer the readers)
+        'journal_mode': os.environ.get('SQLITE_JOURNAL_MODE') or 'WAL',
+        # NORMAL is durable across app crashes in WAL mode, only a power loss can drop the last commits
+        'synchronous': os.environ.get('SQLITE_SYNCHRONOUS') or 'NORMAL',
+        # Wait for the write lock instead of failing with "database is locked"
+        'busy_timeout': env_int('SQLITE_BUSY_TIMEOUT_MS', 15000),
+        'mmap_size': env_int('SQLITE_MMAP_SIZE', 256 * 1024 * 1024),
+    }
+
+    # POST endpoints that (almost) only read: login must not hold the write lock
+    # while hashing; it only writes once per user to upgrade an old hash.
+    # auto_assign only proposes (its board snapshot write is best effort)
+    SQLITE_READ_ONLY_POSTS = {'login', 'auto_assign'}
+
+    @event.listens_for(Engine, 'connect')
+    def sqlite_connect(dbapi_connection, connection_record):
+        if not isinstance(dbapi_connection, sqlite3.Connection):
+            return
+        # Let SQLAlchemy emit BEGIN itself (see sqlite_begin)
+        dbapi_connection.isolation_level = None
+        for name, value in SQLITE_PRAGMAS.items():
+            dbapi_connection.execute(f'PRAGMA {name}={value}')
+
+    @event.listens_for(Engine, 'begin')
+    def sqlite_begin(conn):
+        if conn.dialect.name != 'sqlite':
+            return
+        # A write request takes the write lock up front. With a plain deferred
+        # BEGIN its first SELECT pins a snapshot, and if another worker commits
+        # before our first UPDATE, SQLite fails the upgrade at once with
+        # "database is locked" (busy_timeout cannot help there).
+        # Jobs outside a request (archive) ask for it with the sqlite_write execution option.
+        write = conn.get_execution_options().get('sqlite_write') or (
+            has_request_context() and request.method not in ('GET', 'HEAD', 'OPTIONS')
+            and request.endpoint not in SQLITE_READ_ONLY_POSTS)
+        conn.exec_driver_sql('BEGIN IMMEDIATE' if write else 'BEGIN')
+
 db = SQLAlchemy(app)
+# Spool file shared by all workers on this host for the SSE channel (/api/stream)
+broker = EventBroker(os.environ.get('EVENTS_SPOOL') or os.path.join(tempfile.gettempdir(), 'gestor-trafico-events.log'))
 login_manager = LoginManager(app)
 login_manager.login_view = 'login' 
 
@@ -39,14 +139,20 @@ class User(UserMixin, db.Model):
     password_hash = db.Column(db.String(128))
     is_admin = db.Column(db.Boolean, default=False)
 
+    # Usamos pbkdf2:sha256 para asegurar que el hash quepa en VARCHAR(128)
+    # scrypt (default en nuevas versiones) genera hashes más largos.
+    PASSWORD_METHOD = f'pbkdf2:sha256:{DEFAULT_PBKDF2_ITERATIONS}'
+
     def set_password(self, password):
-        # Usamos pbkdf2:sha256 para asegurar que el hash quepa en VARCHAR(128)
-        # scrypt (default en nuevas versiones) genera hashes más largos.
-        self.password_hash = generate_password_hash(password, method='pbkdf2:sha256')
+        self.password_hash = generate_password_hash(password, method=self.PASSWORD_METHOD)
 
     def check_password(self, password):
         return check_password_hash(self.password_hash, password)
 
+    def password_needs_rehash(self):
+        """True if the stored hash uses another method or iteration count than PASSWORD_METHOD."""
+        return (self.password_hash or '').split('$', 1)[0] != self.PASSWORD_METHOD
+
     def __repr__(self):
         return f'<User {self.username}>'
 
@@ -69,29 +175,82 @@ class Truck(db.Model):
     driver_dni = db.Column(db.String(20), default='')
     driver_alias = db.Column(db.String(50), default='')
     manual_zones_str = db.Column(db.String(200), default='')  # NEW: Manual zones selected by user
-    history_str = db.Column(db.Text, default='[]') # NEW: JSON string for history [{date, trailer, driver_name...}]
+    history_str = db.Column(db.Text, default='[]') # LEGACY: JSON history, moved to truck_history on startup
+    history_entries = db.relationship('TruckHistory', order_by='TruckHistory.date', cascade='all, delete-orphan')
+    # Optimistic concurrency: every UPDATE is "... WHERE id = ? AND version = ?"
+    version = db.Column(db.Integer, nullable=False, default=1)
+    __mapper_args__ = {'version_id_col': version}
 
     def to_dict(self):
-        return {
-            'id': self.id,
-            'plate': self.plate,
-            'location': self.location,
-            'locationLastUpdatedDate': self.location_last_updated,
-            'creationDate': self.creation_date,
-            'deletionDate': self.deletion_date,
-            'isLocationManual': self.is_location_manual,
-            'isZoneManual': self.is_zone_manual,
-            'zones': self.zones_str.split(',') if self.zones_str else [],
-            'zonesLastUpdatedDate': self.zones_last_updated,
-            'manualLocation': self.manual_location,
-            'manualZones': self.manual_zones_str.split(',') if self.manual_zones_str else [],
-            'trailer': self.trailer,
-            'driverName': self.driver_name,
-            'driverPhone': self.driver_phone,
-            'driverDni': self.driver_dni,
-            'driverAlias': self.driver_alias,
-            'history': json.loads(self.history_str) if self.history_str else []
-        }
+        return truck_dict(self, [history_dict(h) for h in self.history_entries])
+
+class TruckHistory(db.Model):
+    # Effective-dated truck data. Driver/trailer apply from `date` on;
+    # manual location/zones only apply on `date` itself.
+    id = db.Column(db.Integer, primary_key=True)
+    truck_plate = db.Column(db.String(20), db.ForeignKey('truck.plate'), nullable=False)
+    date = db.Column(db.String(20), nullable=False)
+    # Nullable on purpose: entries migrated from the old JSON may lack fields,
+    # and a missing field must not override the truck's own value.
+    trailer = db.Column(db.String(50), nullable=True)
+    driver_name = db.Column(db.String(100), nullable=True)
+    driver_phone = db.Column(db.String(20), nullable=True)
+    driver_dni = db.Column(db.String(20), nullable=True)
+    driver_alias = db.Column(db.String(50), nullable=True)
+    manual_location = db.Column(db.String(100), nullable=True)
+    manual_zones_str = db.Column(db.String(200), nullable=True)
+    __table_args__ = (db.UniqueConstraint('truck_plate', 'date', name='unique_history_plate_date'),)
+
+    FIELDS = (('trailer', 'trailer'), ('driver_name', 'driverName'), ('driver_phone', 'driverPhone'),
+              ('driver_dni', 'driverDni'), ('driver_alias', 'driverAlias'), ('manual_location', 'manualLocation'))
+
+    def to_dict(self):
+        return history_dict(self)
+
+def migrate_truck_history_json():
+    """Moves the legacy Truck.history_str JSON blobs into truck_history rows."""
+    migrated = 0
+    for t in Truck.query.filter(Truck.history_str != None, Truck.history_str != '', Truck.history_str != '[]'):
+        try:
+            entries = json.loads(t.history_str)
+        except ValueError:
+            print(f"Historial ilegible para {t.plate}, se descarta: {t.history_str[:80]}")
+            entries = []
+        by_date = {e['date']: e for e in entries if isinstance(e, dict) and e.get('date')}
+        existing = {h.date for h in t.history_entries}
+        for date, e in by_date.items():
+            if date in existing:
+                continue
+            h = TruckHistory(truck_plate=t.plate, date=date)
+            for column, key in TruckHistory.FIELDS:
+                setattr(h, column, e.get(key))
+            if e.get('manualZones') is not None:
+                h.manual_zones_str = ','.join(e['manualZones'])
+            t.history_entries.append(h)
+        t.history_str = '[]'
+        migrated += 1
+    db.session.commit()
+    return migrated
+
+def truck_as_of(truck, date):
+    """Server-side twin of getTruckDataForDate: the truck dict resolved for one date."""
+    effective = TruckHistory.query.filter(TruckHistory.truck_plate == truck.plate, TruckHistory.date <= date) \
+        .order_by(TruckHistory.date.desc()).first()
+    return resolve_truck(truck.to_dict(), effective.to_dict() if effective else None, date)
+
+def resolve_truck(resolved, entry, date):
+    """Applies history entry `entry` (the last one on or before date, or None) to truck dict `resolved`."""
+    if entry:
+        for key in ('trailer', 'driverName', 'driverPhone', 'driverDni', 'driverAlias'):
+            if key in entry:
+                resolved[key] = entry[key]
+    if entry and entry['date'] == date:
+        resolved['manualLocation'] = entry.get('manualLocation', resolved['manualLocation'])
+        resolved['manualZones'] = entry.get('manualZones', resolved['manualZones'])
+    elif resolved['history']:
+        resolved['manualLocation'] = ''
+        resolved['manualZones'] = []
+    return resolved
 
 class Driver(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -120,6 +279,11 @@ class Trailer(db.Model):
             'plate': self.plate,
             'type': self.type
         }
+
+# Trips whose alert (notify_time) has not been sent. Queries must repeat this
+# exact text for SQLite to use the partial index below (see notifier.py).
+NOTIFY_PENDING = "is_notified = false AND notify_time <> '' AND assigned_truck_plate IS NOT NULL"
+
 class Trip(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     type = db.Column(db.String(20), nullable=False) # 'departure', 'return'
@@ -144,31 +308,31 @@ class Trip(db.Model):
     
     notify_time = db.Column(db.String(20), default="")
     is_notified = db.Column(db.Boolean, default=False)
+    # Optimistic concurrency (see Truck.version)
+    version = db.Column(db.Integer, nullable=False, default=1)
+    __mapper_args__ = {'version_id_col': version}
 
     assigned_truck = db.relationship('Truck', backref=db.backref('trips', lazy=True))
 
+    # Hot filters: unassign-day and the window read (load/unload dates), truck
+    # deletion and the position engine (plate, then unload day). Applied to
+    # existing databases by migration 8; the admin client filter by migration 11,
+    # the /api/search columns by migration 14, the pending alerts by migration 15.
+    __table_args__ = (
+        db.Index('ix_trip_load_date', 'load_date'),
+        db.Index('ix_trip_unload_date', 'unload_date'),
+        db.Index('ix_trip_truck_unload', 'assigned_truck_plate', 'unload_date'),
+        db.Index('ix_trip_client_load', 'client', 'load_date'),
+        db.Index('ix_trip_origin_load', 'origin', 'load_date'),
+        db.Index('ix_trip_destination_load', 'destination', 'load_date'),
+        db.Index('ix_trip_driver_load', 'driver', 'load_date'),
+        db.Index('ix_trip_notify_pending', 'load_date', 'notify_time',
+                 sqlite_where=text(NOTIFY_PENDING), postgresql_where=text(NOTIFY_PENDING)),
+        {'sqlite_autoincrement': True},  # ids never reused once archived (see archive_table)
+    )
+
     def to_dict(self):
-        return {
-            'id': self.id,
-            'type': self.type,
-            'client': self.client,
-            'driver': self.driver,
-            'origin': self.origin,
-            'destination': self.destination,
-            'destinationZone': self.destination_zone,
-            'loadDate': self.load_date,
-            'unloadDate': self.unload_date,
-            'assignedTruck': self.assigned_truck_plate,
-            'assignedSlot': self.assigned_slot,
-            'isUrgent': self.is_urgent,
-            'isGroupage': self.is_groupage,
-            'zone': self.zone,
-            'pg': self.pg,
-            'ep': self.ep,
-            'pp': self.pp,
-            'notifyTime': self.notify_time,
-            'isNotified': self.is_notified
-        }
+        return trip_dict(self)
 # ...
 
 
@@ -183,23 +347,606 @@ class DailyNote(db.Model):
     date = db.Column(db.String(20), nullable=False)
     type = db.Column(db.String(20), nullable=False)
     content = db.Column(db.Text, default='')
-    __table_args__ = (db.UniqueConstraint('date', 'type', name='unique_date_type'),)
+    # Bumped on every save; notes are not in the sync revision, this feeds their ETag
+    version = db.Column(db.Integer, nullable=False, default=1)
+    # Ids never reused once archived (see archive_table)
+    __table_args__ = (db.UniqueConstraint('date', 'type', name='unique_date_type'), {'sqlite_autoincrement': True})
 
 class TruckFds(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     truck_plate = db.Column(db.String(20), db.ForeignKey('truck.plate'), nullable=False)
     date = db.Column(db.String(20), nullable=False)
     is_out_of_service = db.Column(db.Boolean, default=True)
-    __table_args__ = (db.UniqueConstraint('truck_plate', 'date', name='unique_plate_date'),)
+    __table_args__ = (
+        db.UniqueConstraint('truck_plate', 'date', name='unique_plate_date'),
+        db.Index('ix_truck_fds_date', 'date'),  # window reads by date range
+        {'sqlite_autoincrement': True},  # ids never reused once archived (see archive_table)
+    )
+
+class TruckPosition(db.Model):
+    # Materialized location of a truck from `date` until its next row. One row
+    # per (truck, unload day), holding the trip that wins that day.
+    id = db.Column(db.Integer, primary_key=True)
+    truck_plate = db.Column(db.String(20), nullable=False)
+    date = db.Column(db.String(20), nullable=False)
+    location = db.Column(db.String(100), default='')
+    zones_str = db.Column(db.String(200), default='')
+    trip_id = db.Column(db.Integer, nullable=True)
+    __table_args__ = (
+        db.UniqueConstraint('truck_plate', 'date', name='unique_position_plate_date'),
+        db.Index('ix_truck_position_date', 'date'),  # window reads by date range
+    )
+
+    def to_dict(self):
+        return position_dict(self)
+
+# --- ARCHIVO (tablas frías) ---
+# Finished trips, old notes and old FDS days are moved out of the hot tables
+# by archive_old_rows() (flask --app app archive). Same columns and ids as the
+# hot table, without foreign keys or defaults: a migration that adds a column
+# to Trip, TruckFds or DailyNote must add it to the archive table too. Ids stay
+# unique across both: on SQLite the hot tables are AUTOINCREMENT (migration
+# 17), otherwise the highest id would be handed out again once archived.
+# Truck positions and history stay hot: they are the anchors of later days.
+def archive_table(model, *indexes):
+    return db.Table(f'{model.__tablename__}_archive',
+                    *[db.Column(c.name, c.type, primary_key=c.primary_key, autoincrement=False)
+                      for c in model.__table__.c], *indexes)
+
+TRIP_ARCHIVE = archive_table(Trip, db.Index('ix_trip_archive_load_date', 'load_date'),
+                             db.Index('ix_trip_archive_unload_date', 'unload_date'))
+FDS_ARCHIVE = archive_table(TruckFds, db.Index('ix_truck_fds_archive_plate_date', 'truck_plate', 'date'),
+                            db.Index('ix_truck_fds_archive_date', 'date'))
+NOTE_ARCHIVE = archive_table(DailyNote, db.Index('ix_daily_note_archive_date_type', 'date', 'type'))
+
+def reaches_archive(column, date):
+    """True if rows on or before `date` may be in the archive `column` belongs to.
+
+    One index lookup (max of the archive's date column): reads that start after
+    everything archived never touch the archive.
+    """
+    until = db.session.execute(db.select(func.max(column))).scalar()
+    return until is not None and date <= until
+
+def trip_source(date_from, criteria):
+    """The trip table, or trip UNION ALL trip_archive if `date_from` reaches the
+    archive. criteria(table) is applied to each half, so both are read by their
+    own indexes; the caller still filters the result the same way."""
+    if not reaches_archive(TRIP_ARCHIVE.c.unload_date, date_from):
+        return Trip.__table__
+    return db.union_all(*[db.select(table).where(*criteria(table))
+                          for table in (Trip.__table__, TRIP_ARCHIVE)]).subquery('trips')
+
+def archive_fields(fields, archive):
+    """(key, column) pairs like TRIP_FIELDS, pointing at the archive table."""
+    return [(key, archive.c[column.name]) for key, column in fields]
+
+# --- SYNC: REVISION GLOBAL + REGISTRO DE CAMBIOS ---
+# Every committed write to a synced model gets a revision number and one
+# change_log row per touched entity. Clients remember the last revision they
+# saw and ask /api/changes?since=<rev> instead of reloading everything.
+
+class SyncRevision(db.Model):
+    # Single-row counter. Bumping it inside the writing transaction takes a row
+    # lock, so revisions become visible in commit order (no gaps for readers).
+    id = db.Column(db.Integer, primary_key=True)
+    rev = db.Column(db.Integer, nullable=False, default=0)
+
+class ChangeLog(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    rev = db.Column(db.Integer, nullable=False, index=True)
+    entity = db.Column(db.String(20), nullable=False) # 'trucks', 'trips', 'fds_data', 'drivers', 'trailers'
+    entity_key = db.Column(db.String(80), nullable=False)
+    op = db.Column(db.String(10), nullable=False) # 'upsert', 'delete'
+    # Board days the change can alter (inclusive, NULL = open-ended); lets a
+    # cached board snapshot skip revisions that touched other days
+    touch_from = db.Column(db.String(20), nullable=True)
+    touch_to = db.Column(db.String(20), nullable=True)
+
+class BoardSnapshot(db.Model):
+    # Cached /api/board payload for one day. Built from the data as of
+    # built_rev and known to still hold at rev: later revisions whose
+    # change_log rows do not touch the day only move rev forward.
+    date = db.Column(db.String(20), primary_key=True)
+    built_rev = db.Column(db.Integer, nullable=False)
+    rev = db.Column(db.Integer, nullable=False)
+    payload = db.Column(db.Text, nullable=False)
+
+class DayStats(db.Model):
+    # Cached /api/stats/day payload; same columns and freshness rule as BoardSnapshot
+    __tablename__ = 'day_stats'
+    date = db.Column(db.String(20), primary_key=True)
+    built_rev = db.Column(db.Integer, nullable=False)
+    rev = db.Column(db.Integer, nullable=False)
+    payload = db.Column(db.Text, nullable=False)
+
+SYNC_ENTITIES = {Truck: 'trucks', Trip: 'trips', TruckFds: 'fds_data', Driver: 'drivers', Trailer: 'trailers',
+                 TruckPosition: 'positions'}
+# Changes above this many keys are cheaper to resend as a full load
+SYNC_MAX_CHANGES = 2000
+# Above this many keys an SSE event carries only the revision
+SYNC_MAX_EVENT_KEYS = 200
+
+def sync_key(obj, committed=False):
+    """Key the client uses to identify a row: plate for trucks, plate|date for FDS, id otherwise."""
+    def value(attr):
+        if committed:
+            hist = db.inspect(obj).attrs[attr].history
+            if hist.deleted:
+                return hist.deleted[0]
+        return getattr(obj, attr)
+    if isinstance(obj, Truck):
+        return value('plate')
+    if isinstance(obj, (TruckFds, TruckPosition)):
+        return f"{value('truck_plate')}|{value('date')}"
+    return str(obj.id)
+
+def next_revision(conn):
+    conn.execute(SyncRevision.__table__.update().where(SyncRevision.id == 1).values(rev=SyncRevision.rev + 1))
+    rev = conn.execute(db.select(SyncRevision.rev).where(SyncRevision.id == 1)).scalar()
+    if rev is None:
+        conn.execute(SyncRevision.__table__.insert().values(id=1, rev=1))
+        rev = 1
+    return rev
+
+def current_revision():
+    return db.session.execute(db.select(SyncRevision.rev).where(SyncRevision.id == 1)).scalar() or 0
+
+def day_before(date):
+    try:
+        return (datetime.strptime(date, '%Y-%m-%d') - timedelta(days=1)).strftime('%Y-%m-%d')
+    except ValueError:
+        return None
+
+def touched_days(conn, entity, keys):
+    """{key: (from, to)} board days each change alters when the caller did not say.
+
+    FDS flags and positions carry forward until the truck's next row: one
+    query per BULK_CHUNK keys looks those up. Anything else is open-ended
+    (no entry, read as (None, None)).
+    """
+    model = {'fds_data': TruckFds, 'positions': TruckPosition}.get(entity)
+    if model is None:
+        return {}
+    keys = sorted(set(keys))
+    days = {}
+    for i in range(0, len(keys), BULK_CHUNK):
+        params = {}
+        for n, key in enumerate(keys[i:i + BULK_CHUNK]):
+            params[f'p{n}'], params[f'd{n}'] = key.split('|', 1)
+        # A VALUES list names its columns column1, column2 on SQLite and PostgreSQL alike
+        wanted = (text('VALUES ' + ', '.join(f'(:p{n}, :d{n})' for n in range(len(params) // 2)))
+                  .bindparams(**params)
+                  .columns(db.column('column1', db.String), db.column('column2', db.String))
+                  .subquery('wanted'))
+        following = (db.select(func.min(model.date))
+                     .where(model.truck_plate == wanted.c.column1, model.date > wanted.c.column2)
+                     .scalar_subquery())
+        for plate, date, after in conn.execute(db.select(wanted.c.column1, wanted.c.column2, following)):
+            days[f'{plate}|{date}'] = (date, day_before(after) if after else None)
+    return days
+
+def record_changes(session, changes):
+    """Writes (entity, key, op) tuples to change_log under a fresh revision.
+
+    A tuple may carry two more items, the (from, to) board days it touches;
+    see touched_days() for the default. The changes are also queued on the
+    session and pushed to /api/stream once the transaction commits.
+    """
+    if not changes:
+        return None
+    conn = session.connection()
+    rev = next_revision(conn)
+    defaults = {}
+    for entity in {change[0] for change in changes if len(change) == 3}:
+        defaults[entity] = touched_days(conn, entity, [c[1] for c in changes if len(c) == 3 and c[0] == entity])
+    rows = []
+    for change in changes:
+        entity, key, op = change[:3]
+        touch_from, touch_to = change[3:] or defaults[entity].get(key, (None, None))
+        rows.append({'rev': rev, 'entity': entity, 'entity_key': key, 'op': op,
+                     'touch_from': touch_from, 'touch_to': touch_to})
+    conn.execute(ChangeLog.__table__.insert(), rows)
+    queue_events(session, rev, [change[:3] for change in changes])
+    return rev
+
+def queue_events(session, rev, changes):
+    session.info.setdefault('pending_events', []).append((rev, changes))
+
+def trip_days(obj):
+    """A trip shows on the board of its load day: (from, to) over its old and new load_date."""
+    if not isinstance(obj, Trip):
+        return ()
+    hist = db.inspect(obj).attrs.load_date.history
+    days = [d for d in (hist.deleted[0] if hist.deleted else None, obj.load_date) if d]
+    return (min(days), max(days)) if days else ()
+
+@event.listens_for(Session, 'after_flush')
+def log_sync_changes(session, flush_context):
+    changes = refresh_positions(session, position_keys(session))
+    # A truck's history is part of its row for the client
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, TruckHistory):
+            # An entry applies from its date on
+            hist = db.inspect(obj).attrs.date.history
+            changes.append(('trucks', obj.truck_plate, 'upsert', min([*hist.deleted, obj.date]), None))
+    notes = []
+    for obj in session.new:
+        entity = SYNC_ENTITIES.get(type(obj))
+        if entity:
+            changes.append((entity, sync_key(obj), 'upsert') + trip_days(obj))
+    for obj in session.dirty:
+        entity = SYNC_ENTITIES.get(type(obj))
+        if entity and session.is_modified(obj):
+            old_key, key = sync_key(obj, committed=True), sync_key(obj)
+            if old_key != key:
+                changes.append((entity, old_key, 'delete'))
+            changes.append((entity, key, 'upsert') + trip_days(obj))
+    for obj in session.deleted:
+        entity = SYNC_ENTITIES.get(type(obj))
+        if entity:
+            changes.append((entity, sync_key(obj, committed=True), 'delete') + trip_days(obj))
+    # Notes are not part of the delta sync (they are fetched per day) but
+    # other boards still want to hear about them.
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, DailyNote):
+            notes.append(('notes', f'{obj.date}|{obj.type}', 'delete' if obj in session.deleted else 'upsert'))
+    rev = record_changes(session, changes)
+    if notes:
+        queue_events(session, rev, notes)
+
+@event.listens_for(Session, 'after_commit')
+def publish_sync_events(session):
+    pending = session.info.pop('pending_events', None)
+    if not pending:
+        return
+    revision = max((rev for rev, _ in pending if rev is not None), default=None)
+    changes = [{'entity': e, 'key': k, 'op': op} for _, batch in pending for e, k, op in batch]
+    if len(changes) > SYNC_MAX_EVENT_KEYS:
+        # Boards only need the revision to sync; keep big bulk writes off the wire
+        changes = [c for c in changes if c['entity'] == 'notes']
+    try:
+        broker.publish({'revision': revision, 'changes': changes})
+    except OSError as e:
+        # The write is committed; boards will catch up on their next sync
+        print(f"Error publicando eventos: {e}")
+
+@event.listens_for(Session, 'after_rollback')
+def discard_sync_events(session):
+    session.info.pop('pending_events', None)
+
+# --- MOTOR DE POSICIONES DE CAMIONES ---
+# Same rules as the board used to apply in the browser: a truck is where its
+# latest unloaded trip left it. If several trips unload that day, a trip loaded
+# and unloaded the same day wins, then the rightmost slot.
+ZONES = ['Murcia', 'Madrid', 'Valencia', 'Andalucía', 'Barcelona', 'Norte']
+
+def position_zones(destination, destination_zone):
+    if destination_zone:
+        return [destination_zone]
+    matched = [z for z in ZONES if z.lower() == (destination or '').lower()]
+    return matched[:1]
+
+def position_order(t=Trip):
+    # Winner first among trips of one truck unloading the same day (t: Trip or a
+    # selectable with its columns)
+    return (case((t.load_date == t.unload_date, 1), else_=0).desc(),
+            func.coalesce(t.assigned_slot, 0).desc(), t.id)
+
+def refresh_positions(session, keys):
+    """Recomputes the position rows for the given (plate, unload_date) pairs.
+
+    Returns the change_log tuples for the rows written or removed.
+    """
+    conn = session.connection()
+    table = TruckPosition.__table__
+    changes = []
+    for plate, date in sorted(keys):
+        winner = conn.execute(
+            db.select(Trip.id, Trip.destination, Trip.destination_zone)
+            .where(Trip.assigned_truck_plate == plate, Trip.unload_date == date)
+            .order_by(*position_order()).limit(1)
+        ).first()
+        conn.execute(table.delete().where(table.c.truck_plate == plate, table.c.date == date))
+        if winner:
+            conn.execute(table.insert().values(
+                truck_plate=plate, date=date, location=winner.destination or '',
+                zones_str=','.join(position_zones(winner.destination, winner.destination_zone)),
+                trip_id=winner.id))
+        changes.append(('positions', f'{plate}|{date}', 'upsert' if winner else 'delete'))
+    return changes
+
+def position_keys(session):
+    """(plate, unload_date) pairs whose winner may change with this flush."""
+    keys = set()
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if not isinstance(obj, Trip):
+            continue
+        state = db.inspect(obj)
+        plate_hist = state.attrs.assigned_truck_plate.history
+        unload_hist = state.attrs.unload_date.history
+        old_plate = plate_hist.deleted[0] if plate_hist.deleted else obj.assigned_truck_plate
+        old_unload = unload_hist.deleted[0] if unload_hist.deleted else obj.unload_date
+        if obj not in session.new and old_plate and old_unload:
+            keys.add((old_plate, old_unload))
+        if obj not in session.deleted and obj.assigned_truck_plate and obj.unload_date:
+            keys.add((obj.assigned_truck_plate, obj.unload_date))
+    return keys
+
+def rebuild_truck_positions():
+    """Recomputes the whole truck_position table from the trips (backfill), archived ones included."""
+    columns = ('id', 'assigned_truck_plate', 'unload_date', 'load_date', 'assigned_slot', 'destination',
+               'destination_zone')
+    trips = db.union_all(*[db.select(*[table.c[name] for name in columns]).where(table.c.assigned_truck_plate != None)
+                           for table in (Trip.__table__, TRIP_ARCHIVE)]).subquery('trips')
+    rows = db.session.execute(
+        db.select(trips).order_by(trips.c.assigned_truck_plate, trips.c.unload_date, *position_order(trips.c))
+    )
+    positions = {}
+    for r in rows:
+        positions.setdefault((r.assigned_truck_plate, r.unload_date), r)
+    db.session.execute(TruckPosition.__table__.delete())
+    # Not in change_log, so no cached board can tell it went stale
+    db.session.execute(BoardSnapshot.__table__.delete())
+    db.session.execute(DayStats.__table__.delete())
+    if positions:
+        db.session.execute(TruckPosition.__table__.insert(), [
+            {'truck_plate': plate, 'date': date, 'location': r.destination or '',
+             'zones_str': ','.join(position_zones(r.destination, r.destination_zone)), 'trip_id': r.id}
+            for (plate, date), r in positions.items()
+        ])
+    db.session.commit()
+    return len(positions)
+
+@app.cli.command('rebuild-positions')
+def rebuild_positions_command():
+    """Recalcula la tabla truck_position desde los viajes."""
+    print(f"{rebuild_truck_positions()} posiciones recalculadas.")
+
+# --- ESCRITURAS MASIVAS (SQL por conjuntos) ---
+BULK_CHUNK = 500
+
+def bulk_update_trips(rows, values, positions=True):
+    """UPDATE trip SET values WHERE id IN (...) for the pre-selected rows.
+
+    `rows` are (id, assigned_truck_plate, unload_date, load_date) tuples read
+    before the update: the ids bound the statement to exactly what gets logged,
+    the old plate/unload pairs tell which truck positions to recompute (skip
+    that with positions=False when the caller clears them itself) and the load
+    days which board snapshots go stale. Returns the number of rows updated.
+    """
+    count = 0
+    ids = [r[0] for r in rows]
+    for i in range(0, len(ids), BULK_CHUNK):
+        count += db.session.execute(
+            db.update(Trip).where(Trip.id.in_(ids[i:i + BULK_CHUNK])).values(version=Trip.version + 1, **values)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+    changes = [('trips', str(trip_id), 'upsert', load, load) for trip_id, _, _, load in rows]
+    if positions:
+        changes += refresh_positions(db.session, {(plate, unload) for _, plate, unload, _ in rows if plate})
+    record_changes(db.session, changes)
+    return count
+
+# --- ARCHIVADO (flask --app app archive) ---
+ARCHIVE_AFTER_DAYS = env_int('ARCHIVE_AFTER_DAYS', 365)
+ARCHIVE_BATCH = 2000
+
+def move_to_archive(table, archive, condition):
+    """Moves the rows matching `condition` into `archive`, ARCHIVE_BATCH per transaction.
+
+    Core statements, so nothing reaches change_log: the rows leave the hot
+    table but not the history, and no client has to drop or reload them.
+    Short transactions keep the board writable while a big backlog moves.
+    """
+    moved = 0
+    while True:
+        # Write lock before the first read (see sqlite_begin)
+        db.session.connection(execution_options={'sqlite_write': True})
+        ids = db.session.execute(db.select(table.c.id).where(condition).limit(ARCHIVE_BATCH)).scalars().all()
+        if ids:
+            db.session.execute(archive.insert().from_select(
+                [c.name for c in table.c], db.select(*table.c).where(table.c.id.in_(ids))))
+            db.session.execute(table.delete().where(table.c.id.in_(ids)))
+        db.session.commit()
+        moved += len(ids)
+        if len(ids) < ARCHIVE_BATCH:
+            return moved
+
+def archive_old_rows(days=ARCHIVE_AFTER_DAYS, today=None):
+    """Moves what ended more than `days` days ago to the archive tables. Returns the count per table.
+
+    Trips by unload date, notes by date, FDS rows by date except the latest one
+    of each truck before the cutoff: it still says whether the truck is out of
+    service today. Cached boards of those days are dropped too (rebuilt from
+    the archive if someone opens them).
+    """
+    cutoff = ((today or datetime.now().date()) - timedelta(days=days)).isoformat()
+    fds, later = TruckFds.__table__, TruckFds.__table__.alias('later')
+    superseded = db.select(later.c.id).where(later.c.truck_plate == fds.c.truck_plate,
+                                             later.c.date > fds.c.date, later.c.date < cutoff).exists()
+    counts = {
+        'trip': move_to_archive(Trip.__table__, TRIP_ARCHIVE, Trip.unload_date < cutoff),
+        'truck_fds': move_to_archive(fds, FDS_ARCHIVE, and_(fds.c.date < cutoff, superseded)),
+        'daily_note': move_to_archive(DailyNote.__table__, NOTE_ARCHIVE, DailyNote.date < cutoff),
+    }
+    for model in (BoardSnapshot, DayStats):
+        counts[model.__tablename__] = db.session.execute(
+            model.__table__.delete().where(model.date < cutoff)).rowcount
+    db.session.commit()
+    return counts
+
+@app.cli.command('archive')
+@click.option('--days', type=int, default=ARCHIVE_AFTER_DAYS, show_default=True,
+              help='Antigüedad (días) a partir de la cual se archiva.')
+def archive_command(days):
+    """Mueve al archivo los viajes terminados, las notas y los días FDS antiguos."""
+    for table, count in archive_old_rows(days).items():
+        print(f"{table:<16}{count:>10}")
+
+# --- AVISOS PROGRAMADOS (flask --app app notify) ---
+# Sends the Trip.notify_time alerts when they are due (see notifier.py): as a
+# worker process of its own (`flask --app app notify`, the procfile's
+# notifier) or, with NOTIFY_SCHEDULER=thread, in a thread of every web worker.
+NOTIFY_SCHEDULER = os.environ.get('NOTIFY_SCHEDULER', '')
+NOTIFY_SINKS = os.environ.get('NOTIFY_SINKS', 'log,sse')
+NOTIFY_WEBHOOK_URL = os.environ.get('NOTIFY_WEBHOOK_URL', '')
+# notify_time is what the board's time input holds: wall-clock time where the
+# traffic office is, not the server's (hosts usually run on UTC)
+NOTIFY_TZ = ZoneInfo(os.environ.get('NOTIFY_TZ') or 'Europe/Madrid')
+# Alerts missed while nothing was running still go out this many days late
+NOTIFY_LATE_DAYS = env_int('NOTIFY_LATE_DAYS', 1)
+NOTIFY_RELOAD_SECONDS = env_int('NOTIFY_RELOAD_SECONDS', 600)
+NOTIFY_BATCH = 200
+
+def notify_now():
+    """Current wall-clock time in NOTIFY_TZ (naive, like notify_due())."""
+    return datetime.now(NOTIFY_TZ).replace(tzinfo=None)
+
+def notify_due(load_date, notify_time):
+    """Datetime an alert is due ('HH:MM' on the load day), None if it does not parse."""
+    try:
+        return datetime.strptime(f'{load_date} {(notify_time or "").strip()[:5]}', '%Y-%m-%d %H:%M')
+    except ValueError:
+        return None
+
+class NotificationSource:
+    """Database side of the NotificationScheduler: every read goes through
+    ix_trip_notify_pending (pending alerts of a few days) or the primary key."""
+
+    def _entries(self, *criteria):
+        today = notify_now().date()
+        rows = db.session.execute(
+            db.select(Trip.id, Trip.load_date, Trip.notify_time)
+            .where(text(NOTIFY_PENDING),
+                   Trip.load_date >= (today - timedelta(days=NOTIFY_LATE_DAYS)).isoformat(),
+                   Trip.load_date <= (today + timedelta(days=1)).isoformat(), *criteria)
+        ).all()
+        return [(due, r.id) for r in rows for due in [notify_due(r.load_date, r.notify_time)] if due]
+
+    def load(self):
+        # Revision first: a write committed in between is seen again by changes()
+        revision = current_revision()
+        return revision, self._entries()
+
+    def changes(self, since):
+        revision = current_revision()
+        if revision < since:  # database restored or replaced
+            return None
+        if revision == since:
+            return revision, []
+        keys = db.session.execute(
+            db.select(ChangeLog.entity_key).where(ChangeLog.rev > since, ChangeLog.rev <= revision,
+                                                  ChangeLog.entity == 'trips', ChangeLog.op == 'upsert')
+            .limit(SYNC_MAX_CHANGES + 1)
+        ).scalars().all()
+        if len(keys) > SYNC_MAX_CHANGES:
+            return None
+        ids = {int(k) for k in keys}
+        return revision, self._entries(Trip.id.in_(ids)) if ids else []
+
+    def claim(self, ids, now):
+        # End the read transaction first: the claim needs the write lock from
+        # its first read (see sqlite_begin)
+        db.session.commit()
+        db.session.connection(execution_options={'sqlite_write': True})
+        rows = db.session.execute(
+            db.select(Trip.id, Trip.assigned_truck_plate, Trip.unload_date, Trip.load_date, Trip.notify_time,
+                      Trip.type, Trip.client, Trip.origin, Trip.destination, Trip.driver)
+            .where(Trip.id.in_(ids), text(NOTIFY_PENDING)).with_for_update()
+        ).all()
+        due = [r for r in rows for when in [notify_due(r.load_date, r.notify_time)] if when and when <= now]
+        if due:
+            bulk_update_trips([(r.id, r.assigned_truck_plate, r.unload_date, r.load_date) for r in due],
+                              {'is_notified': True}, positions=False)
+        db.session.commit()
+        return [{'id': r.id, 'loadDate': r.load_date, 'notifyTime': r.notify_time, 'plate': r.assigned_truck_plate,
+                 'type': r.type, 'client': r.client, 'origin': r.origin, 'destination': r.destination,
+                 'driver': r.driver or ''} for r in due]
+
+def sse_sink(notifications):
+    """Open boards get them as an SSE 'notification' event (see stream_events)."""
+    broker.publish({'revision': None, 'changes': [], 'notifications': notifications})
+
+def notification_sinks(names=NOTIFY_SINKS):
+    available = {'log': notifier.log_sink, 'sse': sse_sink, 'webhook': notifier.WebhookSink(NOTIFY_WEBHOOK_URL)}
+    sinks = []
+    for name in (n.strip() for n in names.split(',')):
+        if name in available:
+            sinks.append(available[name])
+        elif name:
+            print(f"NOTIFY_SINKS: destino desconocido '{name}' (disponibles: {', '.join(available)})")
+    return sinks
+
+notification_scheduler = notifier.NotificationScheduler(
+    NotificationSource(), notification_sinks(), reload_interval=NOTIFY_RELOAD_SECONDS, batch_size=NOTIFY_BATCH,
+    clock=notify_now)
+_notifier_thread = None
+_notifier_lock = threading.Lock()
+
+@app.before_request
+def start_notifier_thread():
+    # Started by the first request and not at import: the gunicorn master
+    # imports the app too, and threads do not survive the fork into workers.
+    # Every worker runs one; claim() makes each alert go out only once.
+    global _notifier_thread
+    if NOTIFY_SCHEDULER != 'thread' or _notifier_thread is not None or app.config.get('TESTING'):
+        return
+    with _notifier_lock:
+        if _notifier_thread is None:
+            _notifier_thread = threading.Thread(target=notification_scheduler.run,
+                                                kwargs={'context': app.app_context},
+                                                name='notifier', daemon=True)
+            _notifier_thread.start()
+
+@app.cli.command('notify')
+@click.option('--once', is_flag=True, help='Envía lo que ya toca y termina (para cron).')
+def notify_command(once):
+    """Envía los avisos de los viajes (notify_time) a su hora."""
+    if once:
+        print(f"{len(notification_scheduler.tick())} avisos enviados.")
+        return
+    print(f"Programador de avisos en marcha ({', '.join(getattr(s, '__name__', str(s)) for s in notification_scheduler.sinks)})")
+    notification_scheduler.run(context=app.app_context)
+
+# Per-process cache for the user loader: the board fires several API calls per
+# drag-and-drop and each one needed a SELECT on user. Admin edits clear the
+# entry in this process; other workers pick them up within USER_CACHE_TTL.
+USER_CACHE_TTL = env_int('USER_CACHE_TTL', 60)
+_user_cache = {}
+
+class CachedUser(UserMixin):
+    """Read-only snapshot of a User row, safe to share between requests and threads."""
+    def __init__(self, user):
+        self.id = user.id
+        self.username = user.username
+        self.is_admin = bool(user.is_admin)
+
+    def __repr__(self):
+        return f'<User {self.username}>'
+
+def forget_user(user_id):
+    _user_cache.pop(int(user_id), None)
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    user_id = int(user_id)
+    cached = _user_cache.get(user_id)
+    now = time.monotonic()
+    if cached and cached[0] > now:
+        return cached[1]
+    u = db.session.get(User, user_id)
+    if u is None:
+        forget_user(user_id)
+        return None
+    snapshot = CachedUser(u)
+    _user_cache[user_id] = (now + USER_CACHE_TTL, snapshot)
+    return snapshot
 
 # --- 3. VISTAS ADMIN ---
 class ProtectedAdminView(ModelView):
     form_extra_fields = {'password': PasswordField('Contraseña')}
-    form_excluded_columns = ('password_hash',)
+    form_excluded_columns = ('password_hash', 'version')
 
     def is_accessible(self):
         return current_user.is_authenticated and current_user.is_admin
@@ -210,9 +957,132 @@ class ProtectedAdminView(ModelView):
 
     def on_model_change(self, form, model, is_created):
         if 'password' in form and form.password.data:
-            model.password_hash = generate_password_hash(form.password.data, method='pbkdf2:sha256')
+            model.password_hash = generate_password_hash(form.password.data, method=User.PASSWORD_METHOD)
         super(ProtectedAdminView, self).on_model_change(form, model, is_created)
 
+    # After the commit, so no other thread can re-cache the old row in between
+    def after_model_change(self, form, model, is_created):
+        if isinstance(model, User):
+            forget_user(model.id)
+        super(ProtectedAdminView, self).after_model_change(form, model, is_created)
+
+    def after_model_delete(self, model):
+        if isinstance(model, User):
+            forget_user(model.id)
+        super(ProtectedAdminView, self).after_model_delete(model)
+
+def estimated_rows(model):
+    """Filas de una tabla sin count(*): the planner's estimate on PostgreSQL, the
+    id span on SQLite (exact unless rows were deleted). Both read no table rows."""
+    if db.engine.dialect.name == 'postgresql':
+        rows = db.session.execute(text("SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(:t)"),
+                                  {'t': model.__tablename__}).scalar()
+        if rows is not None and rows >= 0:  # -1: never analyzed
+            return rows
+    # Two queries: SQLite only reads min() or max() off the index when it is alone
+    low = db.session.query(func.min(model.id)).scalar()
+    high = db.session.query(func.max(model.id)).scalar()
+    return high - low + 1 if high is not None else 0
+
+class KeysetAdminView(ProtectedAdminView):
+    """Admin list of a big table without OFFSET or count(*).
+
+    The default order is `keyset` (columns unique together, all in the
+    `keyset_desc` direction). The < > links carry the last/first key of the
+    current page (?after= / ?before=) and read the next page with a row-value
+    comparison on an index. Pages opened by number, or sorted by another
+    column, still use OFFSET. The count is estimated_rows() without filters,
+    exact up to COUNT_CAP rows with them, and unknown above (only < >).
+    """
+    simple_list_pager = True  # get_list returns its own count
+    keyset = ()
+    keyset_desc = True
+    COUNT_CAP = 10000
+
+    def get_list(self, page, sort_column, sort_desc, search, filters, execute=True, page_size=None):
+        _, query = super(KeysetAdminView, self).get_list(page, sort_column, sort_desc, search, filters,
+                                                         execute=False, page_size=page_size)
+        if search or filters:
+            count = self.capped_count(query)
+        else:
+            count = estimated_rows(self.model)
+        cursor = self.list_cursor() if sort_column is None and page and page_size else None
+        if cursor:
+            backwards, key = cursor
+            smaller = self.keyset_desc != backwards
+            columns = tuple_(*self.keyset)
+            query = (query.limit(None).offset(None).order_by(None)
+                     .filter(columns < tuple_(*key) if smaller else columns > tuple_(*key))
+                     .order_by(*[c.desc() if smaller else c.asc() for c in self.keyset])
+                     .limit(page_size))
+        if not execute:
+            return count, query
+        rows = query.all()
+        if cursor and cursor[0]:
+            rows.reverse()
+        if sort_column is None and rows:
+            g.keyset_page = (self.endpoint, page or 0, self.row_key(rows[0]), self.row_key(rows[-1]))
+        return count, rows
+
+    def capped_count(self, query):
+        limited = query.limit(None).offset(None).order_by(None).with_entities(literal(1)).limit(self.COUNT_CAP + 1)
+        count = db.session.query(func.count()).select_from(limited.subquery()).scalar()
+        return count if count <= self.COUNT_CAP else None
+
+    def row_key(self, row):
+        return [getattr(row, c.key) for c in self.keyset]
+
+    def list_cursor(self):
+        """(backwards, key) from ?after= / ?before=, or None (OFFSET)."""
+        for arg, backwards in (('after', False), ('before', True)):
+            if arg in request.args:
+                try:
+                    key = json.loads(request.args[arg])
+                    if len(key) == len(self.keyset):
+                        return backwards, [c.type.python_type(v) for c, v in zip(self.keyset, key)]
+                except (ValueError, TypeError):
+                    pass
+        return None
+
+    def _get_list_url(self, view_args):
+        extra = {k: v for k, v in view_args.extra_args.items() if k not in ('after', 'before')}
+        current = getattr(g, 'keyset_page', None)
+        if current and current[0] == self.endpoint and view_args.sort is None and view_args.page:
+            _, page, first, last = current
+            if view_args.page == page + 1:
+                extra['after'] = json.dumps(last, separators=(',', ':'))
+            elif view_args.page == page - 1:
+                extra['before'] = json.dumps(first, separators=(',', ':'))
+        return super(KeysetAdminView, self)._get_list_url(view_args.clone(extra_args=extra))
+
+def date_filters(column, name):
+    # ISO dates in VARCHAR: the string order is the date order, so these use the index
+    return [FilterEqual(column, name), FilterGreater(column, name), FilterSmaller(column, name)]
+
+class TripAdminView(KeysetAdminView):
+    keyset = (Trip.load_date, Trip.id)
+    column_default_sort = [('load_date', True), ('id', True)]
+    # The plate column instead of the relationship: no join to truck for the list
+    column_list = ('assigned_truck_plate', 'type', 'client', 'driver', 'origin', 'destination',
+                   'destination_zone', 'load_date', 'unload_date', 'assigned_slot', 'is_urgent',
+                   'is_groupage', 'zone', 'pg', 'ep', 'pp', 'notify_time', 'is_notified')
+    column_labels = {'assigned_truck_plate': 'Camión'}
+    column_filters = (date_filters(Trip.load_date, 'Fecha carga') + date_filters(Trip.unload_date, 'Fecha descarga')
+                      + [FilterEqual(Trip.assigned_truck_plate, 'Camión'), FilterEqual(Trip.client, 'Cliente')])
+
+class TruckAdminView(KeysetAdminView):
+    keyset = (Truck.plate,)
+    keyset_desc = False
+    column_default_sort = 'plate'
+    column_filters = [FilterEqual(Truck.plate, 'Matrícula')]
+    # Each would be a <select> of every trip / history row of the database
+    form_excluded_columns = ProtectedAdminView.form_excluded_columns + ('trips', 'history_entries')
+
+class DailyNoteAdminView(KeysetAdminView):
+    keyset = (DailyNote.date, DailyNote.type)  # unique_date_type
+    column_default_sort = [('date', True), ('type', True)]
+    column_filters = date_filters(DailyNote.date, 'Fecha') + [FilterEqual(DailyNote.type, 'Tipo')]
+
 class MyAdminIndexView(AdminIndexView):
     def is_accessible(self):
         return current_user.is_authenticated and current_user.is_admin
@@ -226,90 +1096,111 @@ from flask_admin.menu import MenuLink
 admin.add_link(MenuLink(name='← Gestor de Tráfico', url='/'))
 
 admin.add_view(ProtectedAdminView(User, db.session, name='Usuarios'))
-admin.add_view(ProtectedAdminView(Truck, db.session, name='Camiones'))
-admin.add_view(ProtectedAdminView(Trip, db.session, name='Viajes'))
-admin.add_view(ProtectedAdminView(DailyNote, db.session, name='Notas'))
+admin.add_view(TruckAdminView(Truck, db.session, name='Camiones'))
+admin.add_view(TripAdminView(Trip, db.session, name='Viajes'))
+admin.add_view(DailyNoteAdminView(DailyNote, db.session, name='Notas'))
 admin.add_view(ProtectedAdminView(Driver, db.session, name='Conductores')) # Add Driver to Admin
 admin.add_view(ProtectedAdminView(Trailer, db.session, name='Remolques')) # Add Trailer to Admin
 
 # --- 4. INIT & RUTAS BASIVAS ---
-# --- 4. INIT & RUTAS BASIVAS ---
-# --- 4. INIT & RUTAS BASIVAS ---
-# Flag global para controlar la inicialización por worker
-_db_initialized = False
+# The schema is migrated once per deploy by migrations.py (gunicorn on_starting
+# hook, `flask --app app migrate`, fix_db.py), never on a request.
+def run_migrations():
+    import migrations
+    with app.app_context():
+        applied = migrations.upgrade(db)
+        version = migrations.current_version(db)
+    print(f"Esquema en versión {version} ({len(applied)} migraciones aplicadas).")
+    return applied
+
+@app.cli.command('migrate')
+def migrate_command():
+    """Aplica las migraciones pendientes del esquema."""
+    run_migrations()
+
+# --- MÉTRICAS ---
+# Per request: latency, SQL statements and their time, response size. Shown
+# to the client as a Server-Timing header and aggregated per route (the URL
+# rule, not the path) for Prometheus at /metrics.
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+metrics = Metrics(
+    # gunicorn.conf.py sets one for all workers; a lone process makes a temporary
+    # one on its first request (see metrics.py)
+    os.environ.get('METRICS_DIR') or None,
+    histograms={
+        'http_request_duration_seconds': ('Request latency, body included.', LATENCY_BUCKETS, ('route', 'method')),
+        'http_request_sql_queries': ('SQL statements per request.', (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000),
+                                     ('route', 'method')),
+        'http_request_sql_seconds': ('Time spent in SQL per request.', LATENCY_BUCKETS, ('route', 'method')),
+        'http_response_size_bytes': ('Response body size as sent (after compression).', SIZE_BUCKETS,
+                                     ('route', 'method')),
+    },
+    counters={'http_requests_total': ('Requests by status code.', ('route', 'method', 'status'))},
+)
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def stop_query_timer(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['query_start'].pop()
+    timing = g.get('timing') if has_request_context() else None
+    if timing is not None:
+        timing['queries'] += 1
+        timing['sql'] += elapsed
 
 @app.before_request
-def init_db_on_first_request():
-    global _db_initialized
-    if not _db_initialized:
-        try:
-            inspector = db.inspect(db.engine)
-            tables = inspector.get_table_names()
-            print(f"Tablas existentes antes de check: {tables}")
-            
-            db.create_all() # This will create Driver and Trailer tables if they don't exist
-
-            # MIGRATION: Check for new columns
-            try:
-                with db.engine.connect() as conn:
-                    # Check Truck columns
-                    truck_columns = [c['name'] for c in inspector.get_columns('truck')]
-                    if 'manual_location' not in truck_columns:
-                        print("Migrando base de datos: Añadiendo manual_location a truck...")
-                        conn.execute(text("ALTER TABLE truck ADD COLUMN manual_location VARCHAR(100) DEFAULT ''"))
-                    if 'is_zone_manual' not in truck_columns:
-                        print("Migrando base de datos: Añadiendo is_zone_manual a truck...")
-                        conn.execute(text("ALTER TABLE truck ADD COLUMN is_zone_manual BOOLEAN DEFAULT 0"))
-                    if 'zones_last_updated' not in truck_columns:
-                        print("Migrando base de datos: Añadiendo zones_last_updated a truck...")
-                        conn.execute(text("ALTER TABLE truck ADD COLUMN zones_last_updated VARCHAR(20) DEFAULT '2000-01-01'"))
-                    if 'manual_zones_str' not in truck_columns:
-                        print("Migrando base de datos: Añadiendo manual_zones_str a truck...")
-                        conn.execute(text("ALTER TABLE truck ADD COLUMN manual_zones_str VARCHAR(200) DEFAULT ''"))
-                    if 'trailer' not in truck_columns:
-                        print("Migrando base de datos: Añadiendo trailer a truck...")
-                        conn.execute(text("ALTER TABLE truck ADD COLUMN trailer VARCHAR(50) DEFAULT ''"))
-                    if 'driver_name' not in truck_columns:
-                        print("Migrando base de datos: Añadiendo driver_name a truck...")
-                        conn.execute(text("ALTER TABLE truck ADD COLUMN driver_name VARCHAR(100) DEFAULT ''"))
-                    if 'driver_phone' not in truck_columns:
-                        print("Migrando base de datos: Añadiendo driver_phone a truck...")
-                        conn.execute(text("ALTER TABLE truck ADD COLUMN driver_phone VARCHAR(20) DEFAULT ''"))
-                    if 'driver_dni' not in truck_columns:
-                        print("Migrando base de datos: Añadiendo driver_dni a truck...")
-                        conn.execute(text("ALTER TABLE truck ADD COLUMN driver_dni VARCHAR(20) DEFAULT ''"))
-                    if 'driver_alias' not in truck_columns:
-                        print("Migrando base de datos: Añadiendo driver_alias a truck...")
-                        conn.execute(text("ALTER TABLE truck ADD COLUMN driver_alias VARCHAR(50) DEFAULT ''"))
-                    if 'history_str' not in truck_columns:
-                        print("Migrando base de datos: Añadiendo history_str a truck...")
-                        conn.execute(text("ALTER TABLE truck ADD COLUMN history_str TEXT DEFAULT '[]'"))
-                    
-                    # Check Trip columns
-                    trip_columns = [c['name'] for c in inspector.get_columns('trip')]
-                    if 'destination_zone' not in trip_columns:
-                        print("Migrando base de datos: Añadiendo destination_zone a trip...")
-                        conn.execute(text("ALTER TABLE trip ADD COLUMN destination_zone VARCHAR(50)"))
-                        
-                    conn.commit()
-            except Exception as e:
-                print(f"Error checking/migrating schema: {e}")
-            
-            if not User.query.filter_by(username='davidp').first():
-                u = User(username='davidp', is_admin=True)
-                u.set_password('admin')
-                db.session.add(u)
-                db.session.commit()
-                print("Admin 'davidp' creado.")
-            
-            _db_initialized = True
-            print("Base de datos inicializada correctamente.")
-        except Exception as e:
-            print(f"Error inicializando base de datos: {e}")
-
-# (Funcion anterior create_db_and_admin eliminada/reemplazada por este hook)
-
-# create_db_and_admin() removed in favor of before_request hook
+def start_request_timer():
+    g.timing = {'start': time.perf_counter(), 'queries': 0, 'sql': 0.0}
+
+def record_request(timing, route, method, status, size):
+    labels = (route, method)
+    metrics.observe('http_request_duration_seconds', labels, time.perf_counter() - timing['start'])
+    metrics.observe('http_request_sql_queries', labels, timing['queries'])
+    metrics.observe('http_request_sql_seconds', labels, timing['sql'])
+    metrics.observe('http_response_size_bytes', labels, size)
+    metrics.inc('http_requests_total', labels + (str(status),))
+    metrics.maybe_flush()
+
+def measured_stream(chunks, timing, *labels):
+    """Passes a streamed body through, recording the request once it has been sent."""
+    size = 0
+    try:
+        for chunk in chunks:
+            size += len(chunk)
+            yield chunk
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+        record_request(timing, *labels, size)
+
+# Registered before compress_response, so it runs after it and sees the bytes sent
+@app.after_request
+def time_response(response):
+    timing = g.get('timing')
+    if timing is None:
+        return response
+    handler = time.perf_counter() - timing['start']
+    # Streamed bodies keep running after this point: the header covers the handler only
+    response.headers['Server-Timing'] = (f'app;dur={handler * 1000:.1f}, '
+                                         f'db;dur={timing["sql"] * 1000:.1f};desc="{timing["queries"]} queries"')
+    labels = (request.url_rule.rule if request.url_rule else 'unmatched', request.method, response.status_code)
+    if response.is_streamed and response.mimetype != 'text/event-stream':
+        response.response = measured_stream(response.response, timing, *labels)
+    else:
+        # SSE streams last for hours: count them, but only up to here
+        record_request(timing, *labels, response.content_length or 0)
+    return response
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Prometheus scrape endpoint: admins, or `Authorization: Bearer $METRICS_TOKEN`."""
+    token = os.environ.get('METRICS_TOKEN')
+    scraper = bool(token) and hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}')
+    if not scraper and not (current_user.is_authenticated and current_user.is_admin):
+        return Response('Forbidden\n', status=403, mimetype='text/plain')
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
 
 @app.route('/health')
 def health_check():
@@ -321,6 +1212,10 @@ def login():
     if request.method == 'POST':
         u = User.query.filter_by(username=request.form.get('username')).first()
         if u and u.check_password(request.form.get('password')):
+            # Upgrade old hashes (scrypt, fewer iterations) once; current ones are left alone
+            if u.password_needs_rehash():
+                u.set_password(request.form.get('password'))
+                db.session.commit()
             login_user(u)
             flash('Login exitoso', 'success')
             next_p = request.args.get('next')
@@ -341,51 +1236,792 @@ def logout():
 def index():
     return render_template('index.html', title='Gestor de Tráfico')
 
+# --- ESTÁTICOS CON HUELLA + COMPRESIÓN ---
+# The board's JS/CSS live in static/ and are linked as /assets/<hash>/<file>.
+# The hash changes with the content, so browsers may cache them for a year;
+# each file is read and compressed (gzip, brotli) once per process.
+ASSETS = ('css/board.css', 'js/board.js')
+ASSET_MAX_AGE = 365 * 24 * 3600
+_asset_cache = {}
+
+def load_asset(filename):
+    """(digest, {encoding: bytes}) for a file under static/. None if it does not exist."""
+    asset = _asset_cache.get(filename)
+    if asset is None or app.debug:
+        path = safe_join(app.static_folder, filename)
+        if path is None or not os.path.isfile(path):
+            return None
+        with open(path, 'rb') as f:
+            data = f.read()
+        encodings = {'identity': data, 'gzip': gzip.compress(data, 9, mtime=0)}
+        if brotli:
+            encodings['br'] = brotli.compress(data, quality=11)
+        asset = (hashlib.sha256(data).hexdigest()[:12], encodings)
+        _asset_cache[filename] = asset
+    return asset
+
+def preload_assets():
+    # Called from gunicorn's master so forked workers start with them compressed
+    for filename in ASSETS:
+        load_asset(filename)
+
+@app.template_global()
+def asset_url(filename):
+    asset = load_asset(filename)
+    if asset is None:
+        return url_for('static', filename=filename)
+    return url_for('asset', digest=asset[0], filename=filename)
+
+def accepted_encoding(available):
+    """Best of `available` ('br', 'gzip') the client accepts, else 'identity'."""
+    return request.accept_encodings.best_match([e for e in ('br', 'gzip') if e in available], default='identity')
+
+@app.route('/assets/<digest>/<path:filename>')
+def asset(digest, filename):
+    asset = load_asset(filename)
+    if asset is None:
+        return 'Not found', 404
+    current, encodings = asset
+    encoding = accepted_encoding(encodings)
+    response = Response(encodings[encoding], mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream')
+    if encoding != 'identity':
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    if digest == current:
+        response.headers['Cache-Control'] = f'public, max-age={ASSET_MAX_AGE}, immutable'
+    else:
+        # Stale or made-up fingerprint: serve the current file, but don't let it stick
+        response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+# Dynamic responses (API JSON, pages) are compressed on the way out
+COMPRESS_MIMETYPES = ('application/json', 'text/html', 'text/csv')
+COMPRESS_MIN_SIZE = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5  # fast enough per request; assets above use 11 once
+
+class StreamCompressor:
+    """gzip/brotli compressor with one process()/finish() interface."""
+    def __init__(self, encoding):
+        if encoding == 'br':
+            self._br = brotli.Compressor(quality=BROTLI_QUALITY)
+            self.process, self.finish = self._br.process, self._br.finish
+        else:
+            self._z = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)  # wbits 31 = gzip container
+            self.process, self.finish = self._z.compress, self._z.flush
+
+def compress_stream(chunks, encoding):
+    compressor = StreamCompressor(encoding)
+    for chunk in chunks:
+        out = compressor.process(chunk.encode() if isinstance(chunk, str) else chunk)
+        if out:
+            yield out
+    yield compressor.finish()
+
+@app.after_request
+def compress_response(response):
+    if (response.status_code != 200 or response.direct_passthrough or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESS_MIMETYPES):
+        return response
+    encoding = accepted_encoding(('br', 'gzip') if brotli else ('gzip',))
+    if encoding == 'identity':
+        return response
+    if response.is_streamed:
+        # stream_jsonify(): compress chunk by chunk, keep streaming
+        response.response = compress_stream(response.response, encoding)
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < COMPRESS_MIN_SIZE:
+            return response
+        compressor = StreamCompressor(encoding)
+        response.set_data(compressor.process(data) + compressor.finish())
+    response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    return response
+
 # --- 5. API ENDPOINTS ---
+# Row -> dict helpers. They take an ORM object or a Core row (same attribute
+# names), so the models' to_dict() and the bulk read paths share one schema.
+def fds_dict(r):
+    return {'plate': r.truck_plate, 'date': r.date, 'is_out_of_service': r.is_out_of_service}
+
+# (JSON key, column) pairs in to_dict() order. Bulk reads select exactly these
+# columns and zip them with the keys, skipping per-attribute lookups.
+TRIP_FIELDS = (
+    ('id', Trip.id), ('type', Trip.type), ('client', Trip.client), ('driver', Trip.driver),
+    ('origin', Trip.origin), ('destination', Trip.destination), ('destinationZone', Trip.destination_zone),
+    ('loadDate', Trip.load_date), ('unloadDate', Trip.unload_date), ('assignedTruck', Trip.assigned_truck_plate),
+    ('assignedSlot', Trip.assigned_slot), ('isUrgent', Trip.is_urgent), ('isGroupage', Trip.is_groupage),
+    ('zone', Trip.zone), ('pg', Trip.pg), ('ep', Trip.ep), ('pp', Trip.pp), ('notifyTime', Trip.notify_time),
+    ('isNotified', Trip.is_notified), ('version', Trip.version),
+)
+POSITION_FIELDS = (
+    ('plate', TruckPosition.truck_plate), ('date', TruckPosition.date), ('location', TruckPosition.location),
+    ('zones', TruckPosition.zones_str), ('tripId', TruckPosition.trip_id),
+)
+
+def trip_dict(r):
+    return {key: getattr(r, column.key) for key, column in TRIP_FIELDS}
+
+def truck_dict(r, history):
+    return {
+        'id': r.id,
+        'plate': r.plate,
+        'location': r.location,
+        'locationLastUpdatedDate': r.location_last_updated,
+        'creationDate': r.creation_date,
+        'deletionDate': r.deletion_date,
+        'isLocationManual': r.is_location_manual,
+        'isZoneManual': r.is_zone_manual,
+        'zones': r.zones_str.split(',') if r.zones_str else [],
+        'zonesLastUpdatedDate': r.zones_last_updated,
+        'manualLocation': r.manual_location,
+        'manualZones': r.manual_zones_str.split(',') if r.manual_zones_str else [],
+        'trailer': r.trailer,
+        'driverName': r.driver_name,
+        'driverPhone': r.driver_phone,
+        'driverDni': r.driver_dni,
+        'driverAlias': r.driver_alias,
+        'history': history,
+        'version': r.version
+    }
+
+def history_dict(r):
+    d = {'date': r.date}
+    for column, key in TruckHistory.FIELDS:
+        if getattr(r, column) is not None:
+            d[key] = getattr(r, column)
+    if r.manual_zones_str is not None:
+        d['manualZones'] = r.manual_zones_str.split(',') if r.manual_zones_str else []
+    return d
+
+def position_dict(r):
+    d = {key: getattr(r, column.key) for key, column in POSITION_FIELDS}
+    d['zones'] = d['zones'].split(',') if d['zones'] else []
+    return d
+
+def field_dicts(fields, *criteria, split=()):
+    """to_dict()-shaped dicts straight from Core rows; `split` keys hold comma lists."""
+    keys = [key for key, _ in fields]
+    result = db.session.execute(db.select(*[column for _, column in fields]).where(*criteria))
+    dicts = [dict(zip(keys, r)) for r in result]
+    for key in split:
+        for d in dicts:
+            d[key] = d[key].split(',') if d[key] else []
+    return dicts
+
+def table_rows(model, *criteria):
+    """Plain Core rows (no ORM identity map / instance state) for a bulk read. `model` may be a Table."""
+    table = getattr(model, '__table__', model)
+    return db.session.execute(db.select(*table.c).where(*criteria)).all()
+
+def trucks_with_history(*criteria):
+    """truck_dict()s for the trucks matching criteria, history read in one query."""
+    truck_rows = table_rows(Truck, *criteria)
+    history = {}
+    if truck_rows:
+        plates = db.select(Truck.plate).where(*criteria)
+        for h in db.session.execute(db.select(*TruckHistory.__table__.c)
+                                    .where(TruckHistory.truck_plate.in_(plates)).order_by(TruckHistory.date)):
+            history.setdefault(h.truck_plate, []).append(history_dict(h))
+    return [truck_dict(t, history.get(t.plate, [])) for t in truck_rows]
+
+STREAM_CHUNK = 2000
+
+def stream_jsonify(obj):
+    """jsonify() for big payloads: same bytes, but encoded and sent in chunks.
+
+    obj is a dict whose values may be lists or iterators (e.g. map(trip_dict, rows));
+    those are encoded STREAM_CHUNK items at a time instead of as one huge string.
+    """
+    provider = app.json
+    if not (provider.compact or (provider.compact is None and not app.debug)):
+        # Debug pretty-printing: not worth duplicating the indentation logic
+        return jsonify({k: list(v) if hasattr(v, '__next__') else v for k, v in obj.items()})
+    encoder = json.JSONEncoder(ensure_ascii=provider.ensure_ascii, sort_keys=provider.sort_keys,
+                               separators=(',', ':'), default=provider.default)
+
+    def generate():
+        keys = sorted(obj) if provider.sort_keys else list(obj)
+        for n, key in enumerate(keys):
+            value = obj[key]
+            yield ('{' if n == 0 else ',') + encoder.encode(key) + ':'
+            if not isinstance(value, list) and not hasattr(value, '__next__'):
+                yield encoder.encode(value)
+                continue
+            items = iter(value)
+            sep = '['
+            while True:
+                chunk = list(itertools.islice(items, STREAM_CHUNK))
+                if not chunk:
+                    break
+                # Encode the chunk as a list and drop its brackets
+                yield sep + encoder.encode(chunk)[1:-1]
+                sep = ','
+            yield '[]' if sep == '[' else ']'
+        yield '}\n'
+
+    return Response(generate(), mimetype=provider.mimetype)
+
+# Conditional GET. ETags come from counters the writes already maintain (the
+# sync revision, DailyNote.version), never from hashing the body, so a
+# matching If-None-Match is answered with one tiny query and no ORM objects.
+# They are weak (W/"..."): the same tag covers the identity, gzip and br
+# bodies compress_response() may send, which are not byte-for-byte equal.
+def not_modified(tag):
+    """A 304 response if the client already holds ETag `tag`, else None."""
+    if request.if_none_match.contains_weak(tag):
+        return with_etag(Response(status=304), tag)
+    return None
+
+def with_etag(response, tag):
+    response.set_etag(tag, weak=True)
+    # Private data behind login; the browser may keep it but must revalidate
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+def parse_date_arg(name):
+    """Reads an optional YYYY-MM-DD query arg. Raises ValueError if malformed."""
+    value = request.args.get(name)
+    if not value:
+        return None
+    datetime.strptime(value, '%Y-%m-%d')
+    return value
+
+def latest_before(model, key_col, date_col, date_from, *criteria, inclusive=False):
+    """Rows holding, per key, the greatest date strictly before date_from (or on it if inclusive).
+
+    State on the board carries forward in time (FDS flags, truck positions), so a
+    window starting at date_from still needs the last row before it as an anchor.
+    Returns Core rows (see table_rows()); `model` may be a Table.
+    """
+    table = getattr(model, '__table__', model)
+    bound = date_col <= date_from if inclusive else date_col < date_from
+    last = db.session.query(key_col.label('k'), func.max(date_col).label('d')) \
+        .filter(key_col != None, bound, *criteria) \
+        .group_by(key_col).subquery()
+    return db.session.execute(
+        db.select(*table.c).join(last, and_(key_col == last.c.k, date_col == last.c.d))
+    ).all()
+
+def fds_before(date, inclusive=False):
+    """latest_before() for TruckFds, looking into the archive only when `date` reaches it."""
+    rows = latest_before(TruckFds, TruckFds.truck_plate, TruckFds.date, date, inclusive=inclusive)
+    if not reaches_archive(FDS_ARCHIVE.c.date, date):
+        return rows
+    cold = FDS_ARCHIVE.c
+    latest = {r.truck_plate: r for r in latest_before(FDS_ARCHIVE, cold.truck_plate, cold.date, date, inclusive=inclusive)}
+    for r in rows:
+        if r.truck_plate not in latest or r.date >= latest[r.truck_plate].date:
+            latest[r.truck_plate] = r
+    return list(latest.values())
+
 @app.route('/api/initial-data')
 @login_required
 def get_initial_data():
     try:
-        # print("DEBUG: Invocando get_initial_data")
-        # Ensure schema is up to date if _db_initialized logic failed?
-        # Manually triggering helper check? No, rely on before_request.
-        
-        # Helper to safely serialize
-        def safe_dict(obj, model_name):
-            try:
-                return obj.to_dict()
-            except Exception as e:
-                print(f"ERROR serializing {model_name} ID {getattr(obj, 'id', 'unknown')}: {e}")
-                raise e
-
-        trucks = [safe_dict(t, 'Truck') for t in Truck.query.all()]
-        # print(f"DEBUG: {len(trucks)} camiones cargados.")
-        
-        trips = [safe_dict(t, 'Trip') for t in Trip.query.all()]
-        # print(f"DEBUG: {len(trips)} viajes cargados.")
-
-        drivers = [safe_dict(d, 'Driver') for d in Driver.query.all()]
-        trailers = [safe_dict(t, 'Trailer') for t in Trailer.query.all()]
+        # Optional date window (?from=YYYY-MM-DD&to=YYYY-MM-DD). Without it we keep
+        # returning the full tables for older clients.
+        try:
+            date_from = parse_date_arg('from')
+            date_to = parse_date_arg('to')
+        except ValueError:
+            return jsonify({'error': 'from/to must be YYYY-MM-DD'}), 400
+        if bool(date_from) != bool(date_to) or (date_from and date_from > date_to):
+            return jsonify({'error': 'from and to must be given together and from <= to'}), 400
         
-        fds_records = [
-            {'plate': r.truck_plate, 'date': r.date, 'is_out_of_service': r.is_out_of_service} 
-            for r in TruckFds.query.all()
-        ]
-        return jsonify({'trucks': trucks, 'trips': trips, 'fds_data': fds_records, 'drivers': drivers, 'trailers': trailers})
+        # Read the revision before the rows: anything committed meanwhile is
+        # simply sent again by the next /api/changes call.
+        revision = current_revision()
+        # Every table in this payload is covered by the revision
+        tag = f"initial-{revision}-{date_from or ''}-{date_to or ''}"
+        cached = not_modified(tag)
+        if cached:
+            return cached
+
+        # Plain column rows instead of ORM objects: no identity map or instance
+        # state for tens of thousands of trips, and no to_dict() per object.
+        if date_from:
+            # Trucks alive at some point of the window
+            trucks = trucks_with_history(
+                Truck.creation_date <= date_to,
+                or_(Truck.deletion_date == None, Truck.deletion_date == '', Truck.deletion_date > date_from)
+            )
+            trips = field_dicts(TRIP_FIELDS, Trip.load_date <= date_to, Trip.unload_date >= date_from)
+            if reaches_archive(TRIP_ARCHIVE.c.unload_date, date_from):
+                cold = TRIP_ARCHIVE.c
+                trips += field_dicts(archive_fields(TRIP_FIELDS, TRIP_ARCHIVE),
+                                     cold.load_date <= date_to, cold.unload_date >= date_from)
+            # Positions changing inside the window, plus where each truck entered it
+            positions = field_dicts(POSITION_FIELDS, TruckPosition.date >= date_from, TruckPosition.date <= date_to,
+                                    split=('zones',))
+            positions += map(position_dict, latest_before(TruckPosition, TruckPosition.truck_plate, TruckPosition.date, date_from))
+            # FDS days inside the window, plus the state each truck had entering it
+            fds_rows = table_rows(TruckFds, TruckFds.date >= date_from, TruckFds.date <= date_to)
+            if reaches_archive(FDS_ARCHIVE.c.date, date_from):
+                fds_rows += table_rows(FDS_ARCHIVE, FDS_ARCHIVE.c.date >= date_from, FDS_ARCHIVE.c.date <= date_to)
+            fds_rows += fds_before(date_from)
+        else:
+            # Without a window: the hot tables only, archived rows are not sent
+            trucks = trucks_with_history()
+            trips = field_dicts(TRIP_FIELDS)
+            positions = field_dicts(POSITION_FIELDS, split=('zones',))
+            fds_rows = table_rows(TruckFds)
+
+        # Driver/Trailer to_dict() keys are their column names
+        drivers = [dict(r._mapping) for r in table_rows(Driver)]
+        trailers = [dict(r._mapping) for r in table_rows(Trailer)]
+
+        return with_etag(stream_jsonify({
+            'trucks': trucks, 'trips': trips, 'fds_data': map(fds_dict, fds_rows), 'drivers': drivers,
+            'trailers': trailers, 'positions': positions, 'revision': revision,
+            'window': {'from': date_from, 'to': date_to} if date_from else None
+        }), tag)
     except Exception as e:
         print(f"CRITICAL ERROR in get_initial_data: {e}")
         import traceback
         traceback.print_exc()
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/trucks', methods=['POST'])
+@app.route('/api/changes')
 @login_required
-def save_truck():
-    d = request.json
-    t = Truck.query.filter_by(plate=d.get('plate')).first()
-    if not t:
-        t = Truck(plate=d.get('plate'))
-        db.session.add(t)
+def get_changes():
+    """Rows upserted or deleted after revision ?since=, collapsed to their latest state."""
+    since = request.args.get('since', type=int)
+    if since is None:
+        return jsonify({'error': 'since is required'}), 400
+    revision = current_revision()
+    if since > revision:
+        # The client saw a revision this database never had (restored DB, etc.)
+        return jsonify({'revision': revision, 'reset': True})
+
+    latest = {}
+    rows = db.session.execute(
+        db.select(ChangeLog.entity, ChangeLog.entity_key, ChangeLog.op)
+        .where(ChangeLog.rev > since, ChangeLog.rev <= revision)
+        .order_by(ChangeLog.rev, ChangeLog.id)
+    )
+    for entity, key, op in rows:
+        latest[(entity, key)] = op
+        if len(latest) > SYNC_MAX_CHANGES:
+            return jsonify({'revision': revision, 'reset': True})
+
+    upserts = {entity: [] for entity in SYNC_ENTITIES.values()}
+    deleted = {entity: [] for entity in SYNC_ENTITIES.values()}
+    for (entity, key), op in latest.items():
+        (upserts if op == 'upsert' else deleted)[entity].append(key)
+
+    result = {'revision': revision, 'reset': False, 'deleted': {}}
+    found = {
+        'trucks': {t.plate: t.to_dict() for t in Truck.query.options(selectinload(Truck.history_entries))
+                   .filter(Truck.plate.in_(upserts['trucks']))} if upserts['trucks'] else {},
+        'trips': {str(t.id): t.to_dict() for t in Trip.query.filter(Trip.id.in_([int(k) for k in upserts['trips']]))} if upserts['trips'] else {},
+        'drivers': {str(d.id): d.to_dict() for d in Driver.query.filter(Driver.id.in_([int(k) for k in upserts['drivers']]))} if upserts['drivers'] else {},
+        'trailers': {str(t.id): t.to_dict() for t in Trailer.query.filter(Trailer.id.in_([int(k) for k in upserts['trailers']]))} if upserts['trailers'] else {},
+        'fds_data': {f'{r.truck_plate}|{r.date}': fds_dict(r) for r in TruckFds.query.filter(
+            tuple_(TruckFds.truck_plate, TruckFds.date).in_([tuple(k.split('|', 1)) for k in upserts['fds_data']])
+        )} if upserts['fds_data'] else {},
+        'positions': {f'{p.truck_plate}|{p.date}': p.to_dict() for p in TruckPosition.query.filter(
+            tuple_(TruckPosition.truck_plate, TruckPosition.date).in_([tuple(k.split('|', 1)) for k in upserts['positions']])
+        )} if upserts['positions'] else {},
+    }
+    for entity in SYNC_ENTITIES.values():
+        result[entity] = [found[entity][k] for k in upserts[entity] if k in found[entity]]
+        # An upsert whose row is gone was removed outside the ORM: treat it as deleted
+        gone = deleted[entity] + [k for k in upserts[entity] if k not in found[entity]]
+        if entity in ('fds_data', 'positions'):
+            gone = [dict(zip(('plate', 'date'), k.split('|', 1))) for k in gone]
+        elif entity != 'trucks':
+            gone = [int(k) for k in gone]
+        result['deleted'][entity] = gone
+    return jsonify(result)
+
+@app.route('/api/positions')
+@login_required
+def get_positions():
+    """Where every truck is on ?date= (its latest position row on or before it)."""
+    try:
+        date = parse_date_arg('date')
+    except ValueError:
+        date = None
+    if not date:
+        return jsonify({'error': 'date must be YYYY-MM-DD'}), 400
+    tag = f'positions-{current_revision()}-{date}'
+    cached = not_modified(tag)
+    if cached:
+        return cached
+    latest = latest_before(TruckPosition, TruckPosition.truck_plate, TruckPosition.date, date, inclusive=True)
+    return with_etag(jsonify({p.truck_plate: position_dict(p) for p in latest}), tag)
+
+# --- TABLERO POR DÍA (snapshot materializado) ---
+# What renderPlanning() draws for one day, resolved on the server and cached
+# in board_snapshot. Writes never touch the cache: change_log says which days
+# each revision touched, so a read only rebuilds a day something changed on.
+BOARD_ENTITIES = ('trucks', 'trips', 'fds_data', 'positions')
+
+def build_board(date, revision):
+    """The board payload for `date` (trucks x slots), as a dict."""
+    trucks = trucks_with_history(
+        Truck.creation_date <= date,
+        or_(Truck.deletion_date == None, Truck.deletion_date == '', Truck.deletion_date > date)
+    )
+    out_of_service = {r.truck_plate: r.is_out_of_service for r in fds_before(date, inclusive=True)}
+    positions = {r.truck_plate: r for r in
+                 latest_before(TruckPosition, TruckPosition.truck_plate, TruckPosition.date, date, inclusive=True)}
+    trips = {}
+    assigned = field_dicts(TRIP_FIELDS, Trip.load_date == date, Trip.assigned_truck_plate != None)
+    if reaches_archive(TRIP_ARCHIVE.c.unload_date, date):
+        cold = TRIP_ARCHIVE.c
+        assigned += field_dicts(archive_fields(TRIP_FIELDS, TRIP_ARCHIVE), cold.load_date == date,
+                                cold.assigned_truck_plate != None)
+    for t in assigned:
+        trips.setdefault(t['assignedTruck'], []).append(t)
+
+    rows = []
+    for truck in trucks:
+        history = truck['history']
+        effective = None
+        for entry in history:  # sorted by date
+            if entry['date'] > date:
+                break
+            effective = entry
+        resolved = resolve_truck(truck, effective, date)
+        del resolved['history']
+        # Like getTruckSuggestedLocation: the latest position on or before the day wins
+        position = positions.get(resolved['plate'])
+        if position:
+            resolved['location'] = position.location
+            resolved['zones'] = position.zones_str.split(',') if position.zones_str else []
+        assigned = trips.get(resolved['plate'], [])
+        pg, ep, pp = (sum(t[key] or 0 for t in assigned) for key in ('pg', 'ep', 'pp'))
+        slots = {}
+        for t in assigned:
+            if t['assignedSlot'] is not None:
+                slots.setdefault(str(t['assignedSlot']), []).append(t)
+        resolved.update({
+            'outOfService': bool(out_of_service.get(resolved['plate'])),
+            'slots': slots,
+            # Per-trip CR added up, like renderPlanning's totalTruckCR
+            'totals': {'cr': round(sum(trip_cr(t['pg'], t['ep'], t['pp']) for t in assigned), 2),
+                       'pg': pg, 'ep': ep, 'pp': pp},
+        })
+        rows.append(resolved)
+    # In-service trucks first, each group by plate
+    rows.sort(key=lambda r: (r['outOfService'], r['plate']))
+    return {'date': date, 'revision': revision, 'trucks': rows}
+
+def board_touched(date, since, revision):
+    """True if a revision in (since, revision] changed something shown on `date`'s board."""
+    return db.session.execute(
+        db.select(ChangeLog.id).where(
+            ChangeLog.rev > since, ChangeLog.rev <= revision, ChangeLog.entity.in_(BOARD_ENTITIES),
+            or_(ChangeLog.touch_from == None, ChangeLog.touch_from <= date),
+            or_(ChangeLog.touch_to == None, ChangeLog.touch_to >= date),
+        ).limit(1)
+    ).first() is not None
+
+def store_snapshot(model, date, built_rev, revision, payload):
+    """Best effort: a lost race or a busy database only costs a rebuild later."""
+    table = model.__table__
+    try:
+        # End the read transaction first so the write starts on a fresh one
+        db.session.commit()
+        # payload None: the stored payload still holds, only move its rev forward
+        values = {'rev': revision} if payload is None else {'built_rev': built_rev, 'rev': revision, 'payload': payload}
+        updated = db.session.execute(table.update().where(table.c.date == date, table.c.rev < revision)
+                                     .values(**values)).rowcount
+        if not updated and payload is not None and \
+                not db.session.execute(db.select(table.c.date).where(table.c.date == date)).first():
+            db.session.execute(table.insert().values(date=date, **values))
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        print(f"No se pudo guardar {model.__tablename__} de {date}: {e}")
+
+def day_snapshot(model, date, build):
+    """(built_rev, JSON payload) for `date`: the stored one while change_log shows
+    nothing touching the day since it was built, else build(date, revision)."""
+    # Read the revision before the rows (see get_initial_data)
+    revision = current_revision()
+    snapshot = db.session.get(model, date)
+    if snapshot and (snapshot.rev >= revision or not board_touched(date, snapshot.rev, revision)):
+        built_rev, payload = snapshot.built_rev, snapshot.payload
+        if snapshot.rev < revision:
+            store_snapshot(model, date, built_rev, revision, None)
+    else:
+        built_rev = revision
+        payload = app.json.dumps(build(date, revision), separators=(',', ':'))
+        store_snapshot(model, date, built_rev, revision, payload)
+    return built_rev, payload
+
+@app.route('/api/board')
+@login_required
+def get_board():
+    """The planning board of ?date=: active trucks resolved for the day, FDS flag,
+    position and their trips per slot. Served from board_snapshot when nothing
+    that day shows has changed since it was built."""
+    try:
+        date = parse_date_arg('date')
+    except ValueError:
+        date = None
+    if not date:
+        return jsonify({'error': 'date must be YYYY-MM-DD'}), 400
+    built_rev, payload = day_snapshot(BoardSnapshot, date, build_board)
+    # The tag only moves when this day's board does
+    tag = f'board-{date}-{built_rev}'
+    cached = not_modified(tag)
+    if cached:
+        return cached
+    return with_etag(Response(payload + '\n', mimetype=app.json.mimetype), tag)
+
+# --- CONTADORES DEL DÍA ---
+# renderZoneCounters() and the pallet totals, aggregated in SQL. They show
+# the same things as the board (trips of the day, trucks, FDS, positions),
+# so they are cached in day_stats with the board's invalidation.
+# A trailer takes 33 europallets per leg (departure / return); CR counts the
+# load in those units
+TRUCK_CAPACITY_CR = 33
+
+def pallet_load():
+    return {'trips': 0, 'pg': 0, 'ep': 0, 'pp': 0, 'cr': 0}
+
+def zone_counters():
+    return {'trucks': 0, 'pending': {'departure': 0, 'return': 0}, 'assigned': {'departure': 0, 'return': 0}}
+
+def build_day_stats(date, revision):
+    """Counters of `date`: trips per zone and destination zone, load per truck and
+    unassigned load per type, urgent/groupage totals, trucks available per zone."""
+    trips = trip_source(date, lambda t: (t.c.load_date == date,)).c
+    cr = func.coalesce(trips.pg, 0) * 1.0 + func.coalesce(trips.ep, 0) * 0.8 + func.coalesce(trips.pp, 0) * 0.666
+    # Each trip rounded before summing, like the board (trip_cr, getTripCR). With
+    # whole pallets the third decimal is always even, so round() never meets the
+    # .xx5 ties where it and Math.round could differ.
+    cr = func.round(cr, 2)
+    groups = db.session.execute(db.select(
+        trips.assigned_truck_plate, trips.type, trips.zone, trips.destination_zone, func.count(),
+        func.sum(func.coalesce(trips.pg, 0)), func.sum(func.coalesce(trips.ep, 0)), func.sum(func.coalesce(trips.pp, 0)),
+        func.sum(cr), func.sum(case((trips.is_urgent == True, 1), else_=0)),
+        func.sum(case((trips.is_groupage == True, 1), else_=0)),
+    ).where(trips.load_date == date)
+        .group_by(trips.assigned_truck_plate, trips.type, trips.zone, trips.destination_zone))
+
+    zones = {}
+    destination_zones = {}
+    loads = {}
+    unassigned = {'departure': pallet_load(), 'return': pallet_load()}
+    totals = {'trips': 0, 'urgent': 0, 'groupage': 0}
+    for plate, kind, zone, destination_zone, count, pg, ep, pp, load_cr, urgent, groupage in groups:
+        if zone:
+            side = zones.setdefault(zone, zone_counters())['assigned' if plate else 'pending']
+            side[kind] = side.get(kind, 0) + count
+        if destination_zone:
+            destination_zones[destination_zone] = destination_zones.get(destination_zone, 0) + count
+        if plate:
+            load = loads.setdefault(plate, {'departure': pallet_load(), 'return': pallet_load()}) \
+                .setdefault(kind, pallet_load())
+        else:
+            load = unassigned.setdefault(kind, pallet_load())
+        # float(): PostgreSQL sums the CR expression as NUMERIC
+        for key, value in (('trips', count), ('pg', pg), ('ep', ep), ('pp', pp), ('cr', float(load_cr or 0))):
+            load[key] += value or 0
+        totals['trips'] += count
+        totals['urgent'] += urgent or 0
+        totals['groupage'] += groupage or 0
+    for load in unassigned.values():
+        load['cr'] = round(load['cr'], 2)
+    for legs in loads.values():
+        for load in legs.values():
+            load['cr'] = round(load['cr'], 2)
+            load['free'] = round(TRUCK_CAPACITY_CR - load['cr'], 2)
+
+    # Trucks per zone as renderZoneCounters: active and in service, counted in
+    # each of their manual or suggested zones. The board already resolved them.
+    _, board = day_snapshot(BoardSnapshot, date, build_board)
+    for truck in json.loads(board)['trucks']:
+        if truck['outOfService']:
+            continue
+        for zone in set(truck['zones']) | set(truck.get('manualZones') or []):
+            if zone in ZONES:
+                zones.setdefault(zone, zone_counters())['trucks'] += 1
+    return {'date': date, 'revision': revision, 'capacity': TRUCK_CAPACITY_CR, 'zones': zones,
+            'destinationZones': destination_zones, 'trucks': loads, 'unassigned': unassigned, **totals}
+
+@app.route('/api/stats/day')
+@login_required
+def get_day_stats():
+    """Counters of ?date= (see build_day_stats), cached like the board."""
+    try:
+        date = parse_date_arg('date')
+    except ValueError:
+        date = None
+    if not date:
+        return jsonify({'error': 'date must be YYYY-MM-DD'}), 400
+    built_rev, payload = day_snapshot(DayStats, date, build_day_stats)
+    tag = f'stats-{date}-{built_rev}'
+    cached = not_modified(tag)
+    if cached:
+        return cached
+    return with_etag(Response(payload + '\n', mimetype=app.json.mimetype), tag)
+
+# --- AUTO-ASIGNACIÓN ---
+# A truck and slot for every unassigned trip of a day, chosen all at once as
+# an assignment problem (autoassign.py) over the free slots of the board.
+# Nothing is written: the answer carries the /api/batch ops that apply the
+# plan in one commit, versions included, so a trip someone moved meanwhile
+# comes back as a 409 instead of being overwritten.
+# Costs of a (trip, slot) pair; the lowest total wins
+ASSIGN_COST_SAME_LOCATION = 0   # the truck is where the trip loads
+ASSIGN_COST_SAME_ZONE = 20      # ... or in the zone of the load
+ASSIGN_COST_OTHER_ZONE = 100    # it has to drive there empty
+ASSIGN_COST_SECOND_ROUND = 10   # slots 2/3: a second round trip that day
+ASSIGN_COST_NOT_URGENT = 1000   # when slots run short, urgent trips go first
+# A groupage also pays the CR the slot keeps free after it (best fit packing)
+
+def assign_place(truck, slot, planned):
+    """(location, zones) of the truck when `slot` starts: where the trip of its
+    previous slot ends (already on the board or planned in this run), else the
+    truck's position of the day, manual location first, as the board shows it."""
+    for before in range(slot - 1, -1, -1):
+        trips = truck['slots'].get(str(before)) or planned.get((truck['plate'], before))
+        if trips:
+            last = trips[-1]
+            return (last['destination'] or '').lower(), set(position_zones(last['destination'], last['destinationZone']))
+    return ((truck.get('manualLocation') or truck['location'] or '').lower(),
+            set(truck.get('manualZones') or truck['zones']))
+
+def assign_load(trip):
+    """What assign_cost() needs of a trip, worked out once per trip, not per slot."""
+    return {'origin': (trip['origin'] or '').lower(), 'zones': set(position_zones(trip['origin'], trip['zone'])),
+            'cr': trip_cr(trip['pg'], trip['ep'], trip['pp']), 'groupage': trip['isGroupage'],
+            'base': 0 if trip['isUrgent'] else ASSIGN_COST_NOT_URGENT}
+
+def assign_cost(load, column):
+    """Cost of putting a trip (its assign_load()) in free slot `column`, None if
+    the board forbids it: a full load needs an empty slot, a groupage one
+    without a full load and room left for its CR."""
+    if column['shared'] and not load['groupage']:
+        return None
+    cost = load['base']
+    if load['groupage']:
+        left = column['free'] - load['cr']
+        if left < 0:
+            return None
+        cost += round(left)
+    if column['slot'] >= 2:
+        cost += ASSIGN_COST_SECOND_ROUND
+    if load['origin'] and load['origin'] == column['location']:
+        return cost + ASSIGN_COST_SAME_LOCATION
+    if column['zones'] & load['zones']:
+        return cost + ASSIGN_COST_SAME_ZONE
+    return cost + ASSIGN_COST_OTHER_ZONE
+
+def auto_assign_plan(date):
+    """Proposed (trip, plate, slot, cost) for the unassigned trips of `date`, and
+    the ids left over. Departures are solved first, so a return can follow the
+    departure just planned on the same truck."""
+    _, board = day_snapshot(BoardSnapshot, date, build_board)
+    trucks = [t for t in json.loads(board)['trucks'] if not t['outOfService']]
+    trips = field_dicts(TRIP_FIELDS, Trip.load_date == date, Trip.assigned_truck_plate == None)
+    trips.sort(key=lambda t: t['id'])
+    planned = {}
+    plan = []
+    for kind, parity in (('departure', 0), ('return', 1)):
+        rows = [t for t in trips if t['type'] == kind]
+        columns = []
+        for truck in trucks:
+            for slot in range(parity, 4, 2):
+                in_slot = truck['slots'].get(str(slot), [])
+                if any(not t['isGroupage'] for t in in_slot):
+                    continue
+                location, zones = assign_place(truck, slot, planned)
+                columns.append({'plate': truck['plate'], 'slot': slot, 'shared': bool(in_slot), 'location': location,
+                                'zones': zones,
+                                'free': TRUCK_CAPACITY_CR - sum(trip_cr(t['pg'], t['ep'], t['pp']) for t in in_slot)})
+        cost = [[assign_cost(load, c) for c in columns] for load in map(assign_load, rows)]
+        for i, j in autoassign.solve(cost) if rows and columns else []:
+            trip, column = rows[i], columns[j]
+            planned[(column['plate'], column['slot'])] = [trip]
+            plan.append((trip, column['plate'], column['slot'], cost[i][j]))
+    placed = {trip['id'] for trip, _, _, _ in plan}
+    return plan, [t['id'] for t in trips if t['id'] not in placed]
+
+@app.route('/api/auto-assign', methods=['POST'])
+@login_required
+def auto_assign():
+    """Proposed assignment of the unassigned trips of ?date= (see auto_assign_plan).
+    Read only: POST the returned ops to /api/batch to accept the whole plan."""
+    try:
+        date = parse_date_arg('date')
+    except ValueError:
+        date = None
+    if not date:
+        return jsonify({'error': 'date must be YYYY-MM-DD'}), 400
+    revision = current_revision()
+    plan, unassigned = auto_assign_plan(date)
+    return jsonify({
+        'date': date, 'revision': revision, 'solver': autoassign.SOLVER,
+        'plan': [{'id': trip['id'], 'plate': plate, 'slot': slot, 'cost': cost} for trip, plate, slot, cost in plan],
+        'unassigned': unassigned,
+        'ops': [{'entity': 'trip', 'op': 'upsert', 'data': dict(trip, assignedTruck=plate, assignedSlot=slot)}
+                for trip, plate, slot, _ in plan],
+    })
+
+# Each open stream holds one worker thread for as long as the board stays
+# open. Past this many per worker the stream is refused and the board polls
+# /api/changes instead, so logins and saves always find a free thread.
+# gunicorn.conf.py sets it from its thread count; keep it below that.
+SSE_MAX_STREAMS = env_int('SSE_MAX_STREAMS', 8)
+SSE_REFUSED_RETRY = env_int('SSE_REFUSED_RETRY', 60)  # seconds
+_open_streams = 0
+_open_streams_lock = threading.Lock()
+
+def release_stream():
+    global _open_streams
+    with _open_streams_lock:
+        _open_streams -= 1
+
+@app.route('/api/stream')
+@login_required
+def stream_events():
+    """Server-Sent Events: one 'change' message per committed write, from any
+    worker, and a 'notification' one per batch of alerts sent."""
+    global _open_streams
+    with _open_streams_lock:
+        full = _open_streams >= SSE_MAX_STREAMS
+        if not full:
+            _open_streams += 1
+    if full:
+        return Response('Too many live streams, poll /api/changes\n', status=503, mimetype='text/plain',
+                        headers={'Retry-After': str(SSE_REFUSED_RETRY)})
+
+    def generate():
+        yield 'retry: 3000\n\n'
+        for e in broker.subscribe():
+            if e is None:
+                yield ': keepalive\n\n'
+                continue
+            if e.get('notifications'):
+                yield f"event: notification\ndata: {json.dumps(e['notifications'])}\n\n"
+                continue
+            rev_line = f"id: {e['revision']}\n" if e.get('revision') is not None else ''
+            yield f"{rev_line}event: change\ndata: {json.dumps(e)}\n\n"
+    response = Response(generate(), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    # The server closes the response when the client goes away (noticed at the
+    # next keepalive at the latest), even if the generator never started
+    response.call_on_close(release_stream)
+    return response
+
+def version_conflict(row, d):
+    """True if the client sent the version it edited and the row has moved on since."""
+    return row is not None and d.get('version') is not None and d.get('version') != row.version
+
+def conflict_response(row, **extra):
+    return jsonify({'error': 'conflict', 'current': row.to_dict() if row else None, **extra}), 409
+
+def apply_truck_payload(t, d):
+    """Copies a client truck dict onto a Truck row (shared by save_truck and /api/batch)."""
     t.location = d.get('location', '')
     t.location_last_updated = d.get('locationLastUpdatedDate', '2000-01-01')
     t.creation_date = d.get('creationDate', '2000-01-01')
@@ -408,59 +2044,21 @@ def save_truck():
     # If not provided, we assume it's an update to the "current" state (which we still mirror in main cols).
     effective_date = d.get('effectiveDate')
     if effective_date:
-        import json
-        try:
-            history = json.loads(t.history_str or '[]')
-        except:
-            history = []
-            
-        # Create new history entry
-        new_entry = {
-            'date': effective_date,
-            'trailer': t.trailer,
-            'driverName': t.driver_name,
-            'driverPhone': t.driver_phone,
-            'driverDni': t.driver_dni,
-            'driverAlias': t.driver_alias,
-            'manualLocation': t.manual_location,
-            'manualZones': t.manual_zones_str.split(',') if t.manual_zones_str else []
-        }
-        
-        # Remove existing entry for this date if any
-        history = [h for h in history if h.get('date') != effective_date]
-        history.append(new_entry)
-        
-        # Sort by date
-        history.sort(key=lambda x: x.get('date'))
-        
-        t.history_str = json.dumps(history)
-
-    db.session.commit()
-    return jsonify(t.to_dict())
-
-@app.route('/api/trucks/<string:plate>', methods=['DELETE'])
-@login_required
-def delete_truck(plate):
-    # This endpoint might remain unused if we only use soft-delete via save_truck, 
-    # but good to have for cleanup if needed.
-    t = Truck.query.filter_by(plate=plate).first()
-    if t:
-        db.session.delete(t)
-        db.session.commit()
-    return jsonify({'success': True})
-
-@app.route('/api/trips', methods=['POST'])
-@login_required
-def save_trip():
-    d = request.json
-    tid = d.get('id')
-    t = Trip.query.get(tid) if tid else None
-    if not t:
-        t = Trip()
-        db.session.add(t)
-    
-    # print(f"DEBUG: Guardando viaje. ID: {tid}, Datos: {d}")
-    
+        # Single-row upsert on (plate, date)
+        h = next((h for h in t.history_entries if h.date == effective_date), None)
+        if not h:
+            h = TruckHistory(truck_plate=t.plate, date=effective_date)
+            t.history_entries.append(h)
+        h.trailer = t.trailer
+        h.driver_name = t.driver_name
+        h.driver_phone = t.driver_phone
+        h.driver_dni = t.driver_dni
+        h.driver_alias = t.driver_alias
+        h.manual_location = t.manual_location
+        h.manual_zones_str = t.manual_zones_str
+
+def apply_trip_payload(t, d):
+    """Copies a client trip dict onto a Trip row (shared by save_trip and /api/batch)."""
     t.type = d.get('type')
     t.client = d.get('client')
     t.driver = d.get('driver')
@@ -483,9 +2081,105 @@ def save_trip():
     
     t.notify_time = d.get('notifyTime', '')
     t.is_notified = d.get('isNotified', False)
+
+def remove_truck(t):
+    """Hard delete: drops its FDS/history/positions, unassigns its trips, then deletes the truck.
+
+    Everything runs as set-based statements; returns the row counts.
+    """
+    plate = t.plate
+    changes = []
+    # 1. Delete associated FDS records (Out of Service History)
+    fds_dates = db.session.execute(db.select(TruckFds.date).where(TruckFds.truck_plate == plate)).scalars().all()
+    fds_count = db.session.execute(db.delete(TruckFds).where(TruckFds.truck_plate == plate)
+                                   .execution_options(synchronize_session=False)).rowcount
+    # The truck keeps no row after any of them: each one touched the board from its day on
+    changes += [('fds_data', f'{plate}|{d}', 'delete', d, None) for d in fds_dates]
+
+    # 2. Unassign associated Trips (Set assigned_truck_plate to NULL)
+    trips = db.session.execute(
+        db.select(Trip.id, Trip.assigned_truck_plate, Trip.unload_date, Trip.load_date)
+        .where(Trip.assigned_truck_plate == plate)
+        .with_for_update()
+    ).all()
+    trip_count = bulk_update_trips(trips, {'assigned_truck_plate': None, 'assigned_slot': None}, positions=False)
+
+    # 3. Its history and positions (with no trips left it has none)
+    db.session.execute(db.delete(TruckHistory).where(TruckHistory.truck_plate == plate)
+                       .execution_options(synchronize_session=False))
+    # A loaded collection would have the delete cascade remove those rows again
+    db.session.expire(t, ['history_entries'])
+    position_dates = db.session.execute(db.select(TruckPosition.date).where(TruckPosition.truck_plate == plate)).scalars().all()
+    db.session.execute(db.delete(TruckPosition).where(TruckPosition.truck_plate == plate)
+                       .execution_options(synchronize_session=False))
+    changes += [('positions', f'{plate}|{d}', 'delete', d, None) for d in position_dates]
+    record_changes(db.session, changes)
+        
+    # 4. Now safe to delete the truck
+    db.session.delete(t)
+    return {'fds': fds_count, 'trips': trip_count}
+
+@app.route('/api/trucks', methods=['POST'])
+@login_required
+def save_truck():
+    d = request.json
+    t = Truck.query.filter_by(plate=d.get('plate')).first()
+    if version_conflict(t, d):
+        return conflict_response(t)
+    if not t:
+        t = Truck(plate=d.get('plate'))
+        db.session.add(t)
+    apply_truck_payload(t, d)
+    try:
+        db.session.commit()
+    except StaleDataError:
+        # Someone else committed between our read and our UPDATE
+        db.session.rollback()
+        return conflict_response(Truck.query.filter_by(plate=d.get('plate')).first())
+    return jsonify(t.to_dict())
+
+@app.route('/api/trucks/<string:plate>/as-of')
+@login_required
+def truck_as_of_date(plate):
+    """Truck data resolved for ?date= using the (plate, date) history index."""
+    try:
+        date = parse_date_arg('date')
+    except ValueError:
+        date = None
+    if not date:
+        return jsonify({'error': 'date must be YYYY-MM-DD'}), 400
+    t = Truck.query.filter_by(plate=plate).first()
+    if not t:
+        return jsonify({'error': 'Truck not found'}), 404
+    return jsonify(truck_as_of(t, date))
+
+@app.route('/api/trucks/<string:plate>', methods=['DELETE'])
+@login_required
+def delete_truck(plate):
+    # This endpoint might remain unused if we only use soft-delete via save_truck, 
+    # but good to have for cleanup if needed. The version may come as ?version=.
+    d = request.get_json(silent=True) or {'version': request.args.get('version', type=int)}
+    return hard_delete_truck(plate, d)
+
+@app.route('/api/trips', methods=['POST'])
+@login_required
+def save_trip():
+    d = request.json
+    tid = d.get('id')
+    t = Trip.query.get(tid) if tid else None
+    if version_conflict(t, d):
+        return conflict_response(t)
+    if not t:
+        t = Trip()
+        db.session.add(t)
     
-    db.session.commit()
-    # print(f"DEBUG: Viaje guardado correctamente. ID: {t.id}")
+    apply_trip_payload(t, d)
+    try:
+        db.session.commit()
+    except StaleDataError:
+        # Someone else committed between our read and our UPDATE
+        db.session.rollback()
+        return conflict_response(db.session.get(Trip, tid))
     return jsonify(t.to_dict())
 
 @app.route('/api/trips/<int:tid>', methods=['DELETE'])
@@ -501,13 +2195,30 @@ def delete_trip(tid):
 @login_required
 def notes():
     if request.method == 'GET':
-        n = DailyNote.query.filter_by(date=request.args.get('date'), type=request.args.get('type')).first()
-        return jsonify({'content': n.content if n else ''})
+        date, note_type = request.args.get('date'), request.args.get('type')
+        table, prefix = DailyNote.__table__, 'note'
+        n = db.session.execute(
+            db.select(table.c.id, table.c.version).where(table.c.date == date, table.c.type == note_type)
+        ).first()
+        if not n and date and reaches_archive(NOTE_ARCHIVE.c.date, date):
+            # A note saved again after being archived lives in the hot table and wins
+            table, prefix = NOTE_ARCHIVE, 'note-archive'
+            n = db.session.execute(
+                db.select(table.c.id, table.c.version).where(table.c.date == date, table.c.type == note_type)
+            ).first()
+        tag = f'{prefix}-{n.id}-{n.version}' if n else 'note-none'
+        cached = not_modified(tag)
+        if cached:
+            return cached
+        content = db.session.execute(db.select(table.c.content).where(table.c.id == n.id)).scalar() if n else ''
+        return with_etag(jsonify({'content': content or ''}), tag)
     d = request.json
     n = DailyNote.query.filter_by(date=d.get('date'), type=d.get('type')).first()
     if not n:
         n = DailyNote(date=d.get('date'), type=d.get('type'))
         db.session.add(n)
+    else:
+        n.version = DailyNote.version + 1
     n.content = d.get('content', '')
     db.session.commit()
     return jsonify({'success': True})
@@ -535,21 +2246,134 @@ def delete_truck_via_post():
     plate = d.get('plate')
     if not plate:
         return jsonify({'error': 'Plate is required'}), 400
+    return hard_delete_truck(plate, d)
+
+def hard_delete_truck(plate, d):
+    """Both delete endpoints: the version check of /api/batch, then remove_truck."""
     t = Truck.query.filter_by(plate=plate).first()
+    if version_conflict(t, d):
+        return conflict_response(t)
+    counts = {'fds': 0, 'trips': 0}
     if t:
-        # 1. Delete associated FDS records (Out of Service History)
-        TruckFds.query.filter_by(truck_plate=plate).delete()
-        
-        # 2. Unassign associated Trips (Set assigned_truck_plate to NULL)
-        trips = Trip.query.filter_by(assigned_truck_plate=plate).all()
-        for trip in trips:
-            trip.assigned_truck_plate = None
-            trip.assigned_slot = None
-            
-        # 3. Now safe to delete the truck
-        db.session.delete(t)
+        counts = remove_truck(t)
         db.session.commit()
-    return jsonify({'success': True})
+    return jsonify({'success': True, 'counts': counts})
+
+BATCH_MAX_OPS = 1000
+
+class BatchConflict(Exception):
+    def __init__(self, index, row):
+        super().__init__(f'Version conflict at op {index}')
+        self.index = index
+        self.row = row
+
+@app.route('/api/batch', methods=['POST'])
+@login_required
+def batch():
+    """Applies a list of trip/truck/FDS upserts and deletes in one transaction.
+
+    Body: {"ops": [{"entity": "trip"|"truck"|"fds", "op": "upsert"|"delete", "data": {...}}, ...]}
+    The rows each op touches are fetched with one query per model, all
+    writes go out in a single flush and there is one commit for the whole
+    list. Any invalid op rolls everything back.
+    """
+    ops = (request.json or {}).get('ops')
+    if not isinstance(ops, list) or not ops:
+        return jsonify({'error': 'ops must be a non-empty list'}), 400
+    if len(ops) > BATCH_MAX_OPS:
+        return jsonify({'error': f'At most {BATCH_MAX_OPS} ops per batch'}), 400
+    for i, o in enumerate(ops):
+        if not isinstance(o, dict) or o.get('entity') not in ('trip', 'truck', 'fds') \
+                or o.get('op') not in ('upsert', 'delete') or not isinstance(o.get('data'), dict):
+            return jsonify({'error': f'Invalid op at index {i}'}), 400
+
+    def data_of(entity):
+        return [o['data'] for o in ops if o['entity'] == entity]
+
+    trip_ids = {d['id'] for d in data_of('trip') if d.get('id')}
+    plates = {d['plate'] for d in data_of('truck') if d.get('plate')}
+    fds_keys = {(d.get('plate'), d.get('date')) for d in data_of('fds')}
+    trips_by_id = {t.id: t for t in Trip.query.filter(Trip.id.in_(trip_ids))} if trip_ids else {}
+    trucks_by_plate = {t.plate: t for t in Truck.query.options(selectinload(Truck.history_entries))
+                       .filter(Truck.plate.in_(plates))} if plates else {}
+    fds_by_key = {(r.truck_plate, r.date): r for r in TruckFds.query.filter(
+        tuple_(TruckFds.truck_plate, TruckFds.date).in_(fds_keys))} if fds_keys else {}
+
+    touched = []
+    try:
+        with db.session.no_autoflush:
+            for i, o in enumerate(ops):
+                d = o['data']
+                if o['entity'] == 'trip':
+                    t = trips_by_id.get(d.get('id'))
+                    if version_conflict(t, d):
+                        raise BatchConflict(i, t)
+                    if o['op'] == 'delete':
+                        if t:
+                            db.session.delete(t)
+                        touched.append(None)
+                        continue
+                    if not t:
+                        t = Trip()
+                        db.session.add(t)
+                    apply_trip_payload(t, d)
+                    touched.append(t)
+                elif o['entity'] == 'truck':
+                    t = trucks_by_plate.get(d.get('plate'))
+                    if version_conflict(t, d):
+                        raise BatchConflict(i, t)
+                    if o['op'] == 'delete':
+                        if t:
+                            # remove_truck writes with Core statements: the earlier ops
+                            # must reach the database first, and what it changed behind
+                            # the session's back is reloaded (trips) or dropped (FDS)
+                            db.session.flush()
+                            remove_truck(t)
+                            for obj in list(db.session.identity_map.values()):
+                                if isinstance(obj, Trip) and obj.assigned_truck_plate == t.plate:
+                                    db.session.expire(obj)
+                            for key in [k for k in fds_by_key if k[0] == t.plate]:
+                                r = fds_by_key.pop(key)
+                                db.session.expunge(r)
+                                touched = [None if x is r else x for x in touched]
+                            touched = [None if x is t else x for x in touched]
+                            del trucks_by_plate[t.plate]
+                        touched.append(None)
+                        continue
+                    if not d.get('plate'):
+                        raise ValueError(f'Plate is required (op {i})')
+                    if not t:
+                        t = trucks_by_plate[d['plate']] = Truck(plate=d['plate'])
+                        db.session.add(t)
+                    apply_truck_payload(t, d)
+                    touched.append(t)
+                else:
+                    key = (d.get('plate'), d.get('date'))
+                    r = fds_by_key.get(key)
+                    if o['op'] == 'delete':
+                        if r:
+                            db.session.delete(r)
+                            del fds_by_key[key]
+                        touched.append(None)
+                        continue
+                    if not r:
+                        r = fds_by_key[key] = TruckFds(truck_plate=key[0], date=key[1])
+                        db.session.add(r)
+                    r.is_out_of_service = d.get('is_out_of_service')
+                    touched.append(r)
+        db.session.commit()
+    except BatchConflict as e:
+        db.session.rollback()
+        return conflict_response(e.row, index=e.index)
+    except StaleDataError:
+        db.session.rollback()
+        return jsonify({'error': 'conflict', 'current': None}), 409
+    except (ValueError, IntegrityError) as e:
+        db.session.rollback()
+        return jsonify({'error': str(getattr(e, 'orig', e))}), 400
+
+    results = [None if r is None else fds_dict(r) if isinstance(r, TruckFds) else r.to_dict() for r in touched]
+    return jsonify({'results': results, 'revision': current_revision()})
 
 @app.route('/api/deactivate-truck', methods=['POST'])
 @login_required
@@ -570,79 +2394,307 @@ def deactivate_truck():
     return jsonify({'error': 'Truck not found'}), 404
 
 @app.route('/update_db_schema')
+@login_required
 def update_db_schema():
-    """Route to manually add missing columns - works for both PostgreSQL and SQLite"""
-    results = []
+    """Manual trigger for the migration runner (same steps as on startup). Admins only."""
+    if not current_user.is_admin:
+        return Response('Forbidden\n', status=403, mimetype='text/plain')
     try:
-        with app.app_context():
-            is_postgres = 'postgresql' in str(db.engine.url)
-            
-            # Define all columns that might need to be added
-            truck_columns = [
-                ("manual_location", "VARCHAR(100)", "''"),
-                ("is_zone_manual", "BOOLEAN", "FALSE"),
-                ("zones_last_updated", "VARCHAR(20)", "'2000-01-01'"),
-                ("manual_zones_str", "VARCHAR(200)", "''"),
-                ("trailer", "VARCHAR(50)", "''"),
-                ("driver_name", "VARCHAR(100)", "''"),
-                ("driver_phone", "VARCHAR(20)", "''"),
-                ("driver_dni", "VARCHAR(20)", "''"),
-                ("driver_alias", "VARCHAR(50)", "''"),
-                ("history_str", "TEXT", "'[]'"),
-            ]
-            
-            trip_columns = [
-                ("destination_zone", "VARCHAR(50)", None),
-            ]
-            
-            if is_postgres:
-                # PostgreSQL supports IF NOT EXISTS
-                for col_name, col_type, default in truck_columns:
-                    sql = f"ALTER TABLE truck ADD COLUMN IF NOT EXISTS {col_name} {col_type}"
-                    if default:
-                        sql += f" DEFAULT {default}"
-                    db.session.execute(text(sql + ";"))
-                    results.append(f"truck.{col_name}: OK (PostgreSQL)")
-                
-                for col_name, col_type, default in trip_columns:
-                    sql = f"ALTER TABLE trip ADD COLUMN IF NOT EXISTS {col_name} {col_type}"
-                    if default:
-                        sql += f" DEFAULT {default}"
-                    db.session.execute(text(sql + ";"))
-                    results.append(f"trip.{col_name}: OK (PostgreSQL)")
-            else:
-                # SQLite: Need to check if column exists first
-                inspector = db.inspect(db.engine)
-                existing_truck_cols = [c['name'] for c in inspector.get_columns('truck')]
-                existing_trip_cols = [c['name'] for c in inspector.get_columns('trip')]
-                
-                for col_name, col_type, default in truck_columns:
-                    if col_name not in existing_truck_cols:
-                        sql = f"ALTER TABLE truck ADD COLUMN {col_name} {col_type}"
-                        if default:
-                            sql += f" DEFAULT {default}"
-                        db.session.execute(text(sql))
-                        results.append(f"truck.{col_name}: ADDED (SQLite)")
-                    else:
-                        results.append(f"truck.{col_name}: EXISTS (SQLite)")
-                
-                for col_name, col_type, default in trip_columns:
-                    if col_name not in existing_trip_cols:
-                        sql = f"ALTER TABLE trip ADD COLUMN {col_name} {col_type}"
-                        if default:
-                            sql += f" DEFAULT {default}"
-                        db.session.execute(text(sql))
-                        results.append(f"trip.{col_name}: ADDED (SQLite)")
-                    else:
-                        results.append(f"trip.{col_name}: EXISTS (SQLite)")
-            
-            db.session.commit()
-            return f"Schema updated successfully!<br><br>Results:<br>" + "<br>".join(results)
+        applied = run_migrations()
+        import migrations
+        results = [f"{v}: {name}: APPLIED" for v, name in applied] or ["Nothing to apply"]
+        return f"Schema at version {migrations.current_version(db)}<br><br>Results:<br>" + "<br>".join(results)
     except Exception as e:
+        # The traceback goes to the server log, not to the browser
+        print(f"Error updating schema: {e}")
         import traceback
-        return f"Error updating schema: {e}<br><pre>{traceback.format_exc()}</pre>"
+        traceback.print_exc()
+        return 'Error updating schema; see the server log.', 500
+
+# --- EXPORTACIÓN (CSV / XLSX) ---
+# Same columns as the board's exportToCSV(), but for any date range and read
+# with a server-side cursor, so memory stays flat however many trips match.
+EXPORT_COLUMNS = ['Matrícula', 'Ubicación', 'Slot', 'Tipo', 'Cliente', 'Conductor', 'Origen', 'Destino',
+                  'Fecha Carga', 'Fecha Descarga', 'Urgente', 'Grupaje', 'PG', 'EP', 'PP', 'CR', 'Hora Aviso',
+                  'Avisado', 'Fuera de Servicio', 'Zonas Camión', 'Zona Viaje', 'Fecha Creación', 'Fecha Eliminación']
+EXPORT_MAX_DAYS = 366
+EXPORT_CHUNK = 1000
+
+def trip_cr(pg, ep, pp):
+    # Same as getTripCR() in board.js (Math.round, and JS number formatting)
+    cr = math.floor(((pg or 0) * 1.0 + (ep or 0) * 0.8 + (pp or 0) * 0.666) * 100 + 0.5) / 100
+    return int(cr) if cr == int(cr) else cr
+
+def like_literal(value):
+    """Escapes LIKE wildcards in user text; pass escape='\\\\' to like()/ilike()."""
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+def export_query(date_from, date_to, zone=None, client=None, plate=None):
+    source = trip_source(date_from, lambda t: (t.c.load_date >= date_from, t.c.load_date <= date_to))
+    trip = source.c
+
+    def truck_state(column, model):
+        # Latest row on or before the load day, like getTruckSuggestedLocation / isTruckOutOfService
+        return db.select(column).where(model.truck_plate == trip.assigned_truck_plate, model.date <= trip.load_date) \
+            .order_by(model.date.desc()).limit(1).scalar_subquery()
+    location = truck_state(TruckPosition.location, TruckPosition)
+    zones = func.coalesce(truck_state(TruckPosition.zones_str, TruckPosition), Truck.zones_str)
+    out_of_service = truck_state(TruckFds.is_out_of_service, TruckFds)
+    if reaches_archive(FDS_ARCHIVE.c.date, date_from):
+        # A truck's hot FDS rows are all newer than its archived ones
+        out_of_service = func.coalesce(out_of_service, truck_state(FDS_ARCHIVE.c.is_out_of_service, FDS_ARCHIVE.c))
+    stmt = db.select(
+        trip.assigned_truck_plate, func.coalesce(location, Truck.location).label('location'), trip.assigned_slot,
+        trip.type, trip.client, trip.driver, trip.origin, trip.destination, trip.load_date, trip.unload_date,
+        trip.is_urgent, trip.is_groupage, trip.pg, trip.ep, trip.pp, trip.notify_time, trip.is_notified,
+        out_of_service.label('out_of_service'), zones.label('truck_zones'), trip.zone,
+        Truck.creation_date, Truck.deletion_date,
+    ).select_from(source).outerjoin(Truck, Truck.plate == trip.assigned_truck_plate) \
+        .where(trip.load_date >= date_from, trip.load_date <= date_to) \
+        .order_by(trip.load_date, trip.assigned_truck_plate == None, trip.assigned_truck_plate, trip.assigned_slot, trip.id)
+    if zone:
+        # Board rule: assigned trips follow their truck's zones, pending ones their own zone
+        stmt = stmt.where(or_(
+            and_(trip.assigned_truck_plate != None,
+                 (literal(',') + zones + literal(',')).like(f'%,{like_literal(zone)},%', escape='\\')),
+            and_(trip.assigned_truck_plate == None, trip.zone == zone)))
+    if client:
+        stmt = stmt.where(trip.client.ilike(f'%{like_literal(client)}%', escape='\\'))
+    if plate:
+        stmt = stmt.where(trip.assigned_truck_plate == plate)
+    return stmt
+
+def export_rows(stmt):
+    yes_no = {True: 'SI', False: 'NO', None: 'NO'}
+    # Core connection + tuple unpacking: this loop runs once per exported trip
+    result = db.session.connection().execute(stmt, execution_options={'yield_per': EXPORT_CHUNK})
+    for (plate, location, slot, kind, client, driver, origin, destination, load_date, unload_date, urgent,
+         groupage, pg, ep, pp, notify_time, notified, out_of_service, truck_zones, zone, created, deleted) in result:
+        common = ['SALIDA' if kind == 'departure' else 'RETORNO', client, driver, origin, destination, load_date,
+                  unload_date, yes_no[urgent], yes_no[groupage], pg or 0, ep or 0, pp or 0, trip_cr(pg, ep, pp)]
+        if plate:
+            slot = slot or 0
+            yield [plate, location or '', f"{'SALIDA' if slot % 2 == 0 else 'RETORNO'} {slot // 2 + 1}", *common,
+                   notify_time or '', yes_no[notified], yes_no[out_of_service], (truck_zones or '').replace(',', '|'),
+                   zone or '', created or '', deleted or '']
+        else:
+            yield ['SIN ASIGNAR', '-', '-', *common, '-', 'NO', 'NO', '-', zone or '', '-', '-']
+
+def stream_csv(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    # BOM so Excel opens the UTF-8 accents correctly
+    yield '\ufeff'
+    writer.writerow(EXPORT_COLUMNS)
+    for n, row in enumerate(rows, 1):
+        writer.writerow(row)
+        if n % EXPORT_CHUNK == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+def stream_xlsx(rows):
+    # constant_memory flushes each row to a temp file as it is written; the
+    # finished workbook (a zip) is then sent in chunks
+    with tempfile.TemporaryFile() as f:
+        workbook = xlsxwriter.Workbook(f, {'constant_memory': True, 'in_memory': False})
+        sheet = workbook.add_worksheet('Planning')
+        sheet.write_row(0, 0, EXPORT_COLUMNS, workbook.add_format({'bold': True}))
+        for n, row in enumerate(rows, 1):
+            sheet.write_row(n, 0, row)
+        workbook.close()
+        f.seek(0)
+        while True:
+            chunk = f.read(64 * 1024)
+            if not chunk:
+                break
+            yield chunk
+
+@app.route('/api/export')
+@login_required
+def export_planning():
+    """?from=&to= (YYYY-MM-DD, by load date) [&zone=&client=&truck=] [&format=csv|xlsx]"""
+    try:
+        date_from = parse_date_arg('from')
+        date_to = parse_date_arg('to')
+    except ValueError:
+        return jsonify({'error': 'from/to must be YYYY-MM-DD'}), 400
+    if not date_from or not date_to or date_from > date_to:
+        return jsonify({'error': 'from and to are required and from <= to'}), 400
+    if (datetime.strptime(date_to, '%Y-%m-%d') - datetime.strptime(date_from, '%Y-%m-%d')).days >= EXPORT_MAX_DAYS:
+        return jsonify({'error': f'at most {EXPORT_MAX_DAYS} days per export'}), 400
+    fmt = request.args.get('format', 'csv')
+    if fmt not in ('csv', 'xlsx'):
+        return jsonify({'error': 'format must be csv or xlsx'}), 400
+    if fmt == 'xlsx' and xlsxwriter is None:
+        return jsonify({'error': 'XLSX export needs the XlsxWriter package; use format=csv'}), 501
+
+    stmt = export_query(date_from, date_to, zone=request.args.get('zone') or None,
+                        client=request.args.get('client') or None, plate=request.args.get('truck') or None)
+    filename = f'planning_trafico_{date_from}_{date_to}.{fmt}'
+    if fmt == 'xlsx':
+        body = stream_xlsx(export_rows(stmt))
+        mimetype = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    else:
+        body = stream_csv(export_rows(stmt))
+        mimetype = 'text/csv'
+    # stream_with_context keeps the session (and its cursor) alive while streaming
+    return Response(stream_with_context(body), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
+# --- BÚSQUEDA (autocompletar) ---
+# Suggestions for the trip modal's free-text fields from an in-memory index
+# (search_index.py) of the distinct values of the hot trips, drivers and
+# trucks, ranked by how many trips use them. Each worker keeps its own and
+# follows change_log: a search first adds the values written since the
+# revision it holds, and the whole index is rebuilt every
+# SEARCH_REBUILD_SECONDS (counts, and values nobody uses any more).
+# Archived trips are not indexed nor searched.
+SEARCH_TRIP_COLUMNS = {'client': (Trip.client,), 'location': (Trip.origin, Trip.destination),
+                       'driver': (Trip.driver,), 'plate': (Trip.assigned_truck_plate,)}
+SEARCH_REBUILD_SECONDS = env_int('SEARCH_REBUILD_SECONDS', 3600)
+SEARCH_MAX_SUGGESTIONS = 50
+SEARCH_MAX_TRIPS = 200
+
+search_index = SearchIndex()
+search_rebuild_lock = threading.Lock()
+
+def search_counts():
+    """(kind, value, trips using it) for every distinct value, read with GROUP BYs
+    over the trip indexes; plates and driver names with no trips count 0."""
+    counts = {}
+    for kind, columns in SEARCH_TRIP_COLUMNS.items():
+        for column in columns:
+            for value, count in db.session.execute(db.select(column, func.count())
+                                                   .where(column != None, column != '').group_by(column)):
+                key = (kind, value.strip())
+                counts[key] = counts.get(key, 0) + count
+    for kind, column in (('plate', Truck.plate), ('driver', Truck.driver_name), ('driver', Driver.name)):
+        for value in db.session.execute(db.select(column).where(column != None, column != '')).scalars():
+            counts.setdefault((kind, value.strip()), 0)
+    return [(kind, value, count) for (kind, value), count in counts.items()]
+
+def written_values(since, revision):
+    """(kind, value) of the trips, trucks and drivers upserted in (since, revision],
+    or None if there are too many to be worth it (rebuild instead)."""
+    keys = {'trips': set(), 'trucks': set(), 'drivers': set()}
+    rows = db.session.execute(
+        db.select(ChangeLog.entity, ChangeLog.entity_key)
+        .where(ChangeLog.rev > since, ChangeLog.rev <= revision, ChangeLog.entity.in_(keys), ChangeLog.op == 'upsert')
+        .limit(SYNC_MAX_CHANGES + 1)
+    ).all()
+    if len(rows) > SYNC_MAX_CHANGES:
+        return None
+    for entity, key in rows:
+        keys[entity].add(key)
+    values = []
+    if keys['trips']:
+        columns = [(kind, column) for kind, cols in SEARCH_TRIP_COLUMNS.items() for column in cols]
+        for row in db.session.execute(db.select(*[column for _, column in columns])
+                                      .where(Trip.id.in_([int(k) for k in keys['trips']]))):
+            values += [(kind, value) for (kind, _), value in zip(columns, row) if value]
+    if keys['trucks']:
+        for plate, driver_name in db.session.execute(db.select(Truck.plate, Truck.driver_name)
+                                                     .where(Truck.plate.in_(keys['trucks']))):
+            values += [('plate', plate), ('driver', driver_name)]
+    if keys['drivers']:
+        values += [('driver', name) for name in db.session.execute(
+            db.select(Driver.name).where(Driver.id.in_([int(k) for k in keys['drivers']]))).scalars()]
+    return values
+
+def search_index_fresh():
+    """Brings this worker's search index up to the current revision."""
+    revision = current_revision()
+    if search_index.revision == revision and time.monotonic() - search_index.built_at < SEARCH_REBUILD_SECONDS:
+        return
+    # One thread rebuilds or catches up; the others wait for it and find it done
+    with search_rebuild_lock:
+        since = search_index.revision
+        values = None
+        if since is not None and since <= revision and \
+                time.monotonic() - search_index.built_at < SEARCH_REBUILD_SECONDS:
+            if since == revision:
+                return
+            values = written_values(since, revision)
+        if values is None:
+            # The revision first (see get_initial_data), then the rows
+            search_index.rebuild(search_counts(), revision, time.monotonic())
+        else:
+            search_index.touch(values, revision)
+
+def search_trips(terms, after, size):
+    """`size` trips using any of the (kind, value) terms, newest load date first,
+    after the (load_date, id) cursor `after`. Returns (trip dicts, next cursor)."""
+    # One read per (column, value), newest first along its (column, load_date)
+    # index, merged here. A single OR query would sort every matching trip
+    # first, and a location like Murcia is on nearly all of them.
+    select = db.select(*[column for _, column in TRIP_FIELDS])
+    reads = []
+    for kind, value in dict.fromkeys(terms):
+        for column in SEARCH_TRIP_COLUMNS[kind]:
+            criteria = [column == value]
+            if after:
+                criteria.append(tuple_(Trip.load_date, Trip.id) < tuple_(*after))
+            reads.append(db.session.execute(select.where(*criteria)
+                                            .order_by(Trip.load_date.desc(), Trip.id.desc()).limit(size + 1)).all())
+    rows, seen = [], set()
+    for r in heapq.merge(*reads, key=lambda r: (r.load_date, r.id), reverse=True):
+        if r.id not in seen:  # e.g. Murcia as both origin and destination
+            seen.add(r.id)
+            rows.append(r)
+            if len(rows) > size:
+                break
+    keys = [key for key, _ in TRIP_FIELDS]
+    trips = [dict(zip(keys, r)) for r in rows[:size]]
+    return trips, [trips[-1]['loadDate'], trips[-1]['id']] if len(rows) > size else None
+
+@app.route('/api/search')
+@login_required
+def search():
+    """Suggestions for ?q= [&kinds=client,location,driver,plate] [&limit=], best
+    first. With ?trips=<n> also n trips using the suggested values, newest first,
+    or only ?kind=&value= once one was picked; ?after= is the previous page's `next`."""
+    q = request.args.get('q', '').strip()
+    picked = (request.args.get('kind'), request.args.get('value', '').strip())
+    kinds = set(filter(None, request.args.get('kinds', '').split(',')))
+    if kinds - set(SEARCH_TRIP_COLUMNS) or (picked[1] and picked[0] not in SEARCH_TRIP_COLUMNS):
+        return jsonify({'error': f"kinds are {', '.join(SEARCH_TRIP_COLUMNS)}"}), 400
+    if not q and not picked[1]:
+        return jsonify({'error': 'q (or kind and value) is required'}), 400
+    limit = max(1, min(request.args.get('limit', 10, type=int), SEARCH_MAX_SUGGESTIONS))
+    size = max(0, min(request.args.get('trips', 0, type=int), SEARCH_MAX_TRIPS))
+    after = None
+    if request.args.get('after'):
+        try:
+            after = json.loads(request.args['after'])
+            after = [str(after[0]), int(after[1])]
+        except (ValueError, TypeError, IndexError, KeyError):
+            return jsonify({'error': 'after must be the next cursor of the previous page'}), 400
+
+    search_index_fresh()
+    suggestions = search_index.search(q, kinds, limit) if q else []
+    result = {'q': q, 'revision': search_index.revision,
+              'suggestions': [{'kind': kind, 'value': value, 'count': count} for kind, value, count in suggestions]}
+    if size:
+        terms = [picked] if picked[1] else [(kind, value) for kind, value, _ in suggestions]
+        result['trips'], result['next'] = search_trips(terms, after, size) if terms else ([], None)
+    return jsonify(result)
 
 # --- DRIVER & TRAILER CRUD ---
+def reference_list(model, name):
+    """GET handler body for the small reference tables (drivers, trailers)."""
+    tag = f'{name}-{current_revision()}'
+    cached = not_modified(tag)
+    if cached:
+        return cached
+    return with_etag(jsonify([dict(r._mapping) for r in table_rows(model)]), tag)
+
+@app.route('/api/drivers', methods=['GET'])
+@login_required
+def list_drivers():
+    return reference_list(Driver, 'drivers')
+
 @app.route('/api/drivers', methods=['POST'])
 @login_required
 def save_driver():
@@ -670,6 +2722,11 @@ def delete_driver(driver_id):
         db.session.commit()
     return jsonify({'success': True})
 
+@app.route('/api/trailers', methods=['GET'])
+@login_required
+def list_trailers():
+    return reference_list(Trailer, 'trailers')
+
 @app.route('/api/trailers', methods=['POST'])
 @login_required
 def save_trailer():
@@ -707,17 +2764,14 @@ def unassign_day():
     if not date_filter:
         return jsonify({'error': 'Date is required'}), 400
         
-    # Find all trips for this date that are assigned
-    trips_to_update = Trip.query.filter_by(load_date=date_filter).filter(Trip.assigned_truck_plate != None).all()
-    
-    for t in trips_to_update:
-        t.assigned_truck_plate = None
-        t.assigned_slot = None
-        t.notify_time = ""
-        t.is_notified = False
-        
+    # Find all trips for this date that are assigned, then clear them in one UPDATE
+    trips_to_update = db.session.execute(
+        db.select(Trip.id, Trip.assigned_truck_plate, Trip.unload_date, Trip.load_date)
+        .where(Trip.load_date == date_filter, Trip.assigned_truck_plate != None)
+        .with_for_update()
+    ).all()
+    count = bulk_update_trips(trips_to_update, {
+        'assigned_truck_plate': None, 'assigned_slot': None, 'notify_time': '', 'is_notified': False
+    })
     db.session.commit()
-    return jsonify({'success': True, 'count': len(trips_to_update)})
-
-if __name__ == '__main__':
-    app.run(debug=True)
+    return jsonify({'success': True, 'count': count})
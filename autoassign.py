@@ -0,0 +1,100 @@
+"""
+Asignación por lotes: the rectangular assignment problem behind /api/auto-assign.
+
+cost[i][j] is what it costs to put trip i in free slot j, or None where that
+trip cannot go there. solve() returns the (trip, slot) pairs of a minimum
+cost assignment: as many trips placed as the allowed pairs permit, and among
+those plans the cheapest one. Every trip gets at most one slot and every
+slot at most one trip.
+
+With SciPy installed its linear_sum_assignment (C, vectorized) does the
+work; otherwise hungarian() below, a pure-Python Kuhn-Munkres with
+potentials (shortest augmenting paths, O(n^2 m) for n <= m).
+"""
+try:
+    import numpy
+    from scipy.optimize import linear_sum_assignment
+except ImportError:  # Optional: without it solve() uses hungarian()
+    linear_sum_assignment = None
+
+SOLVER = 'scipy' if linear_sum_assignment else 'hungarian'
+
+
+def forbidden_cost(cost):
+    """A cost above any plan made only of allowed pairs: using one forbidden
+    pair always costs more than the worst allowed plan."""
+    allowed = [abs(c) for row in cost for c in row if c is not None]
+    return (sum(allowed) + 1) * 2 if allowed else 1
+
+
+def solve(cost):
+    """[(row, column)] of a minimum cost assignment, forbidden (None) pairs left out."""
+    if not cost or not cost[0]:
+        return []
+    big = forbidden_cost(cost)
+    dense = [[big if c is None else c for c in row] for row in cost]
+    if linear_sum_assignment:
+        rows, columns = linear_sum_assignment(numpy.array(dense, dtype=float))
+        pairs = zip(rows.tolist(), columns.tolist())
+    else:
+        pairs = hungarian(dense)
+    return sorted((i, j) for i, j in pairs if cost[i][j] is not None)
+
+
+def hungarian(cost):
+    """[(row, column)] minimizing the sum of cost over a complete matching of the
+    smaller side. cost is a dense list of lists (no None)."""
+    n, m = len(cost), len(cost[0])
+    if n > m:
+        return [(i, j) for j, i in hungarian([list(column) for column in zip(*cost)])]
+    inf = float('inf')
+    u = [0] * (n + 1)       # row potentials (1-based rows)
+    v = [0] * (m + 1)       # column potentials; column 0 is the virtual start
+    owner = [0] * (m + 1)   # row matched to each column, 0 = free
+    way = [0] * (m + 1)
+    # Warm start: each row's cheapest cost as its potential, and a greedy
+    # matching on those zero reduced cost pairs. Cost matrices made of a few
+    # rates are full of ties; without it most rows would search a long path.
+    pending = []
+    for i in range(1, n + 1):
+        row = cost[i - 1]
+        u[i] = min(row)
+        j = next((j for j in range(1, m + 1) if not owner[j] and row[j - 1] == u[i]), 0)
+        if j:
+            owner[j] = i
+        else:
+            pending.append(i)
+    for i in pending:
+        owner[0] = i
+        j0 = 0
+        minv = [inf] * (m + 1)
+        free = list(range(1, m + 1))  # columns not in the tree yet
+        tree = [0]
+        while True:
+            i0 = owner[j0]
+            row, ui = cost[i0 - 1], u[i0]
+            delta, j1 = inf, 0
+            for j in free:
+                cur = row[j - 1] - ui - v[j]
+                if cur < minv[j]:
+                    minv[j] = cur
+                    way[j] = j0
+                # On ties a free column wins: the path ends there
+                if minv[j] < delta or minv[j] == delta and not owner[j]:
+                    delta, j1 = minv[j], j
+            for j in tree:
+                u[owner[j]] += delta
+                v[j] -= delta
+            for j in free:
+                minv[j] -= delta
+            j0 = j1
+            free.remove(j0)
+            tree.append(j0)
+            if owner[j0] == 0:
+                break
+        # Flip the augmenting path back to the start
+        while j0:
+            j1 = way[j0]
+            owner[j0] = owner[j1]
+            j0 = j1
+    return [(owner[j] - 1, j - 1) for j in range(1, m + 1) if owner[j]]
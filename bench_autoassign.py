@@ -0,0 +1,141 @@
+"""
+Benchmark of the batch auto-assignment (/api/auto-assign, autoassign.py).
+
+Two parts:
+
+1. The solver alone on cost matrices shaped like the real ones (a few cost
+   rates, many ties, forbidden pairs), at a few hundred trips x slots. Times
+   autoassign.solve() (SciPy when installed) and the pure-Python
+   hungarian(), and compares the plan with the greedy one the board's
+   drag-and-drop amounts to (each trip, in order, takes its cheapest free slot):
+   "fit" is the average zone/slot/packing cost of a placed trip.
+2. The endpoint on a generated fleet (generate_fleet.py, throw-away SQLite
+   database): the days ahead, where many trips are still unassigned.
+
+    python bench_autoassign.py
+    python bench_autoassign.py --trucks 500 --days 5
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+_tmp = tempfile.mkdtemp()
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(_tmp, 'autoassign.db')
+os.environ['EVENTS_SPOOL'] = os.path.join(_tmp, 'events.log')
+
+import autoassign
+
+SIZES = [(100, 200), (300, 400), (300, 600), (500, 1000), (1000, 600)]
+
+
+def cost_matrix(rnd, trips, slots):
+    """Rates like assign_cost(). Trucks (two slots each) and loads spread over
+    six zones with different weights, so the well placed slots run short;
+    some trips are urgent, some groupage."""
+    zones = range(6)
+    columns = []
+    for n in range(slots):
+        if n % 2 == 0:
+            zone = rnd.choices(zones, weights=(6, 3, 2, 1, 1, 1))[0]
+            city = rnd.randrange(3)
+        columns.append((zone, city, n % 2))
+    rows = []
+    for _ in range(trips):
+        zone, city = rnd.choices(zones, weights=(1, 2, 3, 3, 3, 3))[0], rnd.randrange(3)
+        base = 0 if rnd.random() < 0.05 else 1000
+        groupage = rnd.random() < 0.15
+        row = []
+        for slot_zone, slot_city, second in columns:
+            if rnd.random() < 0.1:
+                row.append(None)
+                continue
+            fit = (0 if slot_city == city else 20) if slot_zone == zone else 100
+            row.append(base + fit + 10 * second + (rnd.randrange(34) if groupage else 0))
+        rows.append(row)
+    return rows
+
+
+def greedy(cost):
+    taken, pairs = set(), []
+    for i, row in enumerate(cost):
+        options = [(c, j) for j, c in enumerate(row) if c is not None and j not in taken]
+        if options:
+            c, j = min(options)
+            taken.add(j)
+            pairs.append((i, j))
+    return pairs
+
+
+def total(cost, pairs):
+    return sum(cost[i][j] for i, j in pairs)
+
+
+def bench_solver(seed):
+    print(f"{'trips x slots':<16}{'solver ms':>10}{'hungarian ms':>14}{'placed':>8}{'fit':>8}{'greedy':>8}{'saved':>8}")
+    rnd = random.Random(seed)
+    for trips, slots in SIZES:
+        cost = cost_matrix(rnd, trips, slots)
+        start = time.perf_counter()
+        pairs = autoassign.solve(cost)
+        solved = time.perf_counter() - start
+        big = autoassign.forbidden_cost(cost)
+        start = time.perf_counter()
+        plain = autoassign.hungarian([[big if c is None else c for c in row] for row in cost])
+        plain_time = time.perf_counter() - start
+        plain = [(i, j) for i, j in plain if cost[i][j] is not None]
+        reference = greedy(cost)
+        if (len(plain), total(cost, plain)) != (len(pairs), total(cost, pairs)):
+            raise SystemExit(f"ERROR: hungarian() and solve() disagree at {trips}x{slots}")
+        # Per placed trip, and without the urgency rate (the same whoever places them)
+        ours = sum(cost[i][j] % 1000 for i, j in pairs) / len(pairs)
+        theirs = sum(cost[i][j] % 1000 for i, j in reference) / len(reference)
+        print(f"{f'{trips} x {slots}':<16}{solved * 1000:>10.1f}{plain_time * 1000:>14.1f}{len(pairs):>8}"
+              f"{ours:>8.1f}{theirs:>8.1f}{(1 - ours / theirs) * 100:>7.1f}%")
+
+
+def bench_endpoint(trucks, days, seed):
+    from app import app, db, run_migrations
+    from generate_fleet import generate
+    run_migrations()
+    today = date.today()
+    with app.app_context():
+        start = time.perf_counter()
+        generate(trucks=trucks, years=0.1, ahead=days + 7, seed=seed, today=today)
+        print(f"\nFleet of {trucks} trucks generated in {time.perf_counter() - start:.1f}s")
+        db.session.remove()
+    app.config['TESTING'] = True
+    client = app.test_client()
+    client.post('/login', data={'username': 'davidp', 'password': 'admin'})
+    print(f"{'day':<12}{'unassigned':>11}{'placed':>8}{'first ms':>10}{'again ms':>10}")
+    for n in range(1, days + 1):
+        day = (today + timedelta(days=n)).isoformat()
+        timings = []
+        for _ in range(2):  # the first call also builds the day's board snapshot
+            start = time.perf_counter()
+            r = client.post(f'/api/auto-assign?date={day}')
+            timings.append(time.perf_counter() - start)
+        body = r.get_json()
+        if r.status_code != 200:
+            raise SystemExit(f"ERROR: /api/auto-assign answered {r.status_code}: {body}")
+        print(f"{day:<12}{len(body['plan']) + len(body['unassigned']):>11}{len(body['plan']):>8}"
+              f"{timings[0] * 1000:>10.0f}{timings[1] * 1000:>10.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--trucks', type=int, default=300)
+    parser.add_argument('--days', type=int, default=3, help='days ahead to plan')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    print(f"solver: {autoassign.SOLVER}\n")
+    bench_solver(args.seed)
+    bench_endpoint(args.trucks, args.days, args.seed)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
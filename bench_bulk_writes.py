@@ -0,0 +1,133 @@
+"""
+Benchmark: unassign-day and truck deletion, ORM loop vs set-based SQL.
+
+Runs against a throw-away SQLite database (never database.db):
+
+    python bench_bulk_writes.py --trips 10000 --trips 50000
+
+"legacy" reproduces the old endpoints (load every Trip into the ORM and null
+the columns in a Python loop); "set-based" calls the current endpoints,
+which issue chunked UPDATE ... WHERE id IN (...) statements.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+_tmp = tempfile.mkdtemp()
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(_tmp, 'bench.db')
+os.environ['EVENTS_SPOOL'] = os.path.join(_tmp, 'events.log')
+
+from sqlalchemy import event
+
+from app import app, db, User, SyncRevision, Truck, Trip, TruckFds, TruckPosition, rebuild_truck_positions
+
+DAY = '2026-03-02'
+
+
+class StatementCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, *args, **kwargs):
+        self.count += 1
+
+
+def seed(n_trips, n_trucks, one_day):
+    """Fresh tables with n_trips assigned trips (all on DAY if one_day, else spread over one truck)."""
+    db.drop_all()
+    db.create_all()
+    admin = User(username='davidp', is_admin=True)
+    admin.set_password('admin')
+    db.session.add_all([admin, SyncRevision(id=1, rev=0)])
+    db.session.execute(Truck.__table__.insert(), [
+        {'plate': f'T{i:04d}', 'creation_date': '2020-01-01', 'location': '', 'zones_str': '',
+         'manual_location': '', 'manual_zones_str': '', 'history_str': '[]'}
+        for i in range(n_trucks)
+    ])
+    rows = []
+    for i in range(n_trips):
+        if one_day:
+            plate, date = f'T{i % n_trucks:04d}', DAY
+        else:
+            plate, date = 'T0000', f'20{20 + (i // 365) % 10:02d}-{1 + (i // 28) % 12:02d}-{1 + i % 28:02d}'
+        rows.append({'type': 'departure' if i % 2 == 0 else 'return', 'client': f'C{i % 300}', 'driver': '',
+                     'origin': 'Murcia', 'destination': 'Madrid', 'load_date': date, 'unload_date': date,
+                     'assigned_truck_plate': plate, 'assigned_slot': i % 4, 'is_urgent': False,
+                     'is_groupage': False, 'pg': 0, 'ep': 0, 'pp': 0, 'notify_time': '', 'is_notified': False})
+    db.session.execute(Trip.__table__.insert(), rows)
+    db.session.execute(TruckFds.__table__.insert(), [
+        {'truck_plate': 'T0000', 'date': f'2025-{m:02d}-01', 'is_out_of_service': m % 2 == 0} for m in range(1, 13)
+    ])
+    db.session.commit()
+    rebuild_truck_positions()
+
+
+def legacy_unassign_day():
+    trips = Trip.query.filter_by(load_date=DAY).filter(Trip.assigned_truck_plate != None).all()
+    for t in trips:
+        t.assigned_truck_plate = None
+        t.assigned_slot = None
+        t.notify_time = ""
+        t.is_notified = False
+    db.session.commit()
+    return len(trips)
+
+
+def legacy_delete_truck():
+    t = Truck.query.filter_by(plate='T0000').first()
+    TruckFds.query.filter_by(truck_plate='T0000').delete()
+    trips = Trip.query.filter_by(assigned_truck_plate='T0000').all()
+    for trip in trips:
+        trip.assigned_truck_plate = None
+        trip.assigned_slot = None
+    TruckPosition.query.filter_by(truck_plate='T0000').delete()
+    db.session.delete(t)
+    db.session.commit()
+    return len(trips)
+
+
+def timed(fn):
+    counter = StatementCounter()
+    event.listen(db.engine, 'before_cursor_execute', counter)
+    start = time.perf_counter()
+    try:
+        rows = fn()
+    finally:
+        elapsed = time.perf_counter() - start
+        event.remove(db.engine, 'before_cursor_execute', counter)
+    return rows, elapsed, counter.count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--trips', type=int, action='append', help='trip counts to test (default 10000)')
+    parser.add_argument('--trucks', type=int, default=200)
+    args = parser.parse_args()
+
+    app.config['TESTING'] = True
+    client = app.test_client()
+    print(f"{'scenario':<14}{'trips':>8}{'path':>11}{'rows':>8}{'seconds':>10}{'statements':>12}")
+    for n in args.trips or [10000]:
+        with app.app_context():
+            scenarios = [
+                ('unassign-day', True, legacy_unassign_day,
+                 lambda: client.post('/api/unassign-day', json={'date': DAY}).get_json()['count']),
+                ('delete-truck', False, legacy_delete_truck,
+                 lambda: client.post('/api/delete-truck', json={'plate': 'T0000'}).get_json()['counts']['trips']),
+            ]
+            for name, one_day, legacy, set_based in scenarios:
+                for label, fn in (('legacy', legacy), ('set-based', set_based)):
+                    seed(n, args.trucks, one_day)
+                    if label == 'set-based':
+                        # Log in once outside the measurement
+                        client.post('/login', data={'username': 'davidp', 'password': 'admin'})
+                    rows, elapsed, statements = timed(fn)
+                    print(f"{name:<14}{n:>8}{label:>11}{rows:>8}{elapsed:>10.3f}{statements:>12}")
+                    db.session.remove()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
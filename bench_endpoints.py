@@ -0,0 +1,345 @@
+"""
+Endpoint latency benchmark: p50/p95/p99 and throughput for every /api/* route.
+
+Runs each scenario --requests times (after --warmup untimed calls) and saves
+the numbers as JSON, so runs on two versions can be compared:
+
+    python bench_endpoints.py --out before.json                # generated fleet, Flask test client
+    python bench_endpoints.py --out after.json --compare before.json
+
+By default a throw-away SQLite database is filled by generate_fleet.py
+(--trucks/--years). --database reuses a database already generated with it
+(the write scenarios add and delete rows there). --url benchmarks a running
+server instead, e.g. a local gunicorn started on a generated database:
+
+    DATABASE_URL=sqlite:///fleet.db gunicorn -c gunicorn.conf.py app:app
+    python bench_endpoints.py --url http://127.0.0.1:8000 --threads 8
+
+Every /api/* route of app.py must have a scenario below; the script warns
+about routes it does not cover. --compare exits 1 if a route's p95 grew by
+more than --threshold percent.
+"""
+import argparse
+import http.cookiejar
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import date, timedelta
+
+_tmp = tempfile.mkdtemp()
+os.environ.setdefault('EVENTS_SPOOL', os.path.join(_tmp, 'events.log'))
+
+# /api/stream is an endless Server-Sent Events response
+SKIPPED_ROUTES = {('GET', '/api/stream')}
+
+
+class TestClient:
+    """The app in this process through Flask's test client."""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, payload=None, form=None):
+        r = self.client.open(path, method=method, json=payload, data=form)
+        body = r.get_data()
+        r.close()  # like a WSGI server: runs the streamed bodies' cleanup
+        return r.status_code, body
+
+
+class HttpClient:
+    """A running server over HTTP, with its own session cookie."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+
+    def request(self, method, path, payload=None, form=None):
+        headers, body = {'Accept-Encoding': 'identity'}, None
+        if payload is not None:
+            headers['Content-Type'] = 'application/json'
+            body = json.dumps(payload).encode()
+        elif form is not None:
+            body = urllib.parse.urlencode(form).encode()
+        req = urllib.request.Request(self.base_url + path, data=body, headers=headers, method=method)
+        try:
+            with self.opener.open(req) as r:
+                return r.status, r.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+
+
+# --- ESCENARIOS ---
+# (name, method, route rule, request(ctx, i) -> (path, json payload), after(ctx, body) or None)
+# Writes that need rows (trips to move/delete, spare trucks) take them from
+# ctx, which setup() and earlier scenarios fill; they run in this order.
+
+def trip_payload(ctx, i, **extra):
+    d = {'type': 'departure' if i % 2 == 0 else 'return', 'client': 'Bench', 'origin': 'Murcia',
+         'destination': 'Madrid', 'loadDate': ctx['day'], 'unloadDate': ctx['day']}
+    d.update(extra)
+    return d
+
+
+def take(ctx, key, i):
+    rows = ctx[key]
+    return rows.pop(i % len(rows))
+
+
+SCENARIOS = [
+    ('initial-data (window)', 'GET', '/api/initial-data',
+     lambda ctx, i: (f"/api/initial-data?from={ctx['from']}&to={ctx['to']}", None), None),
+    ('changes', 'GET', '/api/changes',
+     lambda ctx, i: (f"/api/changes?since={max(0, ctx['revision'] - 20)}", None), None),
+    ('positions', 'GET', '/api/positions', lambda ctx, i: (f"/api/positions?date={ctx['day']}", None), None),
+    ('board', 'GET', '/api/board', lambda ctx, i: (f"/api/board?date={ctx['day']}", None), None),
+    ('day stats', 'GET', '/api/stats/day', lambda ctx, i: (f"/api/stats/day?date={ctx['day']}", None), None),
+    ('auto-assign', 'POST', '/api/auto-assign', lambda ctx, i: (f"/api/auto-assign?date={ctx['day']}", None), None),
+    ('truck as-of', 'GET', '/api/trucks/<string:plate>/as-of',
+     lambda ctx, i: (f"/api/trucks/{urllib.parse.quote(ctx['plates'][i % len(ctx['plates'])])}/as-of?date={ctx['day']}",
+                     None), None),
+    ('notes GET', 'GET', '/api/notes', lambda ctx, i: (f"/api/notes?date={ctx['day']}&type=Tasks", None), None),
+    ('export (month, csv)', 'GET', '/api/export',
+     lambda ctx, i: (f"/api/export?from={ctx['month_from']}&to={ctx['day']}", None), None),
+    ('search', 'GET', '/api/search', lambda ctx, i: (f"/api/search?q={('fru', 'murc', 'hernan', 'cartagna')[i % 4]}", None),
+     None),
+    ('search (trips)', 'GET', '/api/search', lambda ctx, i: ('/api/search?q=frutas&trips=50', None), None),
+    ('drivers', 'GET', '/api/drivers', lambda ctx, i: ('/api/drivers', None), None),
+    ('trailers', 'GET', '/api/trailers', lambda ctx, i: ('/api/trailers', None), None),
+    ('trip create', 'POST', '/api/trips',
+     lambda ctx, i: ('/api/trips', trip_payload(ctx, i, assignedTruck=ctx['plates'][i % len(ctx['plates'])],
+                                                assignedSlot=i % 4)),
+     lambda ctx, body: ctx['trips'].append(json.loads(body))),
+    ('trip move', 'POST', '/api/trips',
+     lambda ctx, i: ('/api/trips', dict(take(ctx, 'trips', i), assignedTruck=ctx['plates'][(i * 7) % len(ctx['plates'])])),
+     lambda ctx, body: ctx['trips'].append(json.loads(body))),
+    ('trip delete', 'DELETE', '/api/trips/<int:tid>',
+     lambda ctx, i: (f"/api/trips/{take(ctx, 'trips', i)['id']}", None), None),
+    ('batch (10 trips)', 'POST', '/api/batch',
+     lambda ctx, i: ('/api/batch', {'ops': [{'entity': 'trip', 'op': 'upsert', 'data': trip_payload(ctx, i + n)}
+                                            for n in range(10)]}), None),
+    ('notes POST', 'POST', '/api/notes',
+     lambda ctx, i: ('/api/notes', {'date': ctx['day'], 'type': 'General', 'content': f'bench {i}'}), None),
+    ('fds', 'POST', '/api/fds',
+     lambda ctx, i: ('/api/fds', {'plate': ctx['plates'][i % len(ctx['plates'])], 'date': ctx['day'],
+                                  'is_out_of_service': i % 2 == 0}), None),
+    ('toggle-fds', 'POST', '/api/toggle-fds',
+     lambda ctx, i: ('/api/toggle-fds', {'plate': ctx['plates'][i % len(ctx['plates'])], 'date': ctx['day'],
+                                         'is_out_of_service': i % 2 == 1}), None),
+    ('truck save', 'POST', '/api/trucks',
+     lambda ctx, i: ('/api/trucks', {'plate': f"BENCH{ctx['run']}-{i}", 'creationDate': ctx['from']}), None),
+    ('deactivate-truck', 'POST', '/api/deactivate-truck',
+     lambda ctx, i: ('/api/deactivate-truck', {'plate': f"BENCH{ctx['run']}-{i}", 'date': ctx['to']}), None),
+    ('driver save', 'POST', '/api/drivers',
+     lambda ctx, i: ('/api/drivers', {'name': f'Bench {i}'}), lambda ctx, body: ctx['drivers'].append(json.loads(body))),
+    ('driver delete', 'DELETE', '/api/drivers/<int:driver_id>',
+     lambda ctx, i: (f"/api/drivers/{take(ctx, 'drivers', i)['id']}", None), None),
+    ('trailer save', 'POST', '/api/trailers',
+     lambda ctx, i: ('/api/trailers', {'plate': f"RB{ctx['run']}-{i}"}),
+     lambda ctx, body: ctx['trailers'].append(json.loads(body))),
+    ('trailer delete', 'DELETE', '/api/trailers/<int:trailer_id>',
+     lambda ctx, i: (f"/api/trailers/{take(ctx, 'trailers', i)['id']}", None), None),
+    ('truck delete', 'DELETE', '/api/trucks/<string:plate>',
+     lambda ctx, i: (f"/api/trucks/{urllib.parse.quote(take(ctx, 'spare', i))}", None), None),
+    # Fleet trucks with their years of trips, FDS and history
+    ('delete-truck', 'POST', '/api/delete-truck',
+     lambda ctx, i: ('/api/delete-truck', {'plate': take(ctx, 'victims', i)}), None),
+    ('unassign-day', 'POST', '/api/unassign-day',
+     lambda ctx, i: ('/api/unassign-day', {'date': (date.fromisoformat(ctx['day']) - timedelta(days=i + 1)).isoformat()}),
+     None),
+]
+
+
+def setup(client, day, count):
+    """Reads what the scenarios need through the API (untimed) and creates the spare rows."""
+    window_from = (date.fromisoformat(day) - timedelta(days=14)).isoformat()
+    window_to = (date.fromisoformat(day) + timedelta(days=14)).isoformat()
+    status, body = client.request('GET', f'/api/initial-data?from={window_from}&to={window_to}')
+    if status != 200:
+        raise SystemExit(f"ERROR: /api/initial-data answered {status}; is the server up and the login right?")
+    data = json.loads(body)
+    plates = sorted(t['plate'] for t in data['trucks'] if not t['deletionDate'])
+    if len(plates) < 2:
+        raise SystemExit("ERROR: no trucks around that day; generate a fleet first (generate_fleet.py).")
+    run = str(int(time.time()))
+    ctx = {'day': day, 'from': window_from, 'to': window_to,
+           'month_from': (date.fromisoformat(day) - timedelta(days=30)).isoformat(),
+           'revision': data['revision'], 'trips': [], 'drivers': [], 'trailers': [], 'spare': [], 'run': run,
+           # delete-truck removes real trucks: keep them away from the others' plates
+           'victims': plates[-count:], 'plates': plates[:-count] or plates}
+    for n in range(count):
+        plate = f'SPARE{run}-{n}'
+        client.request('POST', '/api/trucks', {'plate': plate, 'creationDate': window_from})
+        ctx['spare'].append(plate)
+    return ctx
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))] * 1000 if values else 0
+
+
+def run_scenario(clients, ctx, scenario, warmup, count):
+    name, method, rule, make, after = scenario
+    lock = threading.Lock()
+    latencies, statuses, sizes = [], {}, []
+
+    def call(client, i):
+        with lock:
+            try:
+                path, payload = make(ctx, i)
+            except (IndexError, ZeroDivisionError):  # ran out of rows to act on
+                return None
+        start = time.perf_counter()
+        status, body = client.request(method, path, payload)
+        elapsed = time.perf_counter() - start
+        with lock:
+            if status < 400 and after:
+                after(ctx, body)
+        return status, body, elapsed
+
+    for i in range(warmup):
+        call(clients[0], i)
+    todo = iter(range(warmup, warmup + count))
+
+    def work(client):
+        while True:
+            with lock:
+                i = next(todo, None)
+            result = call(client, i) if i is not None else None
+            if result is None:
+                return
+            status, body, elapsed = result
+            with lock:
+                latencies.append(elapsed)
+                statuses[status] = statuses.get(status, 0) + 1
+                sizes.append(len(body))
+
+    threads = [threading.Thread(target=work, args=(c,)) for c in clients]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - start
+    errors = sum(c for s, c in statuses.items() if s >= 400)
+    return {
+        'method': method, 'rule': rule, 'requests': len(latencies), 'errors': errors,
+        'statuses': {str(s): c for s, c in sorted(statuses.items())},
+        'p50_ms': round(percentile(latencies, 0.5), 2), 'p95_ms': round(percentile(latencies, 0.95), 2),
+        'p99_ms': round(percentile(latencies, 0.99), 2), 'max_ms': round(percentile(latencies, 1), 2),
+        'mean_ms': round(sum(latencies) / len(latencies) * 1000, 2) if latencies else 0,
+        'rps': round(len(latencies) / wall, 1) if wall and latencies else 0,
+        'bytes': round(sum(sizes) / len(sizes)) if sizes else 0,
+    }
+
+
+def uncovered_routes(app):
+    covered = {(method, rule) for _, method, rule, _, _ in SCENARIOS} | SKIPPED_ROUTES
+    routes = {(method, rule.rule) for rule in app.url_map.iter_rules() if rule.rule.startswith('/api/')
+              for method in rule.methods - {'HEAD', 'OPTIONS'}}
+    return sorted(routes - covered)
+
+
+def compare(results, baseline_path, threshold):
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = json.load(f)
+    print(f"\nvs {baseline_path} ({baseline['meta'].get('commit') or '?'}):")
+    print(f"{'scenario':<24}{'p95 before':>11}{'p95 now':>10}{'change':>9}")
+    regressions = 0
+    for name, r in results['scenarios'].items():
+        old = baseline['scenarios'].get(name)
+        if not old or not old['p95_ms']:
+            print(f"{name:<24}{'-':>11}{r['p95_ms']:>10.1f}")
+            continue
+        change = (r['p95_ms'] - old['p95_ms']) / old['p95_ms'] * 100
+        flag = change > threshold
+        regressions += flag
+        print(f"{name:<24}{old['p95_ms']:>11.1f}{r['p95_ms']:>10.1f}{change:>+8.0f}%{'  REGRESSION' if flag else ''}")
+    return regressions
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', help='benchmark a running server instead of the test client')
+    parser.add_argument('--database', help='reuse a database filled by generate_fleet.py (test client mode)')
+    parser.add_argument('--trucks', type=int, default=100, help='fleet size to generate')
+    parser.add_argument('--years', type=float, default=1, help='history to generate')
+    parser.add_argument('--day', default=date.today().isoformat(), help='board day the scenarios use')
+    parser.add_argument('--requests', type=int, default=30, help='timed requests per scenario')
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--threads', type=int, default=1, help='concurrent clients')
+    parser.add_argument('--only', action='append', help='run only scenarios containing this text')
+    parser.add_argument('--username', default='davidp')
+    parser.add_argument('--password', default='admin')
+    parser.add_argument('--out', help='write the results as JSON')
+    parser.add_argument('--compare', help='JSON of an earlier run to compare against')
+    parser.add_argument('--threshold', type=float, default=20, help='p95 growth (%%) counted as a regression')
+    args = parser.parse_args()
+
+    # With --url the app is only imported for its route list
+    os.environ['DATABASE_URL'] = args.database or 'sqlite:///' + os.path.join(_tmp, 'bench.db')
+    from app import app, db, run_migrations, Trip
+    from generate_fleet import generate
+
+    scale = None
+    if args.url:
+        clients = [HttpClient(args.url) for _ in range(args.threads)]
+    else:
+        app.config['TESTING'] = True
+        run_migrations()
+        with app.app_context():
+            if not Trip.query.first():
+                start = time.perf_counter()
+                scale = generate(args.trucks, args.years)
+                print(f"Flota generada en {time.perf_counter() - start:.1f}s: {scale}")
+            db.engine.dispose()
+        clients = [TestClient(app) for _ in range(args.threads)]
+    for client in clients:
+        client.request('POST', '/login', form={'username': args.username, 'password': args.password})
+
+    for method, rule in uncovered_routes(app):
+        print(f"WARNING: no scenario for {method} {rule}")
+
+    scenarios = [s for s in SCENARIOS if not args.only or any(o in s[0] for o in args.only)]
+    ctx = setup(clients[0], args.day, args.requests + args.warmup)
+    results = {'meta': {'commit': git_commit(), 'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                        'mode': 'url' if args.url else 'test-client', 'url': args.url, 'threads': args.threads,
+                        'requests': args.requests, 'warmup': args.warmup, 'day': args.day, 'generated': scale,
+                        'python': platform.python_version()},
+               'scenarios': {}}
+    print(f"\n{'scenario':<24}{'req':>5}{'err':>5}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'req/s':>8}{'bytes':>10}")
+    for scenario in scenarios:
+        r = run_scenario(clients, ctx, scenario, args.warmup, args.requests)
+        results['scenarios'][scenario[0]] = r
+        print(f"{scenario[0]:<24}{r['requests']:>5}{r['errors']:>5}{r['p50_ms']:>9.1f}{r['p95_ms']:>9.1f}"
+              f"{r['p99_ms']:>9.1f}{r['rps']:>8.1f}{r['bytes']:>10}")
+
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+        print(f"\nResultados en {args.out}")
+    failed = sum(r['errors'] for r in results['scenarios'].values())
+    if failed:
+        print(f"{failed} request(s) failed.")
+    regressions = compare(results, args.compare, args.threshold) if args.compare else 0
+    return 1 if failed or regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
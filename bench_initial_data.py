@@ -0,0 +1,136 @@
+"""
+Benchmark: /api/initial-data, ORM objects + to_dict() + jsonify vs Core rows + streamed encoding.
+
+Runs against a throw-away SQLite database (never database.db):
+
+    python bench_initial_data.py --trips 1000 --trips 10000 --trips 100000
+
+"orm" reproduces the old endpoint body (Model.query.all(), to_dict() per
+object, one jsonify of the whole payload); "core" requests the current
+endpoint. Both the full load and a 14-day window are measured, and the
+script exits 1 if the two paths ever return different bytes.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+_tmp = tempfile.mkdtemp()
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(_tmp, 'bench.db')
+os.environ['EVENTS_SPOOL'] = os.path.join(_tmp, 'events.log')
+
+from sqlalchemy import or_
+from sqlalchemy.orm import selectinload
+from flask import jsonify
+
+from app import (app, db, User, SyncRevision, Truck, TruckHistory, Trip, TruckFds, Driver, Trailer,
+                 TruckPosition, fds_dict, latest_before, position_dict, current_revision, rebuild_truck_positions)
+
+WINDOW = ('2026-02-23', '2026-03-08')
+CITIES = ['Murcia', 'Málaga', 'A Coruña', 'Logroño', 'Madrid', 'Cádiz']
+
+
+def seed(n_trips, n_trucks):
+    db.drop_all()
+    db.create_all()
+    admin = User(username='davidp', is_admin=True)
+    admin.set_password('admin')
+    db.session.add_all([admin, SyncRevision(id=1, rev=0)])
+    db.session.execute(Truck.__table__.insert(), [
+        {'plate': f'T{i:04d}', 'creation_date': '2020-01-01', 'location': CITIES[i % 6], 'zones_str': 'NORTE,SUR' if i % 3 else '',
+         'manual_location': '', 'manual_zones_str': '', 'history_str': '[]', 'driver_name': f'Conductor Núñez {i}',
+         'deletion_date': '2026-01-01' if i % 50 == 49 else None}
+        for i in range(n_trucks)
+    ])
+    db.session.execute(TruckHistory.__table__.insert(), [
+        {'truck_plate': f'T{i:04d}', 'date': f'2026-0{1 + m}-10', 'driver_name': f'Suplente {m}',
+         'manual_zones_str': '' if m else None}
+        for i in range(0, n_trucks, 4) for m in range(3)
+    ])
+    # Trips spread over ~3 years ending after the window
+    db.session.execute(Trip.__table__.insert(), [
+        {'type': 'departure' if i % 2 == 0 else 'return', 'client': f'Cliente Peñíscola {i % 300}', 'driver': '',
+         'origin': CITIES[i % 6], 'destination': CITIES[(i + 1) % 6], 'destination_zone': 'SUR' if i % 5 else None,
+         'load_date': d, 'unload_date': d, 'assigned_truck_plate': f'T{i % n_trucks:04d}' if i % 7 else None,
+         'assigned_slot': i % 4 if i % 7 else None, 'is_urgent': i % 11 == 0, 'is_groupage': False,
+         'pg': i % 3, 'ep': 0, 'pp': 1, 'notify_time': '', 'is_notified': False}
+        for i in range(n_trips)
+        for d in [f'20{24 + (i * 1000 // n_trips) // 334:02d}-{1 + (i * 36 // n_trips) % 12:02d}-{1 + i % 28:02d}']
+    ])
+    db.session.execute(TruckFds.__table__.insert(), [
+        {'truck_plate': f'T{i:04d}', 'date': f'2026-{m:02d}-01', 'is_out_of_service': m % 2 == 0}
+        for i in range(0, n_trucks, 3) for m in range(1, 5)
+    ])
+    db.session.add_all([Driver(name='José', dni='1', phone='', alias='Pepe'), Trailer(plate='R-1', type='Frigo')])
+    db.session.commit()
+    rebuild_truck_positions()
+
+
+def legacy_initial_data(date_from=None, date_to=None):
+    revision = current_revision()
+    if date_from:
+        truck_rows = Truck.query.options(selectinload(Truck.history_entries)).filter(
+            Truck.creation_date <= date_to,
+            or_(Truck.deletion_date == None, Truck.deletion_date == '', Truck.deletion_date > date_from)
+        ).all()
+        trip_rows = Trip.query.filter(Trip.load_date <= date_to, Trip.unload_date >= date_from).all()
+        position_rows = TruckPosition.query.filter(TruckPosition.date >= date_from, TruckPosition.date <= date_to).all()
+        positions = [p.to_dict() for p in position_rows] + \
+            [position_dict(r) for r in latest_before(TruckPosition, TruckPosition.truck_plate, TruckPosition.date, date_from)]
+        fds_rows = TruckFds.query.filter(TruckFds.date >= date_from, TruckFds.date <= date_to).all()
+        fds_records = [fds_dict(r) for r in fds_rows] + \
+            [fds_dict(r) for r in latest_before(TruckFds, TruckFds.truck_plate, TruckFds.date, date_from)]
+    else:
+        truck_rows = Truck.query.options(selectinload(Truck.history_entries)).all()
+        trip_rows = Trip.query.all()
+        positions = [p.to_dict() for p in TruckPosition.query.all()]
+        fds_records = [fds_dict(r) for r in TruckFds.query.all()]
+    return jsonify({'trucks': [t.to_dict() for t in truck_rows], 'trips': [t.to_dict() for t in trip_rows],
+                    'fds_data': fds_records, 'drivers': [d.to_dict() for d in Driver.query.all()],
+                    'trailers': [t.to_dict() for t in Trailer.query.all()], 'positions': positions,
+                    'revision': revision, 'window': {'from': date_from, 'to': date_to} if date_from else None})
+
+
+def timed(fn, repeat):
+    best = None
+    for _ in range(repeat):
+        db.session.remove()
+        start = time.perf_counter()
+        body = fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return body, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--trips', type=int, action='append', help='trip counts to test (default 1000, 10000)')
+    parser.add_argument('--trucks', type=int, default=200)
+    parser.add_argument('--repeat', type=int, default=3, help='best of N runs')
+    args = parser.parse_args()
+
+    app.config['TESTING'] = True
+    client = app.test_client()
+    mismatches = 0
+    print(f"{'trips':>8}{'query':>9}{'path':>6}{'bytes':>11}{'seconds':>10}{'speedup':>9}")
+    for n in args.trips or [1000, 10000]:
+        with app.app_context():
+            seed(n, args.trucks)
+            client.post('/login', data={'username': 'davidp', 'password': 'admin'})
+            for label, window in (('full', None), ('window', WINDOW)):
+                url = '/api/initial-data' + (f'?from={window[0]}&to={window[1]}' if window else '')
+                with app.test_request_context():
+                    old, t_old = timed(lambda: legacy_initial_data(*(window or ())).get_data(), args.repeat)
+                new, t_new = timed(lambda: client.get(url).get_data(), args.repeat)
+                print(f"{n:>8}{label:>9}{'orm':>6}{len(old):>11}{t_old:>10.3f}")
+                print(f"{n:>8}{label:>9}{'core':>6}{len(new):>11}{t_new:>10.3f}{t_old / t_new:>8.1f}x")
+                if old != new:
+                    mismatches += 1
+                    at = next((i for i, (a, b) in enumerate(zip(old, new)) if a != b), min(len(old), len(new)))
+                    print(f"   MISMATCH at byte {at}: {old[at - 40:at + 40]!r} vs {new[at - 40:at + 40]!r}")
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
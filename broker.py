@@ -0,0 +1,80 @@
+"""
+Broker de eventos local para el canal SSE.
+
+Gunicorn runs several worker processes, so an in-memory queue alone would only
+reach the dispatchers connected to the worker that handled the write. Events
+are appended as JSON lines to a spool file on the local disk instead; every
+worker tails that file (like `tail -F`) and a threading.Condition wakes up the
+streams of the publishing worker immediately.
+
+The file is rotated by rename once it grows past max_bytes. Readers keep the
+old inode open, drain it, and then reopen the new file, so nothing is lost
+unless a reader falls more than a whole file behind. Events are only hints to
+run a delta sync, so a lost one just delays that board until the next one.
+"""
+import fcntl
+import json
+import os
+import threading
+import time
+
+
+class EventBroker:
+    def __init__(self, path, max_bytes=1024 * 1024, poll_interval=0.5):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.poll_interval = poll_interval
+        self._cond = threading.Condition()
+        open(self.path, 'a').close()
+
+    def publish(self, event):
+        line = json.dumps(event, separators=(',', ':')) + '\n'
+        while True:
+            # Closing the file releases the lock
+            with open(self.path, 'a') as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                # Another worker may have rotated the file after we opened it
+                if os.fstat(f.fileno()).st_ino != os.stat(self.path).st_ino:
+                    continue
+                f.write(line)
+                f.flush()
+                if f.tell() > self.max_bytes:
+                    os.replace(self.path, self.path + '.1')
+                    open(self.path, 'a').close()
+                break
+        with self._cond:
+            self._cond.notify_all()
+
+    def subscribe(self, heartbeat=15):
+        """Yields events published from now on; yields None every `heartbeat` seconds of silence."""
+        f = open(self.path)
+        f.seek(0, os.SEEK_END)
+        last_sent = time.monotonic()
+        try:
+            while True:
+                pos = f.tell()
+                line = f.readline()
+                if line.endswith('\n'):
+                    last_sent = time.monotonic()
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        pass
+                    continue
+                # EOF or a line still being written
+                f.seek(pos)
+                try:
+                    rotated = os.stat(self.path).st_ino != os.fstat(f.fileno()).st_ino
+                except FileNotFoundError:
+                    rotated = False
+                if rotated:
+                    f.close()
+                    f = open(self.path)
+                    continue
+                with self._cond:
+                    self._cond.wait(self.poll_interval)
+                if time.monotonic() - last_sent >= heartbeat:
+                    last_sent = time.monotonic()
+                    yield None
+        finally:
+            f.close()
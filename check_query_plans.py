@@ -0,0 +1,188 @@
+"""
+Query-plan check for the hot endpoints.
+
+Calls each hot endpoint against a seeded throw-away database, captures every
+SELECT/UPDATE/DELETE it issues and runs EXPLAIN on it. Exits with status 1 if
+any of them reads one of the big tables (HOT_TABLES) with a full table scan,
+which means an index is missing or a query stopped being able to use it.
+
+    python check_query_plans.py              # temporary SQLite database
+    CHECK_DATABASE_URL=postgresql://... python check_query_plans.py
+
+With CHECK_DATABASE_URL the target must be an EMPTY database: the script
+creates the schema with the migration runner and seeds it. On PostgreSQL the
+plans are taken with enable_seqscan=off, so a "Seq Scan" in the plan means
+there is no index the planner could use at all (not just that the table is
+small).
+
+Run it after touching a hot query or the indexes in app.py/migrations.py.
+"""
+import datetime
+import os
+import re
+import sys
+import tempfile
+
+_tmp = tempfile.mkdtemp()
+os.environ['DATABASE_URL'] = os.environ.get('CHECK_DATABASE_URL') or 'sqlite:///' + os.path.join(_tmp, 'plans.db')
+os.environ['EVENTS_SPOOL'] = os.path.join(_tmp, 'events.log')
+
+from sqlalchemy import event, text
+
+from app import (app, db, run_migrations, Truck, Trip, TruckFds, DailyNote, rebuild_truck_positions, archive_old_rows,
+                 NotificationSource)
+
+# Tables that grow with time; the small dimension tables (truck, driver,
+# trailer, user) may be scanned.
+HOT_TABLES = {'trip', 'truck_fds', 'truck_position', 'truck_history', 'daily_note', 'change_log', 'board_snapshot',
+              'day_stats', 'trip_archive', 'truck_fds_archive', 'daily_note_archive'}
+
+DAY = '2026-03-02'
+OLD_DAY = '2024-03-01'  # archived by seed()
+N_TRUCKS = 40
+N_TRIPS = 4000
+
+
+def seed():
+    db.session.execute(Truck.__table__.insert(), [
+        {'plate': f'T{i:04d}', 'creation_date': '2020-01-01', 'location': '', 'zones_str': '',
+         'manual_location': '', 'manual_zones_str': '', 'history_str': '[]'}
+        for i in range(N_TRUCKS)
+    ])
+    rows = []
+    for i in range(N_TRIPS):
+        date = f'20{24 + (i // 336) % 3:02d}-{1 + (i // 28) % 12:02d}-{1 + i % 28:02d}'
+        rows.append({'type': 'departure' if i % 2 == 0 else 'return', 'client': f'C{i % 300}', 'driver': '',
+                     'origin': 'Murcia', 'destination': 'Madrid', 'load_date': date, 'unload_date': date,
+                     'assigned_truck_plate': f'T{i % N_TRUCKS:04d}', 'assigned_slot': i % 4, 'is_urgent': False,
+                     'is_groupage': False, 'pg': 0, 'ep': 0, 'pp': 0, 'is_notified': False,
+                     'notify_time': f'{8 + i % 10:02d}:00' if i % 5 == 0 else ''})
+    db.session.execute(Trip.__table__.insert(), rows)
+    db.session.execute(TruckFds.__table__.insert(), [
+        {'truck_plate': f'T{i:04d}', 'date': f'2025-{m:02d}-01', 'is_out_of_service': m % 2 == 0}
+        for i in range(N_TRUCKS) for m in range(1, 13)
+    ])
+    db.session.add(DailyNote(date=DAY, type='general', content='seed'))
+    db.session.add(DailyNote(date=OLD_DAY, type='general', content='seed'))
+    db.session.commit()
+    rebuild_truck_positions()
+    # Everything before 2024-07-01 goes to the archive tables
+    archive_old_rows(365, today=datetime.date(2025, 7, 1))
+
+
+def job(fn, *args):
+    """Scenario for work done outside a request: only its statements are checked."""
+    def call():
+        fn(*args)
+    return call
+
+
+def scenarios(client):
+    trip = db.session.execute(db.select(Trip.id, Trip.version).where(Trip.load_date == DAY)).first()
+    payload = {'id': trip.id, 'version': trip.version, 'type': 'departure', 'client': 'C1', 'origin': 'Murcia',
+               'destination': 'Sevilla', 'loadDate': DAY, 'unloadDate': DAY, 'assignedTruck': 'T0001'}
+    alerts = db.session.execute(db.select(Trip.id).where(Trip.load_date == DAY, Trip.notify_time != '')).scalars().all()
+    source = NotificationSource()
+    return [
+        ('initial-data (window)', lambda: client.get('/api/initial-data?from=2026-02-23&to=2026-03-08')),
+        ('changes', lambda: client.get('/api/changes?since=0')),
+        ('positions', lambda: client.get(f'/api/positions?date={DAY}')),
+        ('truck as-of', lambda: client.get(f'/api/trucks/T0002/as-of?date={DAY}')),
+        ('board (build)', lambda: client.get(f'/api/board?date={DAY}')),
+        ('board (cached)', lambda: client.get(f'/api/board?date={DAY}')),
+        ('day stats (build)', lambda: client.get(f'/api/stats/day?date={DAY}')),
+        ('day stats (cached)', lambda: client.get(f'/api/stats/day?date={DAY}')),
+        ('search (build)', lambda: client.get('/api/search?q=c1')),
+        ('search (trips)', lambda: client.get('/api/search?q=madri&trips=20')),
+        ('search (picked, next page)',
+         lambda: client.get(f'/api/search?kind=client&value=C1&trips=20&after=["{DAY}",{trip.id}]')),
+        ('export', lambda: client.get('/api/export?from=2026-02-01&to=2026-03-31&zone=SUR')),
+        ('notes GET', lambda: client.get(f'/api/notes?date={DAY}&type=general')),
+        ('notes POST', lambda: client.post('/api/notes', json={'date': DAY, 'type': 'general', 'content': 'x'})),
+        ('fds toggle', lambda: client.post('/api/fds', json={'plate': 'T0003', 'date': DAY})),
+        ('trip save', lambda: client.post('/api/trips', json=payload)),
+        ('search (catch-up)', lambda: client.get('/api/search?q=sevil&trips=20')),
+        ('notifier load', job(source.load)),
+        ('notifier changes', job(source.changes, 0)),
+        ('notifier claim', job(source.claim, alerts, datetime.datetime(2030, 1, 1))),
+        ('unassign-day', lambda: client.post('/api/unassign-day', json={'date': DAY})),
+        ('auto-assign', lambda: client.post(f'/api/auto-assign?date={DAY}')),
+        ('delete-truck', lambda: client.post('/api/delete-truck', json={'plate': 'T0004'})),
+        ('board (revalidate)', lambda: client.get(f'/api/board?date={DAY}')),
+        ('initial-data (archived window)', lambda: client.get('/api/initial-data?from=2024-02-26&to=2024-03-10')),
+        ('board (archived day)', lambda: client.get(f'/api/board?date={OLD_DAY}')),
+        ('day stats (archived day)', lambda: client.get(f'/api/stats/day?date={OLD_DAY}')),
+        ('export (archived)', lambda: client.get('/api/export?from=2024-02-01&to=2024-03-31')),
+        ('notes GET (archived)', lambda: client.get(f'/api/notes?date={OLD_DAY}&type=general')),
+        ('admin trips', lambda: client.get('/admin/trip/')),
+        ('admin trips (next page)', lambda: client.get(f'/admin/trip/?page=1&after=["{DAY}",{trip.id}]')),
+        ('admin trips (client)', lambda: client.get('/admin/trip/?flt0_7=C1')),
+        ('admin notes (next page)', lambda: client.get(f'/admin/dailynote/?page=1&after=["{DAY}","general"]')),
+    ]
+
+
+class StatementCapture:
+    def __init__(self):
+        self.statements = []
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        if not executemany and statement.lstrip().split(None, 1)[0].upper() in ('SELECT', 'UPDATE', 'DELETE'):
+            self.statements.append((statement, parameters))
+
+
+def full_scans(conn, statement, parameters):
+    """Returns (hot tables read with a full scan, plan text) for one statement."""
+    if conn.dialect.name == 'postgresql':
+        plan = [r[0] for r in conn.exec_driver_sql('EXPLAIN ' + statement, parameters)]
+        scans = [m.group(1) for line in plan for m in [re.search(r'Seq Scan on (\w+)', line)] if m]
+    else:
+        plan = [r[-1] for r in conn.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters)]
+        # "SCAN trip" is a table scan; "SCAN trip USING [COVERING] INDEX ..." walks an index
+        scans = [m.group(1) for line in plan for m in [re.match(r'SCAN (\w+)$', line)] if m]
+    return sorted(set(scans) & HOT_TABLES), '\n'.join(plan)
+
+
+def main():
+    app.config['TESTING'] = True
+    run_migrations()
+    failures = 0
+    with app.app_context():
+        if Trip.query.first():
+            print("ERROR: the database is not empty; point CHECK_DATABASE_URL at a throw-away database.")
+            return 2
+        seed()
+        client = app.test_client()
+        client.post('/login', data={'username': 'davidp', 'password': 'admin'})
+        explain_conn = db.engine.connect()
+        if explain_conn.dialect.name == 'postgresql':
+            explain_conn.execute(text('SET enable_seqscan = off'))
+        for name, call in scenarios(client):
+            capture = StatementCapture()
+            event.listen(db.engine, 'before_cursor_execute', capture)
+            try:
+                response = call()
+                if response is not None:
+                    response.get_data()  # run streamed bodies (export) inside the capture
+            finally:
+                event.remove(db.engine, 'before_cursor_execute', capture)
+            if response is not None and response.status_code >= 400:
+                print(f"FAIL  {name}: HTTP {response.status_code}")
+                failures += 1
+                continue
+            bad = []
+            for statement, parameters in capture.statements:
+                tables, plan = full_scans(explain_conn, statement, parameters)
+                if tables:
+                    bad.append((tables, statement, plan))
+            print(f"{'FAIL' if bad else 'ok':<6}{name}: {len(capture.statements)} statements")
+            for tables, statement, plan in bad:
+                failures += 1
+                print(f"      full scan of {', '.join(tables)} in:\n        {' '.join(statement.split())}")
+                print('        ' + plan.replace('\n', '\n        '))
+        explain_conn.close()
+    print(f"\n{failures} problem(s)." if failures else "\nNo full scans on hot tables.")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
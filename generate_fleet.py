@@ -0,0 +1,219 @@
+"""
+Synthetic fleet generator: fills the models with realistic data at any scale.
+
+Trucks (some created or deleted along the way), drivers and trailers, driver
+and trailer changes in truck_history, years of departure/return trips placed
+in the board slots, out-of-service periods, daily notes and the derived
+truck_position rows. The data runs from --years back up to --ahead days after
+today, so the board opens on populated days.
+
+    python generate_fleet.py --database sqlite:///fleet.db --trucks 300 --years 3
+    python generate_fleet.py --database postgresql://.../fleet --trucks 500 --years 5
+
+The target must be an EMPTY database (the schema is created with the
+migration runner). Never point it at the real database. The same --seed
+always produces the same data. bench_endpoints.py uses generate() directly.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+
+CITIES = [('Murcia', 'Murcia'), ('Cartagena', 'Murcia'), ('Lorca', 'Murcia'), ('Madrid', 'Madrid'),
+          ('Getafe', 'Madrid'), ('Alcalá de Henares', 'Madrid'), ('Valencia', 'Valencia'), ('Alicante', 'Valencia'),
+          ('Castellón', 'Valencia'), ('Sevilla', 'Andalucía'), ('Málaga', 'Andalucía'), ('Almería', 'Andalucía'),
+          ('Córdoba', 'Andalucía'), ('Barcelona', 'Barcelona'), ('Tarragona', 'Barcelona'), ('Bilbao', 'Norte'),
+          ('A Coruña', 'Norte'), ('Logroño', 'Norte'), ('Pamplona', 'Norte')]
+CLIENT_WORDS = (['Frutas', 'Hortalizas', 'Conservas', 'Cítricos', 'Transportes', 'Agrícola', 'Cooperativa', 'Cárnicas'],
+                ['Hernández', 'Núñez', 'del Segura', 'Mediterráneo', 'Peñíscola', 'Martínez', 'La Huerta', 'Ibérica'])
+FIRST_NAMES = ['José', 'Antonio', 'Manuel', 'Francisco', 'Juan', 'David', 'Javier', 'María', 'Carmen', 'Ángel']
+LAST_NAMES = ['García', 'Martínez', 'López', 'Sánchez', 'Pérez', 'Gómez', 'Ruiz', 'Muñoz', 'Jiménez', 'Ibáñez']
+NOTE_TYPES = ['Tasks', 'Incidents', 'General']
+TRAILER_TYPES = ['Frigo', 'Lona', 'Frigo bitemperatura', 'Plataforma']
+CHUNK = 5000
+
+
+def plate_for(n):
+    letters = 'BCDFGHJKLMNPRSTVWXYZ'
+    return f'{n % 10000:04d} {letters[n // 8000 % 20]}{letters[n // 400 % 20]}{letters[n // 20 % 20]}'
+
+
+def days_between(first, last):
+    d = first
+    while d <= last:
+        yield d
+        d += timedelta(days=1)
+
+
+def insert_chunks(db, table, rows):
+    """Bulk INSERTs rows (any iterable) CHUNK at a time. Returns the count."""
+    count, chunk = 0, []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == CHUNK:
+            db.session.execute(table.insert(), chunk)
+            count += len(chunk)
+            chunk = []
+    if chunk:
+        db.session.execute(table.insert(), chunk)
+        count += len(chunk)
+    return count
+
+
+def generate(trucks=300, years=3, ahead=60, trips_per_day=1.6, seed=1, today=None):
+    """Fills the (empty, migrated) database of the current app context. Returns row counts per table."""
+    from app import (db, Truck, TruckHistory, Driver, Trailer, Trip, TruckFds, DailyNote,
+                     rebuild_truck_positions)
+    rnd = random.Random(seed)
+    today = today or date.today()
+    first, last = today - timedelta(days=int(years * 365)), today + timedelta(days=ahead)
+    counts = {}
+
+    # Trucks: most exist from the start; some join or leave during the period
+    fleet = []
+    for n in range(trucks):
+        created = first - timedelta(days=rnd.randrange(30, 900))
+        if rnd.random() < 0.1:
+            created = first + timedelta(days=rnd.randrange((last - first).days))
+        deleted = None
+        if rnd.random() < 0.05:
+            deleted = created + timedelta(days=rnd.randrange(60, 1200))
+            deleted = deleted if deleted < last else None
+        home_city, home_zone = CITIES[n % len(CITIES)]
+        fleet.append({'plate': plate_for(n * 37 + 1000), 'created': created, 'deleted': deleted,
+                      'city': home_city, 'zone': home_zone})
+    drivers = [(f'{rnd.choice(FIRST_NAMES)} {rnd.choice(LAST_NAMES)} {rnd.choice(LAST_NAMES)}',
+                f'{rnd.randrange(10 ** 7, 10 ** 8)}{"TRWAGMYFPDXBNJZSQVHLCKE"[n % 23]}',
+                f'6{rnd.randrange(10 ** 7, 10 ** 8)}') for n in range(int(trucks * 1.15) + 1)]
+    trailers = [f'R-{plate_for(n * 53 + 5000)}' for n in range(trucks + trucks // 10 + 1)]
+
+    counts['driver'] = insert_chunks(db, Driver.__table__, (
+        {'name': name, 'dni': dni, 'phone': phone, 'alias': name.split()[0]} for name, dni, phone in drivers))
+    counts['trailer'] = insert_chunks(db, Trailer.__table__, (
+        {'plate': plate, 'type': rnd.choice(TRAILER_TYPES)} for plate in trailers))
+
+    def truck_rows():
+        for n, t in enumerate(fleet):
+            name, dni, phone = drivers[n]
+            yield {'plate': t['plate'], 'creation_date': t['created'].isoformat(),
+                   'deletion_date': t['deleted'].isoformat() if t['deleted'] else None,
+                   'location': t['city'], 'zones_str': t['zone'], 'manual_location': '', 'manual_zones_str': '',
+                   'history_str': '[]', 'trailer': trailers[n], 'driver_name': name, 'driver_phone': phone,
+                   'driver_dni': dni, 'driver_alias': name.split()[0]}
+    counts['truck'] = insert_chunks(db, Truck.__table__, truck_rows())
+
+    # Driver/trailer changes every few months, and the odd manual location for one day
+    def history_rows():
+        for t in fleet:
+            d = max(t['created'], first) + timedelta(days=rnd.randrange(20, 120))
+            seen = set()
+            while d <= min(t['deleted'] or last, last):
+                if d not in seen:
+                    seen.add(d)
+                    name, dni, phone = rnd.choice(drivers)
+                    manual = rnd.random() < 0.2
+                    yield {'truck_plate': t['plate'], 'date': d.isoformat(), 'trailer': rnd.choice(trailers),
+                           'driver_name': name, 'driver_phone': phone, 'driver_dni': dni,
+                           'driver_alias': name.split()[0],
+                           'manual_location': rnd.choice(CITIES)[0] if manual else '',
+                           'manual_zones_str': rnd.choice(CITIES)[1] if manual else ''}
+                d += timedelta(days=rnd.randrange(30, 150))
+    counts['truck_history'] = insert_chunks(db, TruckHistory.__table__, history_rows())
+
+    # Out of service: a few spells a year, each an "on" row and an "off" row
+    def fds_rows():
+        for t in fleet:
+            d = max(t['created'], first) + timedelta(days=rnd.randrange(10, 200))
+            while d < min(t['deleted'] or last, last):
+                back = d + timedelta(days=rnd.randrange(1, 15))
+                yield {'truck_plate': t['plate'], 'date': d.isoformat(), 'is_out_of_service': True}
+                yield {'truck_plate': t['plate'], 'date': back.isoformat(), 'is_out_of_service': False}
+                d = back + timedelta(days=rnd.randrange(40, 200))
+    counts['truck_fds'] = insert_chunks(db, TruckFds.__table__, fds_rows())
+
+    clients = [f'{a} {b}' for a in CLIENT_WORDS[0] for b in CLIENT_WORDS[1]]
+
+    def trip_rows():
+        for day in days_between(first, last):
+            weekday = day.weekday()
+            if weekday == 6:
+                continue
+            load = day.isoformat()
+            active = [t for t in fleet if t['created'] <= day and (not t['deleted'] or t['deleted'] > day)]
+            # Saturdays run at a third of the volume
+            volume = len(active) * trips_per_day * (0.33 if weekday == 5 else 1)
+            free_slots = {t['plate']: [0, 1, 2, 3] for t in active}
+            for _ in range(int(volume + rnd.random())):
+                kind = 'departure' if rnd.random() < 0.55 else 'return'
+                city, zone = rnd.choice(CITIES)
+                origin, destination = ('Murcia', city) if kind == 'departure' else (city, 'Murcia')
+                unload = day + timedelta(days=rnd.choice((0, 1, 1, 1, 2, 3)))
+                # Past days are almost fully planned; the further ahead, the more is pending
+                planned = rnd.random() < (0.95 if day <= today else 0.7 - 0.01 * (day - today).days)
+                truck = rnd.choice(active) if planned and active else None
+                slot = None
+                if truck:
+                    wanted = [s for s in free_slots[truck['plate']] if s % 2 == (kind == 'return')]
+                    if not wanted:
+                        truck = None
+                    else:
+                        slot = wanted[0]
+                        if rnd.random() < 0.8:  # the rest share the slot as groupage
+                            free_slots[truck['plate']].remove(slot)
+                groupage = rnd.random() < 0.15
+                yield {'type': kind, 'client': rnd.choice(clients), 'driver': '', 'origin': origin,
+                       'destination': destination,
+                       'destination_zone': zone if kind == 'departure' and rnd.random() < 0.3 else None,
+                       'load_date': load, 'unload_date': unload.isoformat(),
+                       'assigned_truck_plate': truck['plate'] if truck else None, 'assigned_slot': slot,
+                       'is_urgent': rnd.random() < 0.05, 'is_groupage': groupage,
+                       'pg': rnd.randrange(1, 12) if groupage else rnd.choice((0, 26, 33)),
+                       'ep': rnd.randrange(0, 8) if groupage else 0, 'pp': rnd.randrange(0, 4) if groupage else 0,
+                       'notify_time': f'{rnd.randrange(6, 20):02d}:{rnd.choice((0, 15, 30, 45)):02d}'
+                       if truck and rnd.random() < 0.3 else '',
+                       'is_notified': bool(truck) and day < today and rnd.random() < 0.8}
+    counts['trip'] = insert_chunks(db, Trip.__table__, trip_rows())
+
+    def note_rows():
+        for day in days_between(first, last):
+            for note_type in NOTE_TYPES:
+                if rnd.random() < 0.6:
+                    lines = [f'- {rnd.choice(clients)}: {rnd.choice(CITIES)[0]} {rnd.randrange(6, 20)}h'
+                             for _ in range(rnd.randrange(1, 8))]
+                    yield {'date': day.isoformat(), 'type': note_type, 'content': '\n'.join(lines)}
+    counts['daily_note'] = insert_chunks(db, DailyNote.__table__, note_rows())
+
+    db.session.commit()
+    counts['truck_position'] = rebuild_truck_positions()
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database', required=True, help='SQLAlchemy URL of an EMPTY database')
+    parser.add_argument('--trucks', type=int, default=300)
+    parser.add_argument('--years', type=float, default=3, help='history before today')
+    parser.add_argument('--ahead', type=int, default=60, help='days planned after today')
+    parser.add_argument('--trips-per-day', type=float, default=1.6, help='trips per active truck and weekday')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    os.environ['DATABASE_URL'] = args.database
+    from app import app, run_migrations, Trip, Truck
+    run_migrations()
+    with app.app_context():
+        if Trip.query.first() or Truck.query.first():
+            print("ERROR: the database is not empty.")
+            return 2
+        start = time.perf_counter()
+        counts = generate(args.trucks, args.years, args.ahead, args.trips_per_day, args.seed)
+    for table, count in counts.items():
+        print(f"{table:<16}{count:>10}")
+    print(f"Generado en {time.perf_counter() - start:.1f}s.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
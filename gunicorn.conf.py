@@ -0,0 +1,34 @@
+# Gunicorn picks this file up automatically from the working directory.
+import os
+import tempfile
+
+# Sizing. Every open board keeps one live stream (/api/stream) and each stream
+# holds a thread for as long as the tab stays open, so with W workers and T
+# threads at most W * SSE_MAX_STREAMS boards get live updates; the rest are
+# refused (503) and poll /api/changes every few seconds instead. The other
+# SSE_RESERVED_THREADS threads per worker stay free for logins and saves.
+# Defaults: 2 workers x 32 threads = 48 live boards, 16 threads for requests.
+# Raise GUNICORN_THREADS (threads are cheap: they mostly sleep) for more boards.
+worker_class = 'gthread'
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+threads = int(os.environ.get('GUNICORN_THREADS', 32))
+os.environ.setdefault('SSE_MAX_STREAMS',
+                      str(max(threads - int(os.environ.get('SSE_RESERVED_THREADS', 8)), 0)))
+
+
+def on_starting(server):
+    # Migrate once in the master, before any worker is forked, so no worker
+    # ever runs DDL or pays for schema checks on its first request.
+    # Workers add up their request metrics in one directory (see metrics.py)
+    os.environ.setdefault('METRICS_DIR', tempfile.mkdtemp(prefix='gestor-trafico-metrics-'))
+    from app import run_migrations, preload_assets, db, app, metrics
+    run_migrations()
+    # A fixed METRICS_DIR may still hold the previous master's worker files
+    metrics.clear()
+    # Read and compress the static bundles once; workers inherit them on fork
+    preload_assets()
+    with app.app_context():
+        # Workers are forked from this process and inherit the imported app,
+        # engine pool included: close the master's connections so no two
+        # processes ever share one socket
+        db.engine.dispose()
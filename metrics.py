@@ -0,0 +1,139 @@
+"""
+Métricas de peticiones en formato Prometheus.
+
+Each gunicorn worker counts its own requests in memory (histograms and
+counters keyed by label values). A scrape of /metrics lands on one worker
+only, so every worker also dumps its numbers to <directory>/<pid>.json, at
+most every flush_interval seconds, and render() adds up the files of all
+workers. Files of workers that have exited are kept, so totals never go
+backwards while the master lives. gunicorn.conf.py gives each master a fresh
+directory (or clears a fixed METRICS_DIR) before forking the workers.
+
+Nothing touches the disk until the first flush: CLI commands and scripts
+that import the app leave no directory behind. Without a directory one is
+made then, and removed when that process exits.
+"""
+import atexit
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class Metrics:
+    def __init__(self, directory, histograms, counters, flush_interval=5):
+        """histograms: {name: (help, buckets, label names)}; counters: {name: (help, label names)}.
+        directory: where the workers' files go; None for a temporary one (single process)."""
+        self.directory = directory
+        self.histograms = histograms
+        self.counters = counters
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._values = {}  # (name, label values) -> [bucket counts..., sum, count] or [total]
+        self._last_flush = 0
+        self._ready = False
+
+    def _ensure_directory(self):
+        if self._ready:
+            return
+        with self._lock:
+            if self.directory is None:
+                self.directory = tempfile.mkdtemp(prefix='gestor-trafico-metrics-')
+                atexit.register(shutil.rmtree, self.directory, ignore_errors=True)
+            else:
+                os.makedirs(self.directory, exist_ok=True)
+            self._ready = True
+
+    def observe(self, name, labels, value):
+        buckets = self.histograms[name][1]
+        with self._lock:
+            row = self._values.setdefault((name, labels), [0] * (len(buckets) + 2))
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    row[i] += 1
+            row[-2] += value
+            row[-1] += 1
+
+    def inc(self, name, labels, value=1):
+        with self._lock:
+            row = self._values.setdefault((name, labels), [0])
+            row[0] += value
+
+    def maybe_flush(self):
+        if time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        self._ensure_directory()
+        # pid at write time: workers are forked from the master after this object exists
+        path = os.path.join(self.directory, f'{os.getpid()}.json')
+        with self._lock:
+            self._last_flush = time.monotonic()
+            data = [[name, list(labels), row] for (name, labels), row in self._values.items()]
+        try:
+            with open(path + '.tmp', 'w') as f:
+                json.dump(data, f, separators=(',', ':'))
+            os.replace(path + '.tmp', path)
+        except OSError as e:
+            print(f"Error guardando métricas: {e}")
+
+    def clear(self):
+        """Drops every worker's file (master start)."""
+        if self.directory is None or not os.path.isdir(self.directory):
+            return
+        for name in os.listdir(self.directory):
+            if name.endswith('.json'):
+                os.unlink(os.path.join(self.directory, name))
+
+    def collect(self):
+        """Values of all workers added up: {(name, label values): row}."""
+        self.flush()
+        total = {}
+        for filename in os.listdir(self.directory):
+            if not filename.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.directory, filename)) as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue  # being replaced right now, or a worker died mid-write
+            for name, labels, row in data:
+                if name not in self.histograms and name not in self.counters:
+                    continue  # metric dropped since that file was written
+                key = (name, tuple(labels))
+                if key in total and len(total[key]) == len(row):
+                    total[key] = [a + b for a, b in zip(total[key], row)]
+                else:
+                    total[key] = row
+        return total
+
+    def render(self):
+        """The Prometheus text exposition format (version 0.0.4)."""
+        values = self.collect()
+        lines = []
+        for name, (help_text, buckets, label_names) in self.histograms.items():
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+            for (metric, labels), row in sorted(values.items()):
+                if metric != name:
+                    continue
+                base = label_pairs(label_names, labels)
+                for bound, count in zip(buckets, row):
+                    lines.append(f'{name}_bucket{{{base}{"," if base else ""}le="{bound}"}} {count}')
+                lines.append(f'{name}_bucket{{{base}{"," if base else ""}le="+Inf"}} {row[-1]}')
+                lines.append(f'{name}_sum{{{base}}} {round(row[-2], 6)}')
+                lines.append(f'{name}_count{{{base}}} {row[-1]}')
+        for name, (help_text, label_names) in self.counters.items():
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+            for (metric, labels), row in sorted(values.items()):
+                if metric == name:
+                    lines.append(f'{name}{{{label_pairs(label_names, labels)}}} {row[0]}')
+        return '\n'.join(lines) + '\n'
+
+
+def label_pairs(names, values):
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for v in values)
+    return ','.join(f'{n}="{v}"' for n, v in zip(names, escaped))
@@ -0,0 +1,282 @@
+"""
+Migraciones versionadas del esquema.
+
+Runs once per deploy/startup, never inside a request:
+  - gunicorn: on_starting hook in gunicorn.conf.py (master process, before forking workers)
+  - by hand:  flask --app app migrate   (or python fix_db.py)
+  - dev:      python app.py
+
+Applied versions are recorded in the schema_version table. Every step is
+written to be safe on databases that the old per-request hook, fix_db.py or
+/update_db_schema already touched (columns/indexes are checked before being
+added), so the first run on an existing database simply records them.
+
+To change the schema append a new (version, name, function) to MIGRATIONS;
+never edit or reorder one that has shipped.
+"""
+from datetime import datetime
+
+from sqlalchemy import text
+
+# Arbitrary key for pg_advisory_lock so two instances never migrate at once
+PG_LOCK_KEY = 727001
+
+
+def _is_postgres(db):
+    return db.engine.url.get_backend_name() == 'postgresql'
+
+
+def add_column(db, table, column, ddl):
+    """ALTER TABLE ... ADD COLUMN unless the column is already there. Returns True if added."""
+    existing = [c['name'] for c in db.inspect(db.engine).get_columns(table)]
+    if column in existing:
+        return False
+    db.session.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+    return True
+
+
+# --- MIGRACIONES ---
+
+def m001_create_tables(db):
+    # Creates every table the models declare that does not exist yet
+    db.create_all()
+
+
+def m002_legacy_columns(db):
+    # Columns the old before_request hook used to add one by one
+    is_postgres = _is_postgres(db)
+    false = 'FALSE' if is_postgres else '0'
+    truck_columns = [
+        ('manual_location', "VARCHAR(100) DEFAULT ''"),
+        ('is_zone_manual', f"BOOLEAN DEFAULT {false}"),
+        ('zones_last_updated', "VARCHAR(20) DEFAULT '2000-01-01'"),
+        ('manual_zones_str', "VARCHAR(200) DEFAULT ''"),
+        ('trailer', "VARCHAR(50) DEFAULT ''"),
+        ('driver_name', "VARCHAR(100) DEFAULT ''"),
+        ('driver_phone', "VARCHAR(20) DEFAULT ''"),
+        ('driver_dni', "VARCHAR(20) DEFAULT ''"),
+        ('driver_alias', "VARCHAR(50) DEFAULT ''"),
+        ('history_str', "TEXT DEFAULT '[]'"),
+    ]
+    for column, ddl in truck_columns:
+        add_column(db, 'truck', column, ddl)
+    add_column(db, 'trip', 'destination_zone', 'VARCHAR(50)')
+
+
+def m003_version_columns(db):
+    add_column(db, 'truck', 'version', 'INTEGER NOT NULL DEFAULT 1')
+    add_column(db, 'trip', 'version', 'INTEGER NOT NULL DEFAULT 1')
+
+
+def m004_truck_history_from_json(db):
+    from app import migrate_truck_history_json
+    migrated = migrate_truck_history_json()
+    if migrated:
+        print(f"Historial de {migrated} camiones migrado a truck_history.")
+
+
+def m005_truck_positions(db):
+    from app import Trip, TruckPosition, rebuild_truck_positions
+    if not TruckPosition.query.first() and Trip.query.filter(Trip.assigned_truck_plate != None).first():
+        print(f"Calculando posiciones de camiones: {rebuild_truck_positions()} filas.")
+
+
+def m006_sync_revision(db):
+    from app import SyncRevision
+    if not db.session.get(SyncRevision, 1):
+        db.session.add(SyncRevision(id=1, rev=0))
+
+
+def m007_default_admin(db):
+    from app import User
+    if not User.query.filter_by(username='davidp').first():
+        u = User(username='davidp', is_admin=True)
+        u.set_password('admin')
+        db.session.add(u)
+        print("Admin 'davidp' creado.")
+
+
+def m008_hot_filter_indexes(db):
+    # Indexes declared on the models (Trip, TruckFds, TruckPosition) that older
+    # databases lack; see check_query_plans.py
+    from app import Trip, TruckFds, TruckPosition
+    conn = db.session.connection()
+    for model in (Trip, TruckFds, TruckPosition):
+        for index in model.__table__.indexes:
+            index.create(conn, checkfirst=True)
+
+
+def m009_note_version(db):
+    add_column(db, 'daily_note', 'version', 'INTEGER NOT NULL DEFAULT 1')
+
+
+def m010_board_snapshot(db):
+    # Day ranges on change_log for the cached boards; rows logged before this
+    # stay open-ended, which only means a rebuild
+    from app import BoardSnapshot
+    add_column(db, 'change_log', 'touch_from', 'VARCHAR(20)')
+    add_column(db, 'change_log', 'touch_to', 'VARCHAR(20)')
+    BoardSnapshot.__table__.create(db.session.connection(), checkfirst=True)
+
+
+def m011_trip_client_index(db):
+    # Client filter of the admin trip list, in its default (load date) order
+    from app import Trip
+    index = next(i for i in Trip.__table__.indexes if i.name == 'ix_trip_client_load')
+    index.create(db.session.connection(), checkfirst=True)
+
+
+def m012_archive_tables(db):
+    from app import TRIP_ARCHIVE, FDS_ARCHIVE, NOTE_ARCHIVE
+    for table in (TRIP_ARCHIVE, FDS_ARCHIVE, NOTE_ARCHIVE):
+        table.create(db.session.connection(), checkfirst=True)
+
+
+def m013_day_stats(db):
+    from app import DayStats
+    DayStats.__table__.create(db.session.connection(), checkfirst=True)
+
+
+def m014_trip_search_indexes(db):
+    # /api/search: distinct origins/destinations/drivers and their trips by load date
+    from app import Trip
+    for index in Trip.__table__.indexes:
+        if index.name in ('ix_trip_origin_load', 'ix_trip_destination_load', 'ix_trip_driver_load'):
+            index.create(db.session.connection(), checkfirst=True)
+
+
+def m015_trip_notify_index(db):
+    # Notification scheduler: pending alerts only (partial index), by load day
+    from app import Trip
+    index = next(i for i in Trip.__table__.indexes if i.name == 'ix_trip_notify_pending')
+    index.create(db.session.connection(), checkfirst=True)
+
+
+def m016_day_stats_rounding(db):
+    # Payloads cached before CR was rounded per trip (as the board does); they
+    # are rebuilt on the next request
+    db.session.execute(text("DELETE FROM day_stats"))
+
+
+def m017_sqlite_autoincrement(db):
+    # A plain INTEGER PRIMARY KEY hands out max(id) + 1, so once the archive
+    # moved the newest row its id came back for the next insert, and archiving
+    # that one failed on the archive's primary key. AUTOINCREMENT tables never
+    # go back; their sequence starts above the archive too. PostgreSQL
+    # sequences never reuse ids.
+    if _is_postgres(db):
+        return
+    from app import Trip, TruckFds, DailyNote, TRIP_ARCHIVE, FDS_ARCHIVE, NOTE_ARCHIVE, record_changes
+    conn = db.session.connection()
+    for model, archive in ((Trip, TRIP_ARCHIVE), (TruckFds, FDS_ARCHIVE), (DailyNote, NOTE_ARCHIVE)):
+        table = model.__table__
+        name = table.name
+        ddl = conn.execute(text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :n"), {'n': name}).scalar()
+        if 'AUTOINCREMENT' not in ddl.upper():
+            # SQLite cannot alter a primary key: rebuild the table from the model
+            existing = [r[1] for r in conn.exec_driver_sql(f"PRAGMA table_info({name})")]
+            extra = set(existing) - set(table.c.keys())
+            if extra:
+                raise RuntimeError(f"{name} has columns the model lacks ({', '.join(sorted(extra))}); not rebuilt")
+            conn.exec_driver_sql(f"ALTER TABLE {name} RENAME TO {name}_old")
+            for index in table.indexes:
+                conn.exec_driver_sql(f"DROP INDEX IF EXISTS {index.name}")
+            table.create(conn)
+            columns = ', '.join(c for c in table.c.keys() if c in existing)
+            conn.exec_driver_sql(f"INSERT INTO {name} ({columns}) SELECT {columns} FROM {name}_old")
+            conn.exec_driver_sql(f"DROP TABLE {name}_old")
+        # Rows that already got the id of an archived one take a new id
+        top = max(conn.execute(text(f"SELECT coalesce(max(id), 0) FROM {t}")).scalar() for t in (name, archive.name))
+        clashes = conn.execute(text(f"SELECT id, {'load_date' if model is Trip else 'NULL'} FROM {name} "
+                                    f"WHERE id IN (SELECT id FROM {archive.name}) ORDER BY id")).all()
+        changes = []
+        for old_id, load_date in clashes:
+            top += 1
+            conn.execute(text(f"UPDATE {name} SET id = :new WHERE id = :old"), {'new': top, 'old': old_id})
+            if model is Trip:
+                conn.execute(text("UPDATE truck_position SET trip_id = :new WHERE trip_id = :old"),
+                             {'new': top, 'old': old_id})
+                changes += [('trips', str(old_id), 'delete', load_date, load_date),
+                            ('trips', str(top), 'upsert', load_date, load_date)]
+        if clashes:
+            print(f"  {name}: {len(clashes)} filas con id ya archivado renumeradas")
+        record_changes(db.session, changes)
+        conn.execute(text("DELETE FROM sqlite_sequence WHERE name = :n"), {'n': name})
+        conn.execute(text("INSERT INTO sqlite_sequence (name, seq) VALUES (:n, :top)"), {'n': name, 'top': top})
+
+
+MIGRATIONS = [
+    (1, 'create tables', m001_create_tables),
+    (2, 'legacy truck/trip columns', m002_legacy_columns),
+    (3, 'optimistic-concurrency version columns', m003_version_columns),
+    (4, 'truck history JSON -> truck_history', m004_truck_history_from_json),
+    (5, 'truck_position backfill', m005_truck_positions),
+    (6, 'sync revision counter', m006_sync_revision),
+    (7, 'default admin user', m007_default_admin),
+    (8, 'hot filter indexes', m008_hot_filter_indexes),
+    (9, 'daily note version (ETag)', m009_note_version),
+    (10, 'board snapshots', m010_board_snapshot),
+    (11, 'trip client index (admin filter)', m011_trip_client_index),
+    (12, 'archive tables', m012_archive_tables),
+    (13, 'day stats cache', m013_day_stats),
+    (14, 'trip search indexes', m014_trip_search_indexes),
+    (15, 'trip pending-notification index', m015_trip_notify_index),
+    (16, 'day stats: per-trip CR rounding', m016_day_stats_rounding),
+    (17, 'sqlite autoincrement ids (archive)', m017_sqlite_autoincrement),
+]
+
+
+# --- RUNNER ---
+
+def _ensure_version_table(db):
+    db.session.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_version ("
+        "version INTEGER PRIMARY KEY, name VARCHAR(200) NOT NULL, applied_at VARCHAR(30) NOT NULL)"
+    ))
+    db.session.commit()
+
+
+def current_version(db):
+    _ensure_version_table(db)
+    return db.session.execute(text("SELECT MAX(version) FROM schema_version")).scalar() or 0
+
+
+def upgrade(db):
+    """Applies pending migrations in order. Must run inside an app context.
+
+    Returns the list of (version, name) applied. Each migration commits on
+    its own together with its schema_version row, so a failure leaves the
+    database at the last good version and the next run resumes from there.
+    """
+    lock_conn = None
+    if _is_postgres(db):
+        lock_conn = db.engine.connect()
+        lock_conn.execute(text("SELECT pg_advisory_lock(:k)"), {'k': PG_LOCK_KEY})
+    try:
+        _ensure_version_table(db)
+        done = set(db.session.execute(text("SELECT version FROM schema_version")).scalars())
+        # End the read transaction: some steps write through other connections
+        # (create_all, inspector), and in SQLite WAL mode a session still holding
+        # an older snapshot could then not write at all ("database is locked").
+        db.session.commit()
+        applied = []
+        for version, name, fn in MIGRATIONS:
+            if version in done:
+                continue
+            print(f"Migración {version}: {name}...")
+            try:
+                fn(db)
+                db.session.execute(
+                    text("INSERT INTO schema_version (version, name, applied_at) VALUES (:v, :n, :t)"),
+                    {'v': version, 'n': name, 't': datetime.utcnow().isoformat(timespec='seconds')}
+                )
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+            applied.append((version, name))
+        return applied
+    finally:
+        if lock_conn is not None:
+            lock_conn.execute(text("SELECT pg_advisory_unlock(:k)"), {'k': PG_LOCK_KEY})
+            lock_conn.close()
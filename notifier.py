@@ -0,0 +1,143 @@
+"""
+Avisos programados: sends the Trip.notify_time alerts with nobody watching the board.
+
+NotificationScheduler keeps a heap of (due time, trip id) for the alerts of
+the next day or so. A tick only looks at the top of the heap and at the sync
+revision (one row): the database is read again when trips were written
+(those trips only) or when something is due. The source (app.py) does the
+database side:
+
+  load()            -> (revision, [(due, id)]) from an indexed query over the
+                       pending alerts; also every reload_interval, which
+                       slides the window and drops what was cancelled;
+  changes(revision) -> (revision, [(due, id)]) of the trips written since,
+                       or None when it is cheaper to load() again;
+  claim(ids, now)   -> the notification dicts of those trips that are still
+                       pending and due, marked notified in the same commit.
+
+Heap entries can go stale (time moved, trip unassigned or already marked by
+hand); claim() checks each one again, so a stale entry is simply dropped and
+a moved one fires from its new entry. Claiming before sending makes two
+schedulers (one per web worker) never send the same alert twice.
+
+Times are naive wall-clock datetimes: the board's 'HH:MM' on the load day,
+compared with clock() (the app passes the time in its NOTIFY_TZ, whatever
+the server's own timezone is).
+
+Sinks are callables taking a list of notification dicts. A failing sink is
+logged and the others still run; the trips stay marked, nothing is retried.
+"""
+import contextlib
+import heapq
+import json
+import threading
+import time
+import urllib.request
+from datetime import datetime
+
+
+class NotificationScheduler:
+    def __init__(self, source, sinks, reload_interval=600, max_sleep=30, batch_size=200, clock=datetime.now):
+        self.source = source
+        self.clock = clock
+        self.sinks = sinks
+        self.reload_interval = reload_interval
+        self.max_sleep = max_sleep
+        self.batch_size = batch_size
+        self._heap = []
+        self._revision = None
+        self._loaded_at = 0
+
+    def __len__(self):
+        return len(self._heap)
+
+    def _load(self):
+        self._revision, entries = self.source.load()
+        self._heap = list(entries)
+        heapq.heapify(self._heap)
+        self._loaded_at = time.monotonic()
+
+    def _catch_up(self):
+        if self._revision is None or time.monotonic() - self._loaded_at >= self.reload_interval:
+            self._load()
+            return
+        changed = self.source.changes(self._revision)
+        if changed is None:
+            self._load()
+            return
+        self._revision, entries = changed
+        for entry in entries:
+            heapq.heappush(self._heap, entry)
+
+    def tick(self, now=None):
+        """Catches up with the database, then claims and sends what is due. Returns what was sent."""
+        now = now or self.clock()
+        self._catch_up()
+        sent = []
+        while self._heap and self._heap[0][0] <= now:
+            ids = set()
+            while self._heap and self._heap[0][0] <= now and len(ids) < self.batch_size:
+                ids.add(heapq.heappop(self._heap)[1])
+            notifications = self.source.claim(sorted(ids), now)
+            if notifications:
+                self.send(notifications)
+                sent += notifications
+        return sent
+
+    def send(self, notifications):
+        for sink in self.sinks:
+            try:
+                sink(notifications)
+            except Exception as e:
+                print(f"Error enviando {len(notifications)} avisos a {getattr(sink, '__name__', sink)}: {e}")
+
+    def wait_time(self, now=None):
+        """Seconds until the next due alert, at most max_sleep (writes may add earlier ones)."""
+        if not self._heap:
+            return self.max_sleep
+        due = (self._heap[0][0] - (now or self.clock())).total_seconds()
+        return min(max(due, 0), self.max_sleep)
+
+    def run(self, stop=None, context=contextlib.nullcontext):
+        """Ticks until `stop` (a threading.Event) is set. Each tick runs inside
+        context() (the app passes its app context: a fresh session per tick)."""
+        stop = stop or threading.Event()
+        while not stop.is_set():
+            try:
+                with context():
+                    self.tick()
+                wait = self.wait_time()
+            except Exception as e:  # database away for a moment: try again later
+                print(f"Error en el programador de avisos: {e}")
+                # What was popped may not have been claimed: start over from load()
+                self._revision = None
+                wait = self.max_sleep
+            stop.wait(wait)
+
+
+# --- SINKS ---
+
+def log_sink(notifications):
+    for n in notifications:
+        print(f"AVISO {n['loadDate']} {n['notifyTime']} · {n['plate']} · {n['client']} "
+              f"({n['origin']} -> {n['destination']})")
+
+
+class WebhookSink:
+    """POSTs each batch as JSON ({"notifications": [...]}) to url. Without a url
+    it is a stub that only logs what it would have sent."""
+
+    def __init__(self, url, timeout=5):
+        self.url = url
+        self.timeout = timeout
+        self.__name__ = 'webhook'
+
+    def __call__(self, notifications):
+        if not self.url:
+            print(f"Webhook sin URL: {len(notifications)} avisos sin enviar")
+            return
+        body = json.dumps({'notifications': notifications}).encode()
+        request = urllib.request.Request(self.url, data=body, method='POST',
+                                         headers={'Content-Type': 'application/json'})
+        with urllib.request.urlopen(request, timeout=self.timeout) as r:
+            r.read()
@@ -0,0 +1,144 @@
+"""
+Índice de búsqueda en memoria para /api/search.
+
+Holds the distinct short values people type in the trip modal (clients,
+locations, drivers, plates), each with how many trips use it, and answers
+"what matches what I typed so far" without touching the database:
+
+  - 1 or 2 characters: word prefixes, from a prefix -> terms map;
+  - 3 or more: the terms holding all the query's trigrams, checked as
+    substrings; from 4 characters, if those are few, terms sharing enough
+    trigrams with it (typos, a swapped or missing letter) follow.
+
+Matches rank exact value, value prefix, word prefix, substring, similar,
+then by trip count. Text is compared lowercased and without accents.
+
+Every gunicorn worker keeps its own index; the app rebuilds it from the
+database and adds new values between rebuilds (see search_index_fresh in
+app.py). The structures are only touched under the index lock, so the
+threads of one worker can search while another adds.
+"""
+import threading
+import unicodedata
+
+SIMILARITY = 0.6  # share of the query's trigrams a "similar" term must have
+
+
+def normalize(text):
+    """Lowercase, no accents, single spaces: 'Cítricos  Núñez' -> 'citricos nunez'."""
+    decomposed = unicodedata.normalize('NFKD', text or '')
+    return ' '.join(''.join(c for c in decomposed if not unicodedata.combining(c)).lower().split())
+
+
+def trigrams(norm):
+    """Trigrams of a normalized text padded with one space: word starts/ends count too."""
+    padded = f' {norm} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class SearchIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.revision = None   # sync revision the index holds; None = never built
+        self.built_at = 0      # time.monotonic() of the last full build
+        self._clear()
+
+    def _clear(self):
+        self._terms = []       # term id -> [kind, value, normalized, count]
+        self._ids = {}         # (kind, value) -> term id
+        self._grams = {}       # trigram -> set of term ids
+        self._prefixes = {}    # 1-2 character word prefix -> set of term ids
+
+    def _add(self, kind, value, count):
+        value = (value or '').strip()
+        norm = normalize(value)
+        if not norm:
+            return
+        term = self._ids.get((kind, value))
+        if term is not None:
+            self._terms[term][3] += count
+            return
+        term = self._ids[(kind, value)] = len(self._terms)
+        self._terms.append([kind, value, norm, count])
+        for gram in trigrams(norm):
+            self._grams.setdefault(gram, set()).add(term)
+        for word in norm.split():
+            for size in (1, 2):
+                self._prefixes.setdefault(word[:size], set()).add(term)
+
+    def rebuild(self, counts, revision, built_at):
+        """Replaces everything with counts: iterable of (kind, value, trip count)."""
+        with self._lock:
+            self._clear()
+            for kind, value, count in counts:
+                self._add(kind, value, count)
+            self.revision = revision
+            self.built_at = built_at
+
+    def touch(self, values, revision):
+        """Adds the (kind, value) pairs not indexed yet, with a count of 1. Counts
+        of known values and values no longer used wait for the next rebuild."""
+        with self._lock:
+            for kind, value in values:
+                if (kind, (value or '').strip()) not in self._ids:
+                    self._add(kind, value, 1)
+            self.revision = revision
+
+    def __len__(self):
+        return len(self._terms)
+
+    def search(self, query, kinds=None, limit=10):
+        """[(kind, value, count)] best first, for the text typed so far."""
+        q = normalize(query)
+        if not q:
+            return []
+        with self._lock:
+            if len(q) < 3:
+                candidates = self._prefixes.get(q, ())
+            else:
+                # Trigrams any text containing q has, wherever q falls in it: no padding
+                postings = sorted((self._grams.get(q[i:i + 3], set()) for i in range(len(q) - 2)), key=len)
+                candidates = set.intersection(*postings)
+            ranked = []
+            for term in candidates:
+                kind, value, norm, count = self._terms[term]
+                if kinds and kind not in kinds:
+                    continue
+                tier = self._tier(q, norm)
+                if tier is not None:
+                    ranked.append((tier, 0, -count, norm, term))
+            # Three letters share too few trigrams with anything to judge a typo
+            if len(q) > 3 and len(ranked) < limit:
+                ranked += self._similar(q, kinds, {r[-1] for r in ranked})
+            ranked.sort()
+            return [tuple(self._terms[r[-1]][i] for i in (0, 1, 3)) for r in ranked[:limit]]
+
+    @staticmethod
+    def _tier(q, norm):
+        if norm == q:
+            return 0
+        if norm.startswith(q):
+            return 1
+        if f' {q}' in f' {norm}':
+            return 2
+        if q in norm:
+            return 3
+        return None
+
+    def _similar(self, q, kinds, seen):
+        grams = trigrams(q)
+        # q is what was typed so far: its trailing pad would penalize every longer word
+        grams.discard(q[-2:] + ' ')
+        shared = {}
+        for gram in grams:
+            for term in self._grams.get(gram, ()):
+                shared[term] = shared.get(term, 0) + 1
+        similar = []
+        for term, common in shared.items():
+            kind, value, norm, count = self._terms[term]
+            if term in seen or (kinds and kind not in kinds):
+                continue
+            score = common / len(grams)
+            if score >= SIMILARITY:
+                similar.append((4, -score, -count, norm, term))
+        return similar
@@ -0,0 +1,170 @@
+"""
+Stress test: concurrent writers against the real endpoints, like gunicorn does.
+
+Forks --workers processes with --threads threads each (gunicorn gthread
+layout). Every thread logs in and loops over the write endpoints: create a
+trip, move it to another truck (versioned), toggle FDS, save a day note and
+occasionally unassign a whole day. Uses a throw-away SQLite database unless
+STRESS_DATABASE_URL points at an EMPTY PostgreSQL database.
+
+    python stress_concurrent_writes.py --workers 4 --threads 8 --ops 50
+
+The engine profile comes from the environment, so both can be compared:
+
+    SQLITE_JOURNAL_MODE=DELETE SQLITE_SYNCHRONOUS=FULL python stress_concurrent_writes.py
+
+Exits 1 if any request failed with a 5xx (e.g. "database is locked") or if
+the sync revisions / change_log ended up with gaps. 409 conflicts are
+expected when two threads move the same trip and are only counted.
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+_tmp = tempfile.mkdtemp()
+os.environ['DATABASE_URL'] = os.environ.get('STRESS_DATABASE_URL') or 'sqlite:///' + os.path.join(_tmp, 'stress.db')
+os.environ['EVENTS_SPOOL'] = os.path.join(_tmp, 'events.log')
+
+from sqlalchemy import func
+
+from app import app, db, run_migrations, Truck, Trip, SyncRevision, ChangeLog
+
+N_TRUCKS = 20
+DAYS = [f'2026-03-{d:02d}' for d in range(1, 15)]
+
+
+def seed():
+    db.session.execute(Truck.__table__.insert(), [
+        {'plate': f'S{i:03d}', 'creation_date': '2020-01-01', 'location': '', 'zones_str': '',
+         'manual_location': '', 'manual_zones_str': '', 'history_str': '[]'}
+        for i in range(N_TRUCKS)
+    ])
+    db.session.commit()
+
+
+def writer(ops, seed_value, stats, errors, latencies):
+    rnd = random.Random(seed_value)
+    client = app.test_client()
+    mine = []
+
+    def call(kind, method, url, payload=None, **kwargs):
+        start = time.perf_counter()
+        try:
+            r = getattr(client, method)(url, json=payload, **kwargs)
+            status = r.status_code
+            body = r.get_json(silent=True) if status >= 400 else None
+        except Exception as e:  # The app re-raised instead of answering
+            status, body = 599, {'error': repr(e)}
+        latencies.append((kind, time.perf_counter() - start))
+        stats[(kind, status)] += 1
+        if status >= 500:
+            errors.append(f"{kind}: {status} {str(body)[:160]}")
+        return r if status == 200 else None
+
+    call('login', 'post', '/login', data={'username': 'davidp', 'password': 'admin'})
+    for _ in range(ops):
+        day = rnd.choice(DAYS)
+        plate = f'S{rnd.randrange(N_TRUCKS):03d}'
+        roll = rnd.random()
+        if roll < 0.35 or not mine:
+            r = call('trip create', 'post', '/api/trips', {
+                'type': 'departure', 'client': 'Stress', 'origin': 'Murcia', 'destination': 'Madrid',
+                'loadDate': day, 'unloadDate': day, 'assignedTruck': plate, 'assignedSlot': rnd.randrange(4)})
+            if r:
+                mine.append(r.get_json())
+        elif roll < 0.65:
+            t = rnd.choice(mine)
+            r = call('trip move', 'post', '/api/trips', dict(t, assignedTruck=plate))
+            if r:
+                mine[mine.index(t)] = r.get_json()
+            else:
+                mine.remove(t)  # stale copy (409) or gone: stop touching it
+        elif roll < 0.8:
+            call('fds toggle', 'post', '/api/fds', {'plate': plate, 'date': day, 'is_out_of_service': rnd.random() < 0.5})
+        elif roll < 0.97:
+            call('note save', 'post', '/api/notes', {'date': day, 'type': 'general', 'content': f'nota {rnd.random()}'})
+        else:
+            call('unassign-day', 'post', '/api/unassign-day', {'date': day})
+
+
+def worker_process(index, threads, ops, queue):
+    stats, errors, latencies = Counter(), [], []
+    pool = [threading.Thread(target=writer, args=(ops, index * 1000 + n, stats, errors, latencies))
+            for n in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    queue.put((stats, errors, latencies))
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))] * 1000 if values else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--ops', type=int, default=50, help='requests per thread')
+    args = parser.parse_args()
+
+    run_migrations()
+    with app.app_context():
+        if Trip.query.first() or Truck.query.first():
+            print("ERROR: the database is not empty; point STRESS_DATABASE_URL at a throw-away database.")
+            return 2
+        seed()
+        # Like gunicorn.conf.py: no pooled connections may cross the fork
+        db.engine.dispose()
+        print(f"engine: {db.engine.url.get_backend_name()} {app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or ''}")
+
+    ctx = multiprocessing.get_context('fork')
+    queue = ctx.Queue()
+    start = time.perf_counter()
+    procs = [ctx.Process(target=worker_process, args=(i, args.threads, args.ops, queue)) for i in range(args.workers)]
+    for p in procs:
+        p.start()
+    stats, errors, latencies = Counter(), [], []
+    for _ in procs:
+        s, e, l = queue.get()
+        stats.update(s)
+        errors += e
+        latencies += l
+    for p in procs:
+        p.join()
+    elapsed = time.perf_counter() - start
+
+    print(f"\n{'operation':<14}{'status':>7}{'count':>8}{'p50 ms':>9}{'p95 ms':>9}{'max ms':>9}")
+    for (kind, status), count in sorted(stats.items()):
+        times = [t for k, t in latencies if k == kind]
+        print(f"{kind:<14}{status:>7}{count:>8}{percentile(times, 0.5):>9.0f}{percentile(times, 0.95):>9.0f}"
+              f"{percentile(times, 1):>9.0f}")
+    total = sum(stats.values())
+    failed = sum(c for (_, status), c in stats.items() if status >= 500)
+    # Logins are dominated by password hashing, not by the database
+    times = [t for k, t in latencies if k != 'login']
+    print(f"\n{total} requests in {elapsed:.1f}s ({total / elapsed:.0f} req/s); writes p50 {percentile(times, 0.5):.0f} ms, "
+          f"p95 {percentile(times, 0.95):.0f} ms, p99 {percentile(times, 0.99):.0f} ms")
+    for line in Counter(errors).most_common(5):
+        print(f"   {line[1]}x {line[0]}")
+
+    with app.app_context():
+        revision = db.session.get(SyncRevision, 1).rev
+        used = db.session.query(func.count(func.distinct(ChangeLog.rev)), func.max(ChangeLog.rev)).one()
+    gaps = used != (revision, revision)
+    print(f"sync revision {revision}, change_log revisions used {used[0]} (max {used[1]})"
+          f"{' -- MISMATCH' if gaps else ''}")
+    print(f"{failed} failed request(s).")
+    return 1 if failed or gaps else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())